@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""Motor de Agregação"""
+
+"""Este ficheiro calcula, numa única passagem pelas reviews, todos os acumuladores (por utilizador, por produto e por
+timestamp) de que as análises do menu precisam. Depois de agregados os dados, cada opção do menu é respondida a partir
+dos acumuladores, sem voltar a percorrer as reviews.
+
+Os acumuladores são somas e contagens, por isso podem ser atualizados com novos lotes de reviews (atualizar), juntados
+(juntar) e guardados entre execuções (guardar / Agregados.carregar). Exemplo de atualização diária, em O(novas reviews):
+    agregados = Agregados.carregar("agregados.json")
+    agregados.atualizar(carregar_dados("reviews_de_hoje.csv"))
+    agregados.guardar("agregados.json")
+
+Com agregar_paralelo a passagem é feita em map-reduce: as linhas são divididas em partições, cada processo agrega a
+sua partição lendo as colunas diretamente da cache binária (sem as receber do processo principal) e os acumuladores
+parciais são juntados no fim (juntar)."""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from data_loader import carregar_dados
+from dataset_cache import cache_valida, ler_fatia, ler_valores
+from instrumentation import contar_linhas, medir
+from ranking import top_k
+from result_cache import memorizado
+from review_table import ReviewTable, iterar_campos
+from temporal_analysis import TimeIndex, _to_timestamp_bound
+from weighted_scoring import scores_ponderados
+
+# Posições dos valores nas listas de acumuladores por utilizador
+U_REVIEWS, U_SOMA_SCORES, U_VOTOS_UTEIS, U_SOMA_PALAVRAS, U_REVIEWS_COM_TEXTO = range(5)
+# Posições dos valores nas listas de acumuladores por produto
+P_REVIEWS, P_SOMA_SCORES, P_SCORES_5, P_SOMA_PONDERADA, P_VOTOS_UTEIS = range(5)
+# Posições dos valores nas listas de acumuladores por timestamp
+T_REVIEWS, T_SOMA_SCORES = range(2)
+
+# Incrementar sempre que o formato dos acumuladores guardados mudar
+VERSAO_AGREGADOS = 1
+# Colunas da ReviewTable lidas pelo motor (as restantes, como o Text e o Summary, não precisam de ser carregadas)
+COLUNAS_NECESSARIAS = ("UserId", "ProductId", "Score", "HelpfulnessNumerator", "Time", "WordCount")
+
+
+class Agregados:
+    """Acumuladores de todas as análises, preenchidos pela função agregar() (ou pelo método atualizar()).
+
+    Os métodos têm o mesmo nome (e devolvem o mesmo resultado) que as funções dos módulos review_analysis,
+    temporal_analysis e user_analysis. Cada resultado é calculado na primeira vez que é pedido e guardado,
+    por isso pedir a mesma análise outra vez é imediato."""
+
+    def __init__(self):
+        # {Score: contagem}
+        self.distribuicao = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+        # {UserId: [reviews, soma dos scores, votos úteis, soma das palavras, reviews com texto]}
+        self.por_utilizador = {}
+        # {ProductId: [reviews, soma dos scores, reviews com score 5, soma de Score * votos úteis, votos úteis]}
+        self.por_produto = {}
+        # {timestamp Unix: [reviews, soma dos scores]}
+        self.por_timestamp = {}
+        # Resultados já calculados {(nome da análise, argumentos): resultado}
+        self._resultados = {}
+
+    def atualizar(self, dados):
+        """Percorre as reviews uma única vez e soma-as aos acumuladores.
+        Numa lista de dicionários, as reviews com algum campo numérico inválido (Score, HelpfulnessNumerator ou Time)
+        são ignoradas em todas as análises."""
+        with medir("Agregados.atualizar", contar_linhas(dados)):
+            self._atualizar(dados)
+
+    def _atualizar(self, dados):
+        distribuicao = self.distribuicao
+        por_utilizador = self.por_utilizador
+        por_produto = self.por_produto
+        por_timestamp = self.por_timestamp
+
+        campos = iterar_campos(dados, "UserId", "ProductId", "Score", "HelpfulnessNumerator", "Time", "WordCount",
+                               padroes={"HelpfulnessNumerator": 0})
+        for user_id, product_id, score, votos_uteis, timestamp, palavras in campos:
+            if score in distribuicao:
+                distribuicao[score] += 1
+
+            utilizador = por_utilizador.get(user_id)
+            if utilizador is None:
+                utilizador = por_utilizador[user_id] = [0, 0, 0, 0, 0]
+            utilizador[U_REVIEWS] += 1
+            utilizador[U_SOMA_SCORES] += score
+            utilizador[U_VOTOS_UTEIS] += votos_uteis
+            if palavras:
+                utilizador[U_SOMA_PALAVRAS] += palavras
+                utilizador[U_REVIEWS_COM_TEXTO] += 1
+
+            produto = por_produto.get(product_id)
+            if produto is None:
+                produto = por_produto[product_id] = [0, 0, 0, 0, 0]
+            produto[P_REVIEWS] += 1
+            produto[P_SOMA_SCORES] += score
+            if score == 5:
+                produto[P_SCORES_5] += 1
+            produto[P_SOMA_PONDERADA] += score * votos_uteis
+            produto[P_VOTOS_UTEIS] += votos_uteis
+
+            instante = por_timestamp.get(timestamp)
+            if instante is None:
+                instante = por_timestamp[timestamp] = [0, 0]
+            instante[T_REVIEWS] += 1
+            instante[T_SOMA_SCORES] += score
+
+        # Os resultados guardados deixam de ser válidos
+        self._resultados.clear()
+
+    def juntar(self, outro):
+        """Soma aos acumuladores deste objeto os acumuladores de outro objeto Agregados
+        (ex: agregados de outro ficheiro ou de outra parte dos dados)."""
+        for score, contagem in outro.distribuicao.items():
+            self.distribuicao[score] = self.distribuicao.get(score, 0) + contagem
+        for proprios, alheios in ((self.por_utilizador, outro.por_utilizador),
+                                  (self.por_produto, outro.por_produto),
+                                  (self.por_timestamp, outro.por_timestamp)):
+            for chave, valores in alheios.items():
+                atuais = proprios.get(chave)
+                if atuais is None:
+                    proprios[chave] = list(valores)
+                else:
+                    for i, valor in enumerate(valores):
+                        atuais[i] += valor
+        self._resultados.clear()
+
+    def guardar(self, caminho):
+        """Guarda os acumuladores num ficheiro JSON, para serem atualizados numa execução seguinte.
+        Raises:
+            OSError se não for possível escrever o ficheiro."""
+        with open(caminho, "w", encoding="utf-8") as file:
+            # Os acumuladores são guardados como listas de pares [chave, valores] para manter o tipo das chaves
+            # (os timestamps são inteiros e o JSON só aceita strings como chaves)
+            json.dump({
+                "versao": VERSAO_AGREGADOS,
+                "distribuicao": list(self.distribuicao.items()),
+                "por_utilizador": list(self.por_utilizador.items()),
+                "por_produto": list(self.por_produto.items()),
+                "por_timestamp": list(self.por_timestamp.items()),
+            }, file)
+
+    @classmethod
+    def carregar(cls, caminho):
+        """Lê os acumuladores guardados por guardar().
+        Returns:
+            Um novo objeto Agregados.
+        Raises:
+            OSError se não for possível ler o ficheiro; ValueError se o ficheiro não tiver o formato esperado."""
+        with open(caminho, "r", encoding="utf-8") as file:
+            guardados = json.load(file)
+        if guardados.get("versao") != VERSAO_AGREGADOS:
+            raise ValueError(f"Versão dos agregados não suportada: {guardados.get('versao')}")
+
+        agregados = cls()
+        agregados.distribuicao = dict(guardados["distribuicao"])
+        agregados.por_utilizador = dict(guardados["por_utilizador"])
+        agregados.por_produto = dict(guardados["por_produto"])
+        agregados.por_timestamp = dict(guardados["por_timestamp"])
+        return agregados
+
+    def _resultado(self, chave, calcular):
+        """Devolve o resultado guardado para a chave, calculando-o se ainda não existir."""
+        if chave not in self._resultados:
+            self._resultados[chave] = calcular()
+        return self._resultados[chave]
+
+    def _ranking(self, nome, calcular, top_n, minimo_reviews, indice_suporte, acumuladores):
+        """Resultado de uma análise, limitado aos top_n melhores (ver ranking.top_k) se top_n ou minimo_reviews forem dados.
+        O suporte do filtro minimo_reviews é a posição indice_suporte dos acumuladores (por utilizador ou por produto)."""
+        resultado = self._resultado((nome,), calcular)
+        if top_n is None and minimo_reviews is None:
+            return resultado
+
+        def calcular_ranking():
+            suporte = {chave: valores[indice_suporte] for chave, valores in acumuladores.items()}
+            return dict(top_k(resultado, top_n, suporte, minimo_reviews))
+        return self._resultado((nome, top_n, minimo_reviews), calcular_ranking)
+
+    # --- Análise de Avaliações ---
+
+    def contar_distribuicao_scores(self):
+        return dict(self.distribuicao)
+
+    def media_scores_por_utilizador(self, top_n=None, minimo_reviews=None):
+        return self._ranking("media_scores_por_utilizador", lambda: {
+            user_id: valores[U_SOMA_SCORES] / valores[U_REVIEWS]
+            for user_id, valores in self.por_utilizador.items()}, top_n, minimo_reviews, U_REVIEWS, self.por_utilizador)
+
+    def avaliacao_maxima(self, top_n=None, minimo_reviews=None):
+        return self._ranking("avaliacao_maxima", lambda: {
+            product_id: valores[P_SCORES_5]
+            for product_id, valores in self.por_produto.items() if valores[P_SCORES_5]},
+            top_n, minimo_reviews, P_REVIEWS, self.por_produto)
+
+    def media_scores_por_produto(self, top_n=None, minimo_reviews=None):
+        return self._ranking("media_scores_por_produto", lambda: {
+            product_id: valores[P_SOMA_SCORES] / valores[P_REVIEWS]
+            for product_id, valores in self.por_produto.items()}, top_n, minimo_reviews, P_REVIEWS, self.por_produto)
+
+    def calculo_score_medio_ponderado(self, top_n=None, minimo_reviews=None, suavizacao=None, peso_prior=None):
+        # Tal como em review_analysis, ignora produtos sem Id e, sem suavização, produtos sem votos úteis
+        def calcular():
+            produtos = {product_id: valores for product_id, valores in self.por_produto.items() if product_id}
+            acumuladores = produtos.values()
+            return scores_ponderados(list(produtos), [valores[P_SOMA_PONDERADA] for valores in acumuladores],
+                                     [valores[P_VOTOS_UTEIS] for valores in acumuladores], suavizacao, peso_prior)
+        return self._ranking(("calculo_score_medio_ponderado", suavizacao, peso_prior), calcular,
+                             top_n, minimo_reviews, P_REVIEWS, self.por_produto)
+
+    # --- Processamento Temporal ---
+
+    def _indice_temporal(self):
+        """Índice temporal (timestamps ordenados e somas acumuladas) construído a partir dos acumuladores por timestamp."""
+        def calcular():
+            return TimeIndex({timestamp: valores[T_REVIEWS] for timestamp, valores in self.por_timestamp.items()},
+                             {timestamp: valores[T_SOMA_SCORES] for timestamp, valores in self.por_timestamp.items()})
+        return self._resultado(("_indice_temporal",), calcular)
+
+    def _contagem_por_periodo(self, format_str, start=None, end=None):
+        """Agrupa os acumuladores por timestamp em períodos, devolvendo {periodo: [reviews, soma dos scores]} por ordem
+        cronológica, só com os timestamps entre start e end (ver temporal_analysis.count_reviews_by_year)."""
+        def calcular():
+            return self._indice_temporal().by_period(format_str, _to_timestamp_bound(start),
+                                                     _to_timestamp_bound(end, is_end=True))
+        return self._resultado(("_contagem_por_periodo", format_str, start, end), calcular)
+
+    def count_reviews_by_year(self, start=None, end=None):
+        return {ano: valores[T_REVIEWS] for ano, valores in self._contagem_por_periodo("%Y", start, end).items()}
+
+    def identify_busiest_period(self, period_format="%Y-%m", start=None, end=None):
+        busiest_period = None
+        max_count = 0
+        for period, valores in self._contagem_por_periodo(period_format, start, end).items():
+            if valores[T_REVIEWS] > max_count:
+                max_count = valores[T_REVIEWS]
+                busiest_period = period
+        return {'periodo': busiest_period, 'contagem': max_count}
+
+    def _contagem_por_granularidade(self, period, start=None, end=None):
+        """Como _contagem_por_periodo, mas por ano, mês, semana ou dia (ver TimeIndex.by_granularity)."""
+        def calcular():
+            return self._indice_temporal().by_granularity(period, _to_timestamp_bound(start),
+                                                          _to_timestamp_bound(end, is_end=True))
+        return self._resultado(("_contagem_por_granularidade", period, start, end), calcular)
+
+    def _janela_movel(self, window, start=None, end=None):
+        """Acumuladores da janela móvel de window dias que acaba em cada dia (ver TimeIndex.rolling)."""
+        def calcular():
+            return self._indice_temporal().rolling(window, _to_timestamp_bound(start),
+                                                   _to_timestamp_bound(end, is_end=True))
+        return self._resultado(("_janela_movel", window, start, end), calcular)
+
+    def calculate_average_score_over_time(self, period='month', start=None, end=None):
+        return {key: valores[T_SOMA_SCORES] / valores[T_REVIEWS]
+                for key, valores in self._contagem_por_granularidade(period, start, end).items() if valores[T_REVIEWS]}
+
+    def count_reviews_over_time(self, period='day', start=None, end=None):
+        contagens = self._contagem_por_granularidade(period, start, end)
+        return {key: valores[T_REVIEWS] for key, valores in contagens.items()}
+
+    def rolling_average_score(self, window=30, start=None, end=None):
+        return {dia: valores[T_SOMA_SCORES] / valores[T_REVIEWS]
+                for dia, valores in self._janela_movel(window, start, end).items() if valores[T_REVIEWS]}
+
+    def rolling_review_volume(self, window=30, start=None, end=None):
+        return {dia: valores[T_REVIEWS] for dia, valores in self._janela_movel(window, start, end).items()}
+
+    # --- Análise de Utilizadores ---
+
+    def users_with_most_reviews(self, top_n=10, min_reviews=None):
+        def calcular():
+            counter = {user_id: valores[U_REVIEWS] for user_id, valores in self.por_utilizador.items() if user_id}
+            return top_k(counter, top_n, counter, min_reviews)
+        return self._resultado(("users_with_most_reviews", top_n, min_reviews), calcular)
+
+    def most_helpful_users(self, top_n=10, min_reviews=None):
+        def calcular():
+            utilizadores = {user_id: valores for user_id, valores in self.por_utilizador.items() if user_id}
+            helpfulness = {user_id: valores[U_VOTOS_UTEIS] for user_id, valores in utilizadores.items()}
+            review_counts = {user_id: valores[U_REVIEWS] for user_id, valores in utilizadores.items()}
+            return top_k(helpfulness, top_n, review_counts, min_reviews)
+        return self._resultado(("most_helpful_users", top_n, min_reviews), calcular)
+
+    def average_words_per_user(self, top_n=None, min_reviews=None):
+        return self._ranking("average_words_per_user", lambda: {
+            user_id: valores[U_SOMA_PALAVRAS] / valores[U_REVIEWS_COM_TEXTO]
+            for user_id, valores in self.por_utilizador.items() if valores[U_REVIEWS_COM_TEXTO]},
+            top_n, min_reviews, U_REVIEWS_COM_TEXTO, self.por_utilizador)
+
+
+@memorizado
+def agregar(dados):
+    """Calcula todos os acumuladores das análises numa única passagem pelas reviews.
+    O resultado fica na cache de resultados (ver result_cache.py): com o nível em disco ativo, uma nova sessão sobre o
+    mesmo CSV nem chega a percorrer as reviews. Cada chamada recebe uma cópia própria, por isso o objeto devolvido pode
+    ser atualizado (atualizar, juntar) sem alterar os resultados guardados.
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+    Returns:
+        Um objeto Agregados com os resultados de todas as análises."""
+    agregados = Agregados()
+    agregados.atualizar(dados)
+    return agregados
+
+
+def _agregar_particao(caminho_csv, inicio, fim):
+    """Agrega as linhas [inicio, fim) da cache binária (executada em cada processo de agregar_paralelo).
+    As colunas categóricas ficam com os códigos da cache em vez das strings, por isso os acumuladores devolvidos têm
+    como chaves esses códigos (inteiros), que são mais rápidos de agregar e de enviar ao processo principal."""
+    meta = cache_valida(caminho_csv)
+    if meta is None:
+        raise ValueError(f"A cache de {caminho_csv} deixou de ser válida durante a agregação")
+    tabela = ReviewTable({nome: ler_fatia(caminho_csv, nome, inicio, fim, meta) for nome in COLUNAS_NECESSARIAS})
+    agregados = Agregados()
+    agregados._atualizar(tabela)
+    return agregados
+
+
+def agregar_paralelo(caminho_csv, processos=None):
+    """Calcula os mesmos acumuladores que agregar() em vários processos (map-reduce sobre partições de linhas).
+    Args:
+        caminho_csv ==> Caminho do ficheiro CSV (a cache binária é criada se ainda não existir; se não puder ser
+                        criada a agregação é feita num único processo)
+        processos ==> Número de processos (por omissão um por núcleo)
+    Returns:
+        Um objeto Agregados igual ao de agregar(carregar_dados(caminho_csv)).
+    Raises:
+        FileNotFoundError se o CSV não existir."""
+    if not os.path.exists(caminho_csv):
+        raise FileNotFoundError(f"Ficheiro não encontrado: {caminho_csv}")
+    meta = cache_valida(caminho_csv)
+    if meta is None or any(nome not in meta["colunas"] for nome in COLUNAS_NECESSARIAS):
+        dados = carregar_dados(caminho_csv)
+        meta = cache_valida(caminho_csv)
+        if meta is None:
+            # Sem cache (ex: pasta sem permissão de escrita) os processos não têm de onde ler as partições:
+            # agrega no processo principal a tabela que acabou de ser lida
+            if dados is None:
+                raise FileNotFoundError(f"Ficheiro não encontrado: {caminho_csv}")
+            return agregar(dados)
+    processos = processos or os.cpu_count() or 1
+    linhas = meta["linhas"]
+
+    with medir("agregar_paralelo", linhas):
+        # Várias partições por processo, para que os processos mais rápidos não fiquem parados à espera dos outros
+        n_particoes = max(1, min(processos * 4, linhas))
+        limites = [linhas * i // n_particoes for i in range(n_particoes + 1)]
+        particoes = list(zip(limites, limites[1:]))
+
+        agregados = Agregados()
+        if processos > 1:
+            with ProcessPoolExecutor(max_workers=processos) as executor:
+                parciais = executor.map(_agregar_particao, [caminho_csv] * len(particoes), *zip(*particoes))
+                # Juntados pela ordem das partições, para que as chaves fiquem pela ordem do ficheiro (como em agregar)
+                for parcial in parciais:
+                    agregados.juntar(parcial)
+        else:
+            for inicio, fim in particoes:
+                agregados.juntar(_agregar_particao(caminho_csv, inicio, fim))
+
+        # Traduz os códigos das colunas categóricas de volta para os UserId / ProductId
+        utilizadores = ler_valores(caminho_csv, "UserId")
+        produtos = ler_valores(caminho_csv, "ProductId")
+        agregados.por_utilizador = {utilizadores[code]: valores for code, valores in agregados.por_utilizador.items()}
+        agregados.por_produto = {produtos[code]: valores for code, valores in agregados.por_produto.items()}
+    return agregados
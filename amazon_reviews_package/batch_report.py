@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Relatório em Lote"""
+
+"""Este ficheiro executa um conjunto de análises (ou todas) de uma só vez, sem menu, e escreve os resultados em
+ficheiros JSON e/ou CSV. Serve para correr o projeto a partir do cron ou de uma pipeline (ex: um relatório diário):
+    python main.py --relatorio saida/ --csv Reviews.csv
+    python main.py --relatorio saida/ --analises avaliacao_maxima count_reviews_by_year --formatos csv --top-n 10
+
+Os dados são carregados uma vez e todas as análises são respondidas pelo motor de agregação (uma única passagem pelas
+reviews). Com trabalhadores > 1 essa passagem é dividida entre vários processos (ver agregar_paralelo no
+aggregation_engine.py): cada processo agrega uma partição das linhas, lida diretamente da cache binária, e as análises
+são respondidas a partir dos acumuladores juntados."""
+
+import csv
+import inspect
+import json
+import os
+
+import review_analysis
+import temporal_analysis
+import user_analysis
+from aggregation_engine import COLUNAS_NECESSARIAS, agregar, agregar_paralelo
+from data_loader import carregar_dados
+from deduplication import carregar_sem_duplicados
+from instrumentation import medir
+
+# Análises disponíveis: nome ==> função do módulo de análise (o Agregados tem um método com o mesmo nome)
+ANALISES = {funcao.__name__: funcao for funcao in (
+    review_analysis.contar_distribuicao_scores,
+    review_analysis.media_scores_por_utilizador,
+    review_analysis.avaliacao_maxima,
+    review_analysis.media_scores_por_produto,
+    review_analysis.calculo_score_medio_ponderado,
+    temporal_analysis.count_reviews_by_year,
+    temporal_analysis.identify_busiest_period,
+    temporal_analysis.calculate_average_score_over_time,
+    temporal_analysis.count_reviews_over_time,
+    temporal_analysis.rolling_average_score,
+    temporal_analysis.rolling_review_volume,
+    user_analysis.users_with_most_reviews,
+    user_analysis.most_helpful_users,
+    user_analysis.average_words_per_user,
+)}
+
+FORMATOS = ("json", "csv")
+
+
+def _parametros(funcao, parametros):
+    """Devolve só os parâmetros (com valor) que a função aceita, ex: o top_n não se aplica a count_reviews_by_year."""
+    aceites = inspect.signature(funcao).parameters
+    return {nome: valor for nome, valor in parametros.items() if valor is not None and nome in aceites}
+
+
+def _carregar(caminho, sem_duplicados):
+    """Carrega as colunas usadas pelas análises, com ou sem as reviews duplicadas (ver deduplication.py)."""
+    if sem_duplicados:
+        return carregar_sem_duplicados(caminho, colunas=COLUNAS_NECESSARIAS)
+    return carregar_dados(caminho, colunas=COLUNAS_NECESSARIAS)
+
+
+def executar_relatorio(caminho, analises=None, parametros=None, trabalhadores=1, sem_duplicados=False):
+    """Executa as análises indicadas sobre o CSV.
+    Args:
+        caminho ==> Caminho do ficheiro CSV
+        analises ==> Nomes das análises a executar (por omissão todas as de ANALISES)
+        parametros ==> Dicionário opcional com os parâmetros das análises (ex: {"top_n": 10, "start": "2010"}); cada
+        análise só recebe os parâmetros que aceita
+        trabalhadores ==> Número de processos que fazem a agregação (ver aggregation_engine.agregar_paralelo). A vista
+        sem duplicados é sempre agregada num único processo
+        sem_duplicados ==> Se True, as análises correm sobre a vista sem reviews duplicadas
+    Returns:
+        Dicionário {nome da análise: resultado}, pela ordem das análises pedidas.
+    Raises:
+        KeyError se alguma análise não existir; FileNotFoundError se o CSV não existir."""
+    analises = list(analises or ANALISES)
+    parametros = parametros or {}
+    for nome in analises:
+        if nome not in ANALISES:
+            raise KeyError(f"Análise desconhecida: {nome}")
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"Ficheiro não encontrado: {caminho}")
+
+    if trabalhadores > 1 and not sem_duplicados:
+        # Os processos leem as suas partições da cache binária; a tabela nunca é carregada no processo principal
+        agregados = agregar_paralelo(caminho, trabalhadores)
+    else:
+        agregados = agregar(_carregar(caminho, sem_duplicados))
+    resultados = {}
+    for nome in analises:
+        metodo = getattr(agregados, nome)
+        resultados[nome] = metodo(**_parametros(metodo, parametros))
+    return resultados
+
+
+def _linhas(resultado):
+    """Converte o resultado de uma análise em linhas de CSV (chave, valor): um dicionário dá uma linha por item e uma
+    lista de pares (ex: users_with_most_reviews) uma linha por par."""
+    itens = resultado.items() if isinstance(resultado, dict) else resultado
+    return [["chave", "valor"]] + [list(item) for item in itens]
+
+
+def escrever_relatorio(resultados, pasta, formatos=FORMATOS):
+    """Escreve os resultados na pasta indicada: relatorio.json com todas as análises e/ou um <análise>.csv por análise.
+    Returns:
+        Lista dos caminhos dos ficheiros escritos.
+    Raises:
+        OSError se não for possível escrever na pasta."""
+    os.makedirs(pasta, exist_ok=True)
+    escritos = []
+    if "json" in formatos:
+        caminho = os.path.join(pasta, "relatorio.json")
+        with open(caminho, "w", encoding="utf-8") as file:
+            json.dump(resultados, file, ensure_ascii=False, indent=2)
+        escritos.append(caminho)
+    if "csv" in formatos:
+        for nome, resultado in resultados.items():
+            caminho = os.path.join(pasta, nome + ".csv")
+            with open(caminho, "w", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerows(_linhas(resultado))
+            escritos.append(caminho)
+    return escritos
+
+
+def gerar_relatorio(caminho, pasta, analises=None, parametros=None, formatos=FORMATOS, trabalhadores=1,
+                    sem_duplicados=False):
+    """Executa as análises (ver executar_relatorio) e escreve os resultados (ver escrever_relatorio), registando a
+    duração total no log do projeto.
+    Returns:
+        Lista dos caminhos dos ficheiros escritos."""
+    with medir("gerar_relatorio") as registo:
+        resultados = executar_relatorio(caminho, analises, parametros, trabalhadores, sem_duplicados)
+        escritos = escrever_relatorio(resultados, pasta, formatos)
+        registo["analises"] = list(resultados)
+    return escritos
@@ -1,52 +1,330 @@
 # -*- coding: utf-8 -*-
 """Leitura de Dados"""
 
-"""O propósito deste ficheiro é carregar o ficheiro CSV (Reviews.py), converter o mesmo numa lista de dicionários e tratar das exceções e logs"""
+"""O propósito deste ficheiro é carregar o ficheiro CSV (Reviews.py), converter o mesmo numa tabela de reviews (ReviewTable) e tratar das exceções e logs
 
+O CSV pode estar comprimido em gzip, bz2, xz/lzma ou zstd (reconhecido pelos primeiros bytes do ficheiro, não pela
+extensão): é descomprimido à medida que é lido, sem escrever o ficheiro descomprimido no disco. O zstd precisa do módulo
+compression.zstd (Python 3.14) ou do pacote zstandard. Um CSV não comprimido é lido através de um mmap, com leituras
+de TAMANHO_BLOCO_MMAP bytes de cada vez."""
+
+import bz2
 import csv
+import gzip
+import io
+import lzma
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from dataset_cache import carregar_cache, guardar_cache, impressao_digital
+from instrumentation import instrumentado
+from review_table import COLUNAS_DERIVADAS, ORDEM_COLUNAS, TODAS_COLUNAS, ReviewTable, converter_review, \
+    registar_ignoradas
+
+# Localização por omissão do ficheiro CSV (pode ser mudada com a variável de ambiente REVIEWS_CSV ou com --csv)
+FILE_PATH = "C:\\Users\\rodri\\Documents\\Ficheiro Trabalhos"
+FILE_NAME = "Reviews.csv"
+CAMINHO_PADRAO = os.environ.get("REVIEWS_CSV", FILE_PATH + "\\" + FILE_NAME)
+
+# Abaixo deste tamanho (em bytes) o CSV é lido num só processo, porque criar processos custa mais do que poupa
+TAMANHO_MINIMO_PARALELO = 32 * 1024 * 1024
+# Tamanho das leituras feitas ao procurar as fronteiras entre blocos
+_TAMANHO_LEITURA = 1024 * 1024
+# Tamanho das leituras feitas a partir do mmap (e do buffer de leitura dos ficheiros comprimidos em zstd)
+TAMANHO_BLOCO_MMAP = 16 * 1024 * 1024
+
+# Assinatura (primeiros bytes) de cada formato de compressão aceite
+ASSINATURAS_COMPRESSAO = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+
+def formato_compressao(caminho):
+    """Devolve o formato de compressão do ficheiro ("gzip", "bz2", "xz" ou "zstd"), ou None se não estiver comprimido.
+    Raises:
+        FileNotFoundError se o ficheiro não existir."""
+    with open(caminho, "rb") as file:
+        inicio = file.read(8)
+    for assinatura, formato in ASSINATURAS_COMPRESSAO.items():
+        if inicio.startswith(assinatura):
+            return formato
+    return None
+
+
+def _abrir_comprimido(caminho, formato):
+    """Abre um ficheiro comprimido como um fluxo binário descomprimido à medida que é lido."""
+    if formato == "gzip":
+        return gzip.open(caminho, "rb")
+    if formato == "bz2":
+        return bz2.open(caminho, "rb")
+    if formato == "xz":
+        return lzma.open(caminho, "rb")
+    if zstd is not None:
+        return zstd.open(caminho, "rb")
+    if zstandard is not None:
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(caminho, "rb"), closefd=True),
+                                 TAMANHO_BLOCO_MMAP)
+    raise ValueError(f"O ficheiro {caminho} está comprimido em zstd: é preciso o Python 3.14 ou o pacote zstandard")
+
+
+class _LeitorMmap(io.RawIOBase):
+    """Fluxo binário sobre um ficheiro mapeado em memória (mmap), para ser lido com buffers grandes pelo
+    io.BufferedReader/io.TextIOWrapper sem chamadas de sistema de leitura."""
+
+    def __init__(self, mapa):
+        self.mapa = mapa
+        self.posicao = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        n = min(len(destino), len(self.mapa) - self.posicao)
+        destino[:n] = self.mapa[self.posicao:self.posicao + n]
+        self.posicao += n
+        return n
+
+
+@contextmanager
+def abrir_csv(caminho):
+    """Abre o CSV para leitura, descomprimindo-o se for preciso (ver formato_compressao).
+    Uso: with abrir_csv(caminho) as linhas: reader = csv.DictReader(linhas)
+    Raises:
+        FileNotFoundError se o ficheiro não existir; ValueError se a compressão não for suportada."""
+    formato = formato_compressao(caminho)
+    if formato is not None:
+        with io.TextIOWrapper(_abrir_comprimido(caminho, formato), encoding="utf-8") as file:
+            yield file
+        return
+
+    with open(caminho, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # Não é possível mapear um ficheiro vazio
+            yield iter(())
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+            # newline=None converte as quebras de linha tal como o open() em modo texto
+            with io.TextIOWrapper(io.BufferedReader(_LeitorMmap(mapa), TAMANHO_BLOCO_MMAP), encoding="utf-8") as texto:
+                yield texto
+
+
+def _origem(caminho):
+    """Versão do ficheiro CSV (impressão digital do conteúdo e data de modificação), guardada em ReviewTable.origem."""
+    return f"{impressao_digital(caminho)}:{os.stat(caminho).st_mtime_ns}"
+
+
+def _colunas_leitura(nomes):
+    """Colunas do CSV que é preciso ler para obter as colunas indicadas (o WordCount é calculado a partir do Text)."""
+    lidas = [nome for nome in ORDEM_COLUNAS if nome in nomes]
+    if any(nome in COLUNAS_DERIVADAS for nome in nomes) and "Text" not in lidas:
+        lidas.append("Text")
+    return tuple(lidas)
+
+
+def _preencher_tabela(reader, nomes=ORDEM_COLUNAS):
+    """Converte as reviews lidas pelo csv.DictReader para uma ReviewTable só com as colunas indicadas."""
+    # Tabela em colunas que armazena as reviews (ver review_table.py)
+    dados = ReviewTable.com_colunas(nomes)
+
+    for review in reader:
+        # Conversão de tipos de dados (feita pela própria tabela)
+        # "HelpfulnessNumerator":Número de pessoas que consideraram a avaliação útil.(conversão de string para int)
+        # "HelpfulnessDenominator":Número total de votos sobre a utilidade da avaliação.(conversão de string para int)
+        #"Score": Avaliação dada (de 1 a 5 estrelas).(conversão de string para int)
+        #"Time": Timestamp Unix da avaliação.(conversão de string para int)
+        # Os campos ProductId, UserId e ProfileName são internados para não repetir a mesma string em cada review
+        try:
+            dados.adicionar(review)
+        # Uma review com um campo numérico inválido é ignorada (e contada), em vez de interromper o carregamento
+        except ValueError:
+            dados.linhas_ignoradas += 1
+
+    # Conta as palavras de todos os textos uma única vez, no carregamento (fica guardado na tabela e na cache)
+    if "Text" in nomes:
+        dados.coluna("WordCount")
+    return dados
+
 
-def carregar_dados():
-    """Esta função tem como objetivo ler o conteúdo do ficheiro CSV e armazená-lo numa lista de dicionários
+def _limites_blocos(caminho, inicio, n_blocos):
+    """Divide o CSV (a partir do byte inicio) em n_blocos intervalos de bytes que começam sempre no início de uma review.
+
+    Uma quebra de linha só separa reviews se estiver fora de aspas (os campos Text e Summary podem ter quebras de linha
+    entre aspas). Como as aspas dentro de um campo são escritas em duplicado (""), basta saber se o número de aspas
+    lidas até uma posição é par ou ímpar para saber se essa posição está dentro de um campo entre aspas.
+
+    Returns:
+        Uma lista de tuplos (inicio, fim) com os limites de cada bloco, em bytes."""
+    tamanho = os.path.getsize(caminho)
+    alvos = [inicio + (tamanho - inicio) * i // n_blocos for i in range(1, n_blocos)]
+    limites = [inicio]
+
+    with open(caminho, "rb") as file:
+        file.seek(inicio)
+        posicao = inicio
+        entre_aspas = False
+
+        for alvo in alvos:
+            if alvo <= limites[-1]:
+                continue
+            # Conta as aspas até ao alvo
+            while posicao < alvo:
+                bloco = file.read(min(_TAMANHO_LEITURA, alvo - posicao))
+                if not bloco:
+                    break
+                entre_aspas ^= bloco.count(b'"') % 2 == 1
+                posicao += len(bloco)
+
+            # Avança até à primeira quebra de linha que esteja fora de aspas
+            fronteira = None
+            while fronteira is None:
+                bloco = file.read(_TAMANHO_LEITURA)
+                if not bloco:
+                    fronteira = tamanho
+                    break
+                i = 0
+                while True:
+                    j = bloco.find(b"\n", i)
+                    if j < 0:
+                        entre_aspas ^= bloco.count(b'"', i) % 2 == 1
+                        break
+                    entre_aspas ^= bloco.count(b'"', i, j) % 2 == 1
+                    if not entre_aspas:
+                        fronteira = posicao + j + 1
+                        break
+                    i = j + 1
+                posicao += len(bloco)
+
+            limites.append(fronteira)
+            posicao = fronteira
+            file.seek(fronteira)
+
+    limites.append(tamanho)
+    return [(a, b) for a, b in zip(limites, limites[1:]) if a < b]
+
+
+def _ler_bloco(caminho, inicio, fim, cabecalho, nomes=ORDEM_COLUNAS):
+    """Lê as reviews entre os bytes inicio e fim do CSV (executada em cada processo do carregamento paralelo)."""
+    with open(caminho, "rb") as file:
+        file.seek(inicio)
+        texto = file.read(fim - inicio).decode("utf-8")
+    # newline=None converte as quebras de linha tal como o open() em modo texto
+    return _preencher_tabela(csv.DictReader(io.StringIO(texto, newline=None), fieldnames=cabecalho), nomes)
+
+
+def _carregar_paralelo(caminho, processos, nomes=ORDEM_COLUNAS):
+    """Lê o CSV em blocos, cada um interpretado num processo diferente, e junta as tabelas parciais pela ordem do ficheiro."""
+    with open(caminho, "rb") as file:
+        linha_cabecalho = file.readline()
+    cabecalho = next(csv.reader([linha_cabecalho.decode("utf-8")]))
+    # Vários blocos por processo, para que os processos mais rápidos não fiquem parados à espera dos outros
+    blocos = _limites_blocos(caminho, len(linha_cabecalho), processos * 4)
+
+    dados = ReviewTable.com_colunas(nomes)
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(_ler_bloco, caminho, inicio, fim, cabecalho, nomes) for inicio, fim in blocos]
+        for futuro in futuros:
+            dados.estender(futuro.result())
+    return dados
+
+
+def iterar_reviews(caminho=CAMINHO_PADRAO, tamanho_lote=None, colunas=ORDEM_COLUNAS):
+    """Lê o ficheiro CSV de forma incremental, sem nunca o ter todo em memória.
+
+    Todas as funções de análise (e aggregation_engine.agregar) aceitam diretamente o gerador devolvido, por isso é
+    possível analisar ficheiros maiores do que a memória disponível.
     Args:
-        O caminho (file_path) e nome do ficheiro CSV a ser lido ("Reviews.csv")
+        caminho ==> O caminho do ficheiro CSV a ser lido
+        tamanho_lote ==> Se for None devolve uma review (dicionário) de cada vez. Caso contrário devolve ReviewTables
+        com até tamanho_lote reviews cada
+        colunas ==> Campos de cada review (por omissão todos os campos do CSV; pode incluir o WordCount)
     Returns:
-        Uma lista com o formato [ {Review 1}, {Review 2}, ... ], onde cada elemento é um dicionário que representa os dados de
-        uma única review."""
+        Um gerador de reviews ou de lotes de reviews.
+    Raises:
+        FileNotFoundError se o ficheiro não existir; KeyError ou ValueError se uma review estiver mal formada."""
+    with abrir_csv(caminho) as file:
+        reader = csv.DictReader(file)
+        if tamanho_lote is None:
+            for review in reader:
+                yield converter_review(review, colunas)
+            return
 
-    # Lista vazia para armazenar os dicionários.
-    file_path = "C:\\Users\\rodri\\Documents\\Ficheiro Trabalhos"
-    file_name = "Reviews.csv"
+        lote = ReviewTable.com_colunas(colunas)
+        for review in reader:
+            lote.adicionar(review)
+            if len(lote) >= tamanho_lote:
+                yield lote
+                lote = ReviewTable.com_colunas(colunas)
+        if len(lote):
+            yield lote
 
+
+@instrumentado
+def carregar_dados(caminho=CAMINHO_PADRAO, usar_cache=True, processos=None, colunas=None):
+    """Esta função tem como objetivo ler o conteúdo do ficheiro CSV e armazená-lo numa tabela de reviews em colunas
+    Args:
+        caminho ==> O caminho do ficheiro CSV a ser lido, eventualmente comprimido (por omissão o "Reviews.csv" em
+        FILE_PATH, ou o indicado na variável de ambiente REVIEWS_CSV)
+        usar_cache ==> Se True, reutiliza a cache binária do CSV (ver dataset_cache.py) enquanto o ficheiro não mudar,
+        e cria-a depois da primeira leitura
+        processos ==> Número de processos usados para interpretar o CSV. Por omissão usa todos os núcleos do computador
+        quando o ficheiro tem mais de TAMANHO_MINIMO_PARALELO bytes, e um só processo caso contrário
+        colunas ==> Nomes das colunas de que a análise precisa (por omissão todas, incluindo o WordCount). As restantes
+        nunca são lidas da cache; sem cache só são interpretadas do CSV as colunas necessárias
+    Returns:
+        Uma ReviewTable com uma coluna por campo pedido. A tabela comporta-se como a antiga lista de dicionários
+        (len(dados), dados[0], for review in dados), mas guarda os campos numéricos em arrays compactos."""
+
+    nomes = tuple(colunas) if colunas is not None else TODAS_COLUNAS
     try:
-        with open(file_path + "\\" + file_name, "r", encoding="utf-8") as file:
-            reader = csv.DictReader(file)
-            dados = []
+        if usar_cache:
+            dados = carregar_cache(caminho, nomes)
+            if dados is not None:
+                dados.origem = _origem(caminho)
+                return dados
+            # A cache é sempre criada com todas as colunas, para servir qualquer análise nas execuções seguintes
+            nomes_leitura = ORDEM_COLUNAS
+        else:
+            nomes_leitura = _colunas_leitura(nomes)
 
-            for review in reader:
-                # Conversão de tipos de dados
-                # "HelpfulnessNumerator":Número de pessoas que consideraram a avaliação útil.(conversão de string para int)
-                # "HelpfulnessDenominator":Número total de votos sobre a utilidade da avaliação.(conversão de string para int)
-                #"Score": Avaliação dada (de 1 a 5 estrelas).(conversão de string para int)
-                # Cria o dicionário da review
-                review_dict = {
-                    "Id": review["Id"],
-                    "ProductId": review["ProductId"],
-                    "UserId": review["UserId"],
-                    "ProfileName": review["ProfileName"],
-                    # CORREÇÃO: Chave corrigida para 'HelpfulnessNumerator' (uma só 'l')
-                    "HelpfulnessNumerator": int(review["HelpfulnessNumerator"]),
-                    # CORREÇÃO: Chave corrigida para 'HelpfulnessDenominator' (uma só 'l')
-                    "HelpfullnessDenominator": int(review["HelpfulnessDenominator"]),
-                    "Score": int(review["Score"]),
-                    "Time": review["Time"],
-                    "Summary": review["Summary"],
-                    "Text": review["Text"]
-                }
-                # Adiciona o dicionário da review à lista 'dados'.
-                dados.append(review_dict)
-
-        # Retorna a lista completa de dicionários
-        return dados
+        if formato_compressao(caminho) is not None:
+            # Um ficheiro comprimido só pode ser lido do início ao fim, não em blocos de bytes independentes
+            processos = 1
+        elif processos is None:
+            processos = (os.cpu_count() or 1) if os.path.getsize(caminho) >= TAMANHO_MINIMO_PARALELO else 1
+
+        if processos > 1:
+            dados = _carregar_paralelo(caminho, processos, nomes_leitura)
+        else:
+            with abrir_csv(caminho) as file:
+                dados = _preencher_tabela(csv.DictReader(file), nomes_leitura)
+
+        registar_ignoradas(dados.linhas_ignoradas)
+
+        if usar_cache:
+            try:
+                guardar_cache(dados, caminho)
+            except OSError as e:
+                # A falta de cache só torna a próxima execução mais lenta, não impede a análise
+                print(f"AVISO: Não foi possível guardar a cache dos dados: {e}")
+
+        dados.origem = _origem(caminho)
+        # Retorna a tabela só com as colunas pedidas
+        return dados.projetar(nomes)
 
     except FileNotFoundError:
         print("ERROR: File not found")
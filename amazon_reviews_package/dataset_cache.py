@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Cache Binária dos Dados"""
+
+"""Este ficheiro guarda uma cópia binária (snapshot) da ReviewTable ao lado do ficheiro CSV, para que as execuções
+seguintes não tenham de voltar a interpretar o CSV. A cache é invalidada quando o CSV muda.
+
+Estrutura da pasta "<ficheiro CSV>.cache":
+    meta.json             ==> versão do formato, dados do CSV de origem (tamanho, mtime, impressão digital, SHA-1) e
+                              colunas
+    <coluna>.bin          ==> colunas numéricas, escritas diretamente a partir do array (array.tofile)
+    <coluna>.heap         ==> colunas de texto: todos os valores concatenados em UTF-8
+    <coluna>.offsets      ==> posição (em caracteres) onde termina cada valor dentro do heap
+    <coluna>.codes        ==> colunas categóricas: código de cada review no heap de valores distintos
+    <coluna>.idx_offsets  ==> índice secundário (UserId, ProductId): início do grupo de cada valor do heap
+    <coluna>.idx_linhas   ==> índice secundário: posições das reviews agrupadas por valor (ver review_index.py)
+    texto.*               ==> índice de texto do Summary e do Text (ver text_index.py)
+    duplicados.*          ==> posições das reviews que não são duplicadas (ver deduplication.py)
+Os ficheiros do índice só são criados na primeira consulta por utilizador/produto (ou pesquisa de texto).
+"""
+
+import hashlib
+import json
+import os
+import sys
+from array import array
+from functools import partial
+from itertools import accumulate
+
+from review_index import COLUNAS_INDEXADAS, IndiceReviews
+from review_table import COLUNAS_CATEGORICAS, COLUNAS_INTEIRAS, ColunaCategorica, ReviewTable
+
+# Incrementar sempre que o formato dos ficheiros da cache mudar
+VERSAO_CACHE = 2
+# Número de bytes lidos no início e no fim do CSV para calcular a impressão digital
+_BYTES_IMPRESSAO = 1 << 20
+# Tamanho dos blocos lidos para calcular o SHA-1 do ficheiro inteiro
+_BLOCO_SHA1 = 1 << 24
+
+
+def pasta_cache(caminho_csv):
+    """Devolve o caminho da pasta da cache associada ao ficheiro CSV."""
+    return caminho_csv + ".cache"
+
+
+def impressao_digital(caminho_csv):
+    """Calcula uma impressão digital (SHA-1) do CSV a partir do tamanho e do primeiro e último MiB do ficheiro.
+    É rápida mas não vê alterações no meio do ficheiro: só serve para excluir depressa um CSV que mudou (ver
+    sha1_ficheiro)."""
+    tamanho = os.path.getsize(caminho_csv)
+    sha = hashlib.sha1(str(tamanho).encode())
+    with open(caminho_csv, "rb") as file:
+        sha.update(file.read(_BYTES_IMPRESSAO))
+        if tamanho > _BYTES_IMPRESSAO:
+            file.seek(max(_BYTES_IMPRESSAO, tamanho - _BYTES_IMPRESSAO))
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def sha1_ficheiro(caminho_csv):
+    """Calcula o SHA-1 do CSV inteiro (lido em blocos de _BLOCO_SHA1 bytes).
+    Serve para reconhecer um CSV que mudou de mtime (ex: foi copiado) mas cujo conteúdo é o mesmo."""
+    sha = hashlib.sha1()
+    with open(caminho_csv, "rb") as file:
+        for bloco in iter(partial(file.read, _BLOCO_SHA1), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _ler_meta(pasta):
+    try:
+        with open(os.path.join(pasta, "meta.json"), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _escrever_meta(pasta, meta):
+    with open(os.path.join(pasta, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+
+def cache_valida(caminho_csv):
+    """Verifica se existe uma cache atualizada para o CSV.
+    Returns:
+        O dicionário meta.json da cache, ou None se não existir cache ou se o CSV tiver mudado."""
+    pasta = pasta_cache(caminho_csv)
+    meta = _ler_meta(pasta)
+    if meta is None or meta.get("versao") != VERSAO_CACHE:
+        return None
+
+    estado = os.stat(caminho_csv)
+    if meta["tamanho"] != estado.st_size:
+        return None
+    if meta["mtime_ns"] != estado.st_mtime_ns:
+        # O mtime mudou: só reaproveita a cache se o conteúdo for o mesmo (e atualiza o mtime guardado).
+        # A impressão digital exclui depressa a maioria das alterações, mas uma alteração no meio do ficheiro que
+        # mantém o tamanho só é detetada pelo SHA-1 do ficheiro inteiro
+        if meta["impressao_digital"] != impressao_digital(caminho_csv) or meta["sha1"] != sha1_ficheiro(caminho_csv):
+            return None
+        meta["mtime_ns"] = estado.st_mtime_ns
+        try:
+            _escrever_meta(pasta, meta)
+        except OSError:
+            pass
+    return meta
+
+
+def _escrever_texto(pasta, nome, valores):
+    """Escreve uma coluna de texto como heap UTF-8 + offsets."""
+    with open(os.path.join(pasta, nome + ".heap"), "wb") as file:
+        file.write("".join(valores).encode("utf-8"))
+    with open(os.path.join(pasta, nome + ".offsets"), "wb") as file:
+        array("q", accumulate(map(len, valores), initial=0)).tofile(file)
+
+
+def _ler_array(pasta, ficheiro, typecode):
+    caminho = os.path.join(pasta, ficheiro)
+    valores = array(typecode)
+    with open(caminho, "rb") as file:
+        valores.fromfile(file, os.path.getsize(caminho) // valores.itemsize)
+    return valores
+
+
+def _ler_texto(pasta, nome):
+    """Lê uma coluna de texto escrita por _escrever_texto, devolvendo a lista de valores."""
+    with open(os.path.join(pasta, nome + ".heap"), "rb") as file:
+        heap = file.read().decode("utf-8")
+    offsets = _ler_array(pasta, nome + ".offsets", "q")
+    return [heap[inicio:fim] for inicio, fim in zip(offsets, offsets[1:])]
+
+
+def guardar_cache(tabela, caminho_csv):
+    """Guarda a tabela na pasta da cache do CSV indicado.
+    Args:
+        tabela ==> ReviewTable lida a partir do CSV
+        caminho_csv ==> Caminho do ficheiro CSV de origem
+    Raises:
+        OSError se não for possível escrever na pasta da cache."""
+    pasta = pasta_cache(caminho_csv)
+    os.makedirs(pasta, exist_ok=True)
+    # O meta.json só é escrito no fim: enquanto não existir, a cache é considerada inválida
+    # Os índices da cache anterior deixam de corresponder às novas colunas
+    for ficheiro in ["meta.json", "texto.json", "duplicados.json"] + [
+            nome + extensao for nome in COLUNAS_INDEXADAS for extensao in (".idx_offsets", ".idx_linhas")]:
+        try:
+            os.remove(os.path.join(pasta, ficheiro))
+        except FileNotFoundError:
+            pass
+
+    estado = os.stat(caminho_csv)
+    colunas = {}
+    for nome in tabela.nomes_colunas:
+        coluna = tabela.coluna(nome)
+        if nome in COLUNAS_INTEIRAS:
+            with open(os.path.join(pasta, nome + ".bin"), "wb") as file:
+                coluna.tofile(file)
+            colunas[nome] = {"tipo": "inteiro", "typecode": coluna.typecode}
+        elif nome in COLUNAS_CATEGORICAS:
+            # Cada valor distinto só é escrito uma vez; as reviews guardam o código desse valor
+            codes, valores = tabela.codigos(nome)
+            _escrever_texto(pasta, nome, valores)
+            with open(os.path.join(pasta, nome + ".codes"), "wb") as file:
+                codes.tofile(file)
+            colunas[nome] = {"tipo": "categorica"}
+        else:
+            _escrever_texto(pasta, nome, coluna)
+            colunas[nome] = {"tipo": "texto"}
+
+    _escrever_meta(pasta, {
+        "versao": VERSAO_CACHE,
+        "tamanho": estado.st_size,
+        "mtime_ns": estado.st_mtime_ns,
+        "impressao_digital": impressao_digital(caminho_csv),
+        "sha1": sha1_ficheiro(caminho_csv),
+        "linhas": len(tabela),
+        "colunas": colunas,
+    })
+
+
+def _ler_coluna(pasta, nome, descricao, linhas):
+    """Lê uma coluna da cache (chamada pela ReviewTable na primeira vez que a coluna é usada).
+    Raises:
+        OSError se a coluna não puder ser lida; ValueError se não tiver o número de linhas esperado."""
+    if descricao["tipo"] == "inteiro":
+        coluna = _ler_array(pasta, nome + ".bin", descricao["typecode"])
+    elif descricao["tipo"] == "categorica":
+        # Os códigos guardados são usados diretamente pela ColunaCategorica, sem criar uma string por review
+        coluna = ColunaCategorica([sys.intern(valor) for valor in _ler_texto(pasta, nome)],
+                                  _ler_array(pasta, nome + ".codes", "i"))
+    else:
+        coluna = _ler_texto(pasta, nome)
+    if len(coluna) != linhas:
+        raise ValueError(f"A coluna {nome} da cache tem {len(coluna)} linhas em vez de {linhas}")
+    return coluna
+
+
+def _ler_indice(pasta, nome, linhas):
+    """Lê o índice secundário de uma coluna categórica da cache. Se ainda não existir, constrói-o a partir dos códigos
+    da coluna (sem ler a coluna em si) e guarda-o para as execuções seguintes.
+    Returns:
+        O IndiceReviews, ou None se a coluna não puder ser lida da cache."""
+    try:
+        valores = [sys.intern(valor) for valor in _ler_texto(pasta, nome)]
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    try:
+        offsets = _ler_array(pasta, nome + ".idx_offsets", "q")
+        linhas_indice = _ler_array(pasta, nome + ".idx_linhas", "q")
+        if len(offsets) == len(valores) + 1 and len(linhas_indice) == linhas:
+            return IndiceReviews(valores, offsets, linhas_indice)
+    except OSError:
+        pass
+
+    try:
+        codes = _ler_array(pasta, nome + ".codes", "i")
+    except OSError:
+        return None
+    if len(codes) != linhas:
+        return None
+    indice = IndiceReviews.de_codigos(valores, codes)
+    try:
+        # O ficheiro das linhas é escrito primeiro: um índice escrito a meio falha a verificação dos comprimentos
+        with open(os.path.join(pasta, nome + ".idx_linhas"), "wb") as file:
+            indice.linhas.tofile(file)
+        with open(os.path.join(pasta, nome + ".idx_offsets"), "wb") as file:
+            indice.offsets.tofile(file)
+    except OSError:
+        # Sem o índice em disco a próxima execução só tem de o voltar a construir
+        pass
+    return indice
+
+
+def ler_fatia(caminho_csv, nome, inicio, fim, meta=None):
+    """Lê só as linhas [inicio, fim) de uma coluna numérica ou categórica da cache, sem ler o resto do ficheiro.
+    Usada pelo processamento paralelo, em que cada processo lê diretamente do disco a sua parte das colunas (em vez de
+    a receber do processo principal). Numa coluna categórica devolve os códigos (ver ler_valores), não as strings.
+    Args:
+        caminho_csv ==> Caminho do ficheiro CSV de origem
+        nome ==> Nome da coluna
+        inicio, fim ==> Intervalo de linhas
+        meta ==> meta.json da cache, se já tiver sido lido (ver cache_valida)
+    Returns:
+        Um array com os valores (ou códigos) das linhas pedidas.
+    Raises:
+        OSError se a coluna não puder ser lida; KeyError se a coluna não existir ou não for numérica/categórica."""
+    pasta = pasta_cache(caminho_csv)
+    descricao = (meta or _ler_meta(pasta))["colunas"][nome]
+    if descricao["tipo"] == "inteiro":
+        valores, ficheiro = array(descricao["typecode"]), nome + ".bin"
+    elif descricao["tipo"] == "categorica":
+        valores, ficheiro = array("i"), nome + ".codes"
+    else:
+        raise KeyError(f"A coluna {nome} não é numérica nem categórica")
+    with open(os.path.join(pasta, ficheiro), "rb") as file:
+        file.seek(inicio * valores.itemsize)
+        valores.fromfile(file, fim - inicio)
+    return valores
+
+
+def ler_valores(caminho_csv, nome):
+    """Devolve a lista dos valores distintos de uma coluna categórica da cache (o código i corresponde ao valor i).
+    Raises:
+        OSError se a coluna não puder ser lida."""
+    return [sys.intern(valor) for valor in _ler_texto(pasta_cache(caminho_csv), nome)]
+
+
+def carregar_cache(caminho_csv, colunas=None):
+    """Abre a tabela guardada na cache do CSV indicado.
+    As colunas não são lidas logo: cada uma só é lida do disco na primeira vez que for usada (tal como os índices
+    secundários das colunas em COLUNAS_INDEXADAS).
+    Args:
+        caminho_csv ==> Caminho do ficheiro CSV de origem
+        colunas ==> Nomes das colunas pretendidas (por omissão todas as colunas guardadas)
+    Returns:
+        A ReviewTable guardada, ou None se a cache não existir, estiver desatualizada ou não tiver todas as colunas
+        pedidas."""
+    meta = cache_valida(caminho_csv)
+    if meta is None:
+        return None
+    if colunas is None:
+        colunas = list(meta["colunas"])
+    if any(nome not in meta["colunas"] for nome in colunas):
+        return None
+
+    pasta = pasta_cache(caminho_csv)
+    pendentes = {nome: partial(_ler_coluna, pasta, nome, meta["colunas"][nome], meta["linhas"]) for nome in colunas}
+    indices = {nome: partial(_ler_indice, pasta, nome, meta["linhas"]) for nome in colunas if nome in COLUNAS_INDEXADAS}
+    return ReviewTable({}, pendentes, indices)
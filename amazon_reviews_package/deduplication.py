@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Deteção de Reviews Duplicadas"""
+
+"""O Reviews.csv tem muitas reviews repetidas: a mesma review (mesmo UserId, Time e Text) aparece uma vez por cada
+variante do produto (ProductIds diferentes). Estas cópias inflacionam os rankings de users_with_most_reviews,
+avaliacao_maxima e average_words_per_user. Este ficheiro deteta as cópias e devolve uma vista sem duplicados, sobre a
+qual correm as mesmas análises.
+
+São detetados dois tipos de duplicados, sempre entre reviews do mesmo utilizador (dois utilizadores diferentes que
+escrevem "Great product!" não são duplicados):
+    exatos      ==> mesmo UserId, Time e Text (dicionário com a chave (Time, Text) por utilizador)
+    aproximados ==> textos com semelhança de Jaccard >= limiar entre os conjuntos de shingles (sequências de
+                    TAMANHO_SHINGLE palavras), ex: a mesma review com uma correção ou publicada noutra data
+
+Os aproximados usam MinHash + LSH: cada texto é resumido numa assinatura de NUMERO_MINHASHES mínimos (one permutation
+hashing: um único hash por shingle, dividido por NUMERO_MINHASHES compartimentos), e a assinatura é cortada em BANDAS
+bandas. Só os textos que coincidem numa banda inteira são comparados (e confirmados com a semelhança exata), e só com
+as reviews que ficam: uma review quase igual a uma review anterior que fica é uma cópia e não volta a ser comparada.
+Cada balde de uma banda guarda no máximo MAXIMO_POR_BALDE reviews, por isso cada review é comparada no máximo
+BANDAS * MAXIMO_POR_BALDE vezes e o custo cresce com o número de reviews e não com o número de pares (mesmo para um
+utilizador com milhares de reviews parecidas).
+
+O resultado (posições das reviews que ficam) é guardado na pasta da cache binária do CSV (duplicados.json e
+duplicados.linhas), para que as execuções seguintes não tenham de voltar a ler os textos."""
+
+import json
+import os
+import zlib
+from array import array
+from bisect import bisect_left
+
+from data_loader import carregar_dados
+from dataset_cache import cache_valida, pasta_cache
+from review_index import IndiceReviews
+from review_table import ReviewTable, filtrar_linhas
+from text_index import tokenizar
+
+# Semelhança de Jaccard mínima entre dois textos para serem considerados duplicados aproximados
+LIMIAR_PADRAO = 0.8
+# Número de palavras de cada shingle
+TAMANHO_SHINGLE = 3
+# Número de mínimos da assinatura MinHash (potência de 2) e número de bandas do LSH (NUMERO_MINHASHES / BANDAS
+# mínimos por banda). Com 8 bandas de 4 mínimos, dois textos com semelhança 0.8 são comparados com probabilidade 98.5%
+NUMERO_MINHASHES = 32
+BANDAS = 8
+# Número máximo de reviews (as primeiras que ficam) com que uma review é comparada em cada balde de uma banda
+MAXIMO_POR_BALDE = 8
+# Colunas necessárias para detetar os duplicados
+COLUNAS_DUPLICADOS = ("UserId", "Time", "Text")
+# Incrementar sempre que o formato dos ficheiros ou o algoritmo mudar
+VERSAO_DUPLICADOS = 2
+
+_BITS_COMPARTIMENTO = NUMERO_MINHASHES.bit_length() - 1
+
+
+def _shingles(texto):
+    """Devolve o conjunto dos hashes (CRC-32, estável entre execuções) dos shingles do texto (vazio se o texto não
+    tiver palavras). Um texto com menos palavras do que um shingle fica com um único shingle (o texto inteiro)."""
+    palavras = tokenizar(texto)
+    if len(palavras) < TAMANHO_SHINGLE:
+        janelas = [" ".join(palavras)] if palavras else []
+    else:
+        janelas = map(" ".join, zip(*(palavras[i:] for i in range(TAMANHO_SHINGLE))))
+    return set(map(zlib.crc32, map(str.encode, janelas)))
+
+
+def _assinatura(shingles):
+    """Assinatura MinHash (one permutation hashing) de um conjunto de shingles não vazio: os bits baixos de cada hash
+    escolhem o compartimento e os restantes são o valor, e cada compartimento guarda o menor valor.
+    Os compartimentos vazios recebem o mínimo do compartimento seguinte não vazio (densificação), para que dois textos
+    curtos continuem a ter assinaturas comparáveis."""
+    minimos = [None] * NUMERO_MINHASHES
+    em_falta = NUMERO_MINHASHES
+    # Por ordem crescente, o primeiro hash de cada compartimento é o que tem o menor valor
+    for valor in sorted(shingles):
+        compartimento = valor & (NUMERO_MINHASHES - 1)
+        if minimos[compartimento] is None:
+            minimos[compartimento] = valor >> _BITS_COMPARTIMENTO
+            em_falta -= 1
+            if not em_falta:
+                break
+    for i in range(NUMERO_MINHASHES):
+        j = i
+        while minimos[j % NUMERO_MINHASHES] is None:
+            j += 1
+        if j != i:
+            minimos[i] = minimos[j % NUMERO_MINHASHES]
+    return minimos
+
+
+def _quase_duplicados(linhas, textos, limiar):
+    """Encontra as reviews (de um mesmo utilizador) com texto quase igual ao de uma review anterior que fica.
+    Args:
+        linhas ==> Posições das reviews, pela ordem do ficheiro
+        textos ==> Coluna Text
+        limiar ==> Semelhança de Jaccard mínima
+    Returns:
+        Lista das posições das reviews que são cópias de uma review anterior."""
+    por_banda = NUMERO_MINHASHES // BANDAS
+    # {(banda, mínimos da banda): [(posição, shingles) das primeiras reviews que ficam com essa banda]}
+    baldes = {}
+    copias = []
+    for linha in linhas:
+        shingles = _shingles(textos[linha])
+        if not shingles:
+            continue
+        assinatura = _assinatura(shingles)
+        chaves = [(banda, tuple(assinatura[banda * por_banda:(banda + 1) * por_banda])) for banda in range(BANDAS)]
+        # Uma review que está em várias bandas da mesma candidata só é comparada com ela uma vez
+        comparadas = set()
+        copia = False
+        for chave in chaves:
+            for candidata, shingles_candidata in baldes.get(chave, ()):
+                if candidata in comparadas:
+                    continue
+                comparadas.add(candidata)
+                intersecao = len(shingles_candidata & shingles)
+                if intersecao >= limiar * (len(shingles_candidata) + len(shingles) - intersecao):
+                    copia = True
+                    break
+            if copia:
+                break
+        if copia:
+            # As cópias não entram nos baldes: as reviews seguintes só são comparadas com as que ficam
+            copias.append(linha)
+            continue
+        for chave in chaves:
+            balde = baldes.setdefault(chave, [])
+            if len(balde) < MAXIMO_POR_BALDE:
+                balde.append((linha, shingles))
+    return copias
+
+
+def linhas_unicas(dados, aproximado=True, limiar=LIMIAR_PADRAO):
+    """Deteta as reviews duplicadas.
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) com UserId, Time e Text
+        aproximado ==> Se True, deteta também os duplicados aproximados (MinHash + LSH); se False só os exatos
+        limiar ==> Semelhança de Jaccard mínima dos duplicados aproximados (entre 0 e 1)
+    Returns:
+        array("q") com as posições das reviews que ficam (a primeira de cada grupo de duplicados), por ordem crescente.
+    Raises:
+        KeyError se faltar uma das colunas necessárias; ValueError se o limiar não estiver entre 0 e 1."""
+    if not 0 < limiar <= 1:
+        raise ValueError(f"O limiar de semelhança tem de estar entre 0 e 1 (recebido {limiar})")
+    if isinstance(dados, ReviewTable):
+        tempos, textos = dados.coluna("Time"), dados.coluna("Text")
+        # O índice por utilizador dá as reviews de cada utilizador sem ordenar a tabela (e fica na cache binária)
+        indice = dados.indice("UserId")
+    else:
+        tempos = [review.get("Time") for review in dados]
+        textos = [review.get("Text") or "" for review in dados]
+        indice = IndiceReviews.construir([review.get("UserId") for review in dados])
+
+    repetidas = bytearray(len(textos))
+    offsets, todas = indice.offsets, indice.linhas
+    for i in range(len(indice)):
+        # Só os utilizadores com mais de uma review podem ter duplicados
+        if offsets[i + 1] - offsets[i] < 2:
+            continue
+        vistas = set()
+        unicas = []
+        for linha in todas[offsets[i]:offsets[i + 1]]:
+            chave = (tempos[linha], textos[linha])
+            if chave in vistas:
+                repetidas[linha] = 1
+            else:
+                vistas.add(chave)
+                unicas.append(linha)
+        if aproximado and len(unicas) > 1:
+            for linha in _quase_duplicados(unicas, textos, limiar):
+                repetidas[linha] = 1
+    return array("q", (linha for linha, repetida in enumerate(repetidas) if not repetida))
+
+
+def sem_duplicados(dados, aproximado=True, limiar=LIMIAR_PADRAO):
+    """Devolve uma vista dos dados sem as reviews duplicadas (ver linhas_unicas), sobre a qual podem correr todas as
+    análises. Numa ReviewTable a vista partilha os valores das colunas categóricas e as colunas pendentes só são lidas
+    quando forem usadas (ver ReviewTable.selecionar)."""
+    vista = filtrar_linhas(dados, linhas_unicas(dados, aproximado, limiar))
+    return _marcar_origem(vista, dados, aproximado, limiar)
+
+
+def _marcar_origem(vista, dados, aproximado, limiar):
+    """Dá à vista uma versão própria na cache de resultados (ver result_cache.py), derivada da dos dados."""
+    if isinstance(vista, ReviewTable) and dados.origem is not None:
+        vista.origem = f"{dados.origem}:sem_duplicados:{limiar if aproximado else 'exatos'}"
+    return vista
+
+
+def _ler_linhas_guardadas(pasta, meta, aproximado, limiar):
+    """Lê as posições guardadas por _guardar_linhas, ou devolve None se não existirem ou estiverem desatualizadas."""
+    try:
+        with open(os.path.join(pasta, "duplicados.json"), "r", encoding="utf-8") as file:
+            descricao = json.load(file)
+        caminho = os.path.join(pasta, "duplicados.linhas")
+        linhas = array("q")
+        with open(caminho, "rb") as file:
+            linhas.fromfile(file, os.path.getsize(caminho) // linhas.itemsize)
+    except (OSError, ValueError, EOFError):
+        return None
+    if descricao != {"versao": VERSAO_DUPLICADOS, "impressao_digital": meta["impressao_digital"],
+                     "linhas": meta["linhas"], "aproximado": aproximado, "limiar": limiar, "unicas": len(linhas)}:
+        return None
+    return linhas
+
+
+def _guardar_linhas(pasta, meta, aproximado, limiar, linhas):
+    """Guarda as posições das reviews que ficam na pasta da cache (o duplicados.json é escrito por último)."""
+    try:
+        os.remove(os.path.join(pasta, "duplicados.json"))
+    except FileNotFoundError:
+        pass
+    with open(os.path.join(pasta, "duplicados.linhas"), "wb") as file:
+        linhas.tofile(file)
+    with open(os.path.join(pasta, "duplicados.json"), "w", encoding="utf-8") as file:
+        json.dump({"versao": VERSAO_DUPLICADOS, "impressao_digital": meta["impressao_digital"], "linhas": meta["linhas"],
+                   "aproximado": aproximado, "limiar": limiar, "unicas": len(linhas)}, file)
+
+
+def linhas_sem_duplicados(caminho, aproximado=True, limiar=LIMIAR_PADRAO):
+    """Devolve as posições (no CSV) das reviews que não são duplicadas, lidas da pasta da cache ou, na primeira vez (ou
+    se o CSV mudou), calculadas a partir do UserId, Time e Text e guardadas para as execuções seguintes.
+    Args:
+        caminho ==> Caminho do ficheiro CSV
+        aproximado, limiar ==> Ver linhas_unicas
+    Returns:
+        array("q") com as posições, por ordem crescente, ou None se o CSV não existir (como em carregar_dados)."""
+    meta = cache_valida(caminho) if os.path.exists(caminho) else None
+    pasta = pasta_cache(caminho)
+    linhas = _ler_linhas_guardadas(pasta, meta, aproximado, limiar) if meta is not None else None
+    if linhas is not None:
+        return linhas
+
+    dados = carregar_dados(caminho, colunas=COLUNAS_DUPLICADOS)
+    if dados is None:
+        return None
+    linhas = linhas_unicas(dados, aproximado, limiar)
+    meta = cache_valida(caminho)
+    if meta is not None:
+        try:
+            _guardar_linhas(pasta, meta, aproximado, limiar, linhas)
+        except OSError:
+            # Sem o ficheiro a próxima execução só tem de voltar a calcular os duplicados
+            pass
+    return linhas
+
+
+def posicoes_na_vista(unicas, linhas):
+    """Converte posições do CSV (ex: resultado de uma pesquisa no text_index.py) em posições da vista sem duplicados.
+    Args:
+        unicas ==> Posições das reviews da vista (ver linhas_sem_duplicados), por ordem crescente
+        linhas ==> Posições do CSV, por ordem crescente
+    Returns:
+        array("q") com as posições na vista das reviews de linhas que não são duplicadas."""
+    posicoes = array("q")
+    i = 0
+    for linha in linhas:
+        i = bisect_left(unicas, linha, i)
+        if i < len(unicas) and unicas[i] == linha:
+            posicoes.append(i)
+    return posicoes
+
+
+def carregar_sem_duplicados(caminho, colunas=None, aproximado=True, limiar=LIMIAR_PADRAO):
+    """Etapa a seguir ao data_loader.carregar_dados: carrega as colunas pedidas do CSV e devolve a vista sem duplicados
+    (ver linhas_sem_duplicados). Os textos só são lidos para calcular os duplicados, na primeira vez.
+    Args:
+        caminho ==> Caminho do ficheiro CSV
+        colunas ==> Colunas pretendidas (como em carregar_dados)
+        aproximado, limiar ==> Ver linhas_unicas
+    Returns:
+        A ReviewTable sem duplicados, ou None se o CSV não existir (como em carregar_dados)."""
+    dados = carregar_dados(caminho, colunas=colunas)
+    if dados is None:
+        return None
+    linhas = linhas_sem_duplicados(caminho, aproximado, limiar)
+    return _marcar_origem(dados.selecionar(linhas), dados, aproximado, limiar)
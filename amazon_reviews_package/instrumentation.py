@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Instrumentação"""
+
+"""Este ficheiro mede o desempenho do carregamento e das funções de análise e escreve os resultados no ficheiro de log
+do projeto (logs/project_log.txt), um registo JSON por linha.
+
+Cada registo tem: data, operação, tempo (segundos), linhas processadas, linhas ignoradas por valores inválidos,
+variação de memória (KB) e, se a operação falhar, o nome da exceção.
+
+Com o modo de perfil ativo (ativar_perfil ou python main.py --perfil) cada ação medida com perfil() também guarda um
+relatório do cProfile (funções mais demoradas) e do tracemalloc (linhas que mais memória alocaram) na pasta
+logs/perfis."""
+
+import cProfile
+import datetime
+import functools
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import review_table
+
+PASTA_LOGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+FICHEIRO_LOG = os.path.join(PASTA_LOGS, "project_log.txt")
+PASTA_PERFIS = os.path.join(PASTA_LOGS, "perfis")
+
+# Número de funções/linhas mostradas nos relatórios de perfil
+_LINHAS_RELATORIO = 25
+
+_perfil_ativo = False
+_ficheiro_log = FICHEIRO_LOG
+
+
+def ativar_perfil(ativo=True):
+    """Ativa (ou desativa) o modo de perfil. Com o modo ativo o tracemalloc fica ligado, por isso as variações de
+    memória passam a ser medidas em bytes alocados pelo Python e não pela memória residente do processo."""
+    global _perfil_ativo
+    _perfil_ativo = ativo
+    if ativo and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not ativo and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def configurar_log(ficheiro=FICHEIRO_LOG):
+    """Muda o ficheiro onde os registos são escritos (ex: os benchmarks usam um ficheiro temporário para não encher o
+    log do projeto com as suas medições)."""
+    global _ficheiro_log
+    _ficheiro_log = ficheiro
+
+
+def _memoria_kb():
+    """Memória atual do processo em KB: memória alocada (tracemalloc) se estiver ativo, senão memória residente
+    (só disponível em Linux). Devolve None se não for possível medir."""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0] / 1024
+    try:
+        with open("/proc/self/statm", "r") as file:
+            paginas_residentes = int(file.read().split()[1])
+        return paginas_residentes * os.sysconf("SC_PAGE_SIZE") / 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def registar(registo):
+    """Acrescenta um registo (dicionário) ao ficheiro de log, como uma linha JSON.
+    Uma falha a escrever o log nunca interrompe a análise."""
+    registo = {"data": datetime.datetime.now().isoformat(timespec="seconds"), **registo}
+    try:
+        os.makedirs(os.path.dirname(_ficheiro_log) or ".", exist_ok=True)
+        with open(_ficheiro_log, "a", encoding="utf-8") as file:
+            file.write(json.dumps(registo, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+
+
+def contar_linhas(dados):
+    """Número de reviews dos dados, se for possível saber sem os percorrer (ex: geradores devolvem None)."""
+    if isinstance(dados, (str, bytes)):
+        # Ex: o caminho do ficheiro passado ao carregar_dados
+        return None
+    try:
+        return len(dados)
+    except TypeError:
+        return None
+
+
+@contextmanager
+def medir(operacao, linhas=None):
+    """Context manager que mede o bloco de código e escreve um registo no log.
+    Args:
+        operacao ==> Nome da operação a registar
+        linhas ==> Número de linhas processadas (se conhecido)
+    Returns:
+        Um dicionário que o bloco pode completar com outros campos (ex: registo["linhas"] = n) antes de ser escrito."""
+    registo = {"operacao": operacao, "linhas": linhas}
+    ignoradas_antes = review_table.contagem_ignoradas
+    memoria_antes = _memoria_kb()
+    inicio = time.perf_counter()
+    try:
+        yield registo
+    except Exception as e:
+        registo["erro"] = type(e).__name__
+        raise
+    finally:
+        registo["segundos"] = round(time.perf_counter() - inicio, 6)
+        registo["linhas_ignoradas"] = review_table.contagem_ignoradas - ignoradas_antes
+        memoria_depois = _memoria_kb()
+        if memoria_antes is not None and memoria_depois is not None:
+            registo["memoria_delta_kb"] = round(memoria_depois - memoria_antes, 1)
+        registar(registo)
+
+
+def instrumentado(funcao):
+    """Decorador que regista no log cada chamada da função (ver medir).
+    O primeiro argumento da função é considerado o conjunto de reviews (para contar as linhas processadas)."""
+    @functools.wraps(funcao)
+    def envolvida(*args, **kwargs):
+        linhas = contar_linhas(args[0]) if args else None
+        with medir(funcao.__name__, linhas) as registo:
+            resultado = funcao(*args, **kwargs)
+            if registo["linhas"] is None:
+                registo["linhas"] = contar_linhas(resultado) if isinstance(resultado, review_table.ReviewTable) \
+                    else None
+            return resultado
+    return envolvida
+
+
+@contextmanager
+def perfil(acao):
+    """Context manager para as ações do menu: mede a ação (ver medir) e, com o modo de perfil ativo, guarda os
+    relatórios do cProfile e do tracemalloc da ação em logs/perfis."""
+    with medir(acao):
+        if not _perfil_ativo:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        tracemalloc.clear_traces()
+        antes = tracemalloc.take_snapshot()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            depois = tracemalloc.take_snapshot()
+            _guardar_relatorio(acao, profiler, depois.compare_to(antes, "lineno"))
+
+
+def _guardar_relatorio(acao, profiler, diferencas_memoria):
+    """Escreve o relatório de perfil de uma ação num ficheiro de texto em logs/perfis."""
+    texto = io.StringIO()
+    texto.write(f"Perfil da ação: {acao}\n\n--- cProfile (tempo acumulado) ---\n")
+    pstats.Stats(profiler, stream=texto).sort_stats("cumulative").print_stats(_LINHAS_RELATORIO)
+    texto.write("\n--- tracemalloc (memória alocada por linha) ---\n")
+    for diferenca in diferencas_memoria[:_LINHAS_RELATORIO]:
+        texto.write(f"{diferenca}\n")
+
+    nome_ficheiro = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") + "_" + \
+        "".join(c if c.isalnum() else "_" for c in acao) + ".txt"
+    try:
+        os.makedirs(PASTA_PERFIS, exist_ok=True)
+        with open(os.path.join(PASTA_PERFIS, nome_ficheiro), "w", encoding="utf-8") as file:
+            file.write(texto.getvalue())
+    except OSError:
+        pass
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""Serviço de Consultas"""
+
+"""Este ficheiro mantém os dados carregados num processo residente e responde às análises por HTTP/JSON, só em
+localhost, para que outros programas não tenham de carregar o CSV nem usar o menu em cada consulta:
+    python main.py --servidor --csv Reviews.csv
+    curl "http://127.0.0.1:8765/analises/media_scores_por_produto?top_n=10"
+    curl "http://127.0.0.1:8765/analises/count_reviews_by_year?start=2008&end=2010"
+    curl "http://127.0.0.1:8765/analises/estatisticas_utilizador?user_id=A3SGXH7AUHU8GW"
+
+Pedidos (só GET):
+    /analises          ==> nomes das análises disponíveis: as de batch_report.ANALISES e as consultas por
+                           utilizador/produto (reviews_do_utilizador, reviews_do_produto, estatisticas_utilizador,
+                           estatisticas_produto, com o parâmetro user_id ou product_id)
+    /analises/<nome>   ==> resultado da análise; os parâmetros da query string (top_n, start, period, ...) são
+                           validados e passados à análise (400 se a análise não os aceitar ou se forem inválidos)
+    /estado            ==> CSV, número de reviews, data do último carregamento e número de recargas
+As respostas são JSON ({"analise": ..., "resultado": ...} ou {"erro": ...} com o código HTTP do erro).
+
+As análises são respondidas pelo motor de agregação (ver aggregation_engine.py), calculado uma vez por
+carregamento, e as consultas por utilizador/produto pelos índices secundários da tabela (ver review_index.py), por isso
+cada consulta demora milissegundos. O servidor (asyncio) atende várias ligações ao mesmo tempo: as análises correm numa
+thread, para que uma consulta mais demorada (ex: a primeira de uma análise) não atrase as outras ligações. De
+INTERVALO_RECARGA em INTERVALO_RECARGA segundos verifica se o CSV mudou: quando o ficheiro deixa de mudar é recarregado
+numa thread, e as consultas continuam a ser respondidas com os dados anteriores até os novos estarem prontos."""
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from aggregation_engine import agregar
+from batch_report import ANALISES
+from data_loader import carregar_dados
+from deduplication import carregar_sem_duplicados
+from instrumentation import medir
+from review_analysis import estatisticas_produto, estatisticas_utilizador, reviews_do_produto, reviews_do_utilizador
+from temporal_analysis import PERIOD_FORMATS, _to_timestamp_bound
+from weighted_scoring import SUAVIZACOES
+
+ENDERECO_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8765
+# Segundos entre verificações de alterações ao CSV
+INTERVALO_RECARGA = 2.0
+# Tamanho máximo da linha de pedido e de cada cabeçalho HTTP
+_TAMANHO_MAXIMO_LINHA = 8192
+
+# Consultas por utilizador/produto, respondidas a partir da tabela (e não dos agregados)
+ANALISES_DETALHE = {funcao.__name__: funcao for funcao in (
+    reviews_do_utilizador,
+    reviews_do_produto,
+    estatisticas_utilizador,
+    estatisticas_produto,
+)}
+
+# Conversão dos parâmetros da query string (os restantes são passados como texto, ex: period_format, user_id)
+# {nome: valor mínimo}
+_PARAMETROS_INTEIROS = {"top_n": 0, "minimo_reviews": 0, "min_reviews": 0, "window": 1}
+_PARAMETROS_DECIMAIS = ("peso_prior",)
+_PARAMETROS_TEMPO = ("start", "end")
+_VALORES_ACEITES = {"period": tuple(PERIOD_FORMATS), "suavizacao": SUAVIZACOES}
+
+
+def _converter_parametro(nome, texto):
+    """Converte um parâmetro da query string para o tipo esperado pelas análises e verifica o seu valor, para que um
+    erro dentro de uma análise seja sempre um erro do servidor e não do pedido.
+    Raises:
+        ValueError se o valor não for válido para o parâmetro."""
+    if nome in _PARAMETROS_INTEIROS:
+        valor = int(texto)
+        if valor < _PARAMETROS_INTEIROS[nome]:
+            raise ValueError(f"O parâmetro {nome} tem de ser pelo menos {_PARAMETROS_INTEIROS[nome]} "
+                             f"(recebido {valor})")
+        return valor
+    if nome in _PARAMETROS_DECIMAIS:
+        valor = float(texto)
+        if not valor >= 0:
+            raise ValueError(f"O parâmetro {nome} tem de ser um número não negativo (recebido {texto})")
+        return valor
+    if nome in _PARAMETROS_TEMPO:
+        # Um timestamp Unix (só dígitos) ou uma data 'YYYY', 'YYYY-MM' ou 'YYYY-MM-DD', como --inicio/--fim
+        valor = int(texto) if texto.isdigit() and len(texto) > 4 else texto
+        _to_timestamp_bound(valor)
+        return valor
+    if nome in _VALORES_ACEITES and texto not in _VALORES_ACEITES[nome]:
+        raise ValueError(f"Valor inválido para {nome}: {texto} (use {', '.join(_VALORES_ACEITES[nome])})")
+    return texto
+
+
+def _estado_ficheiro(caminho):
+    """Tamanho e data de modificação do CSV (None se o ficheiro não existir), para detetar alterações."""
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        return None
+    return estado.st_size, estado.st_mtime_ns
+
+
+class ServidorAnalises:
+    """Servidor HTTP/JSON residente com os dados e os agregados de um CSV."""
+
+    def __init__(self, caminho, sem_duplicados=False, intervalo_recarga=INTERVALO_RECARGA):
+        """
+        Args:
+            caminho ==> Caminho do ficheiro CSV
+            sem_duplicados ==> Se True, as análises correm sobre a vista sem reviews duplicadas (ver deduplication.py)
+            intervalo_recarga ==> Segundos entre verificações de alterações ao CSV (None desativa a recarga)
+        """
+        self.caminho = caminho
+        self.sem_duplicados = sem_duplicados
+        self.intervalo_recarga = intervalo_recarga
+        # (tabela, agregados) do último carregamento, substituídos juntos
+        self.dados = None
+        self.agregados = None
+        self.reviews = 0
+        self.carregado_em = None
+        self.recargas = 0
+        self._estado_carregado = None
+        # As colunas e os índices da tabela são lidos na primeira vez que são usados: as consultas por
+        # utilizador/produto (que correm em threads) não os podem ler ao mesmo tempo
+        self._trinco_dados = threading.Lock()
+
+    def carregar(self):
+        """Carrega o CSV e calcula os agregados, substituindo os anteriores só no fim (as consultas feitas entretanto
+        continuam a usar os dados anteriores).
+        Raises:
+            FileNotFoundError se o CSV não existir."""
+        with medir("servidor carregar") as registo:
+            estado = _estado_ficheiro(self.caminho)
+            # Todas as colunas, para as consultas por utilizador/produto (da cache só são lidas as que forem usadas)
+            if self.sem_duplicados:
+                dados = carregar_sem_duplicados(self.caminho)
+            else:
+                dados = carregar_dados(self.caminho)
+            if dados is None:
+                raise FileNotFoundError(f"Ficheiro não encontrado: {self.caminho}")
+            agregados = agregar(dados)
+            registo["linhas"] = len(dados)
+        self.dados, self.agregados, self.reviews, self._estado_carregado = dados, agregados, len(dados), estado
+        self.carregado_em = time.time()
+
+    def responder(self, caminho_pedido):
+        """Responde a um pedido (caminho com a query string).
+        Returns:
+            Um tuplo (HTTPStatus, dicionário a devolver em JSON)."""
+        url = urlsplit(caminho_pedido)
+        partes = [unquote(parte) for parte in url.path.split("/") if parte]
+        if partes == ["estado"]:
+            return HTTPStatus.OK, {"csv": self.caminho, "reviews": self.reviews, "carregado_em": self.carregado_em,
+                                   "recargas": self.recargas, "sem_duplicados": self.sem_duplicados}
+        if partes == ["analises"]:
+            return HTTPStatus.OK, {"analises": list(ANALISES) + list(ANALISES_DETALHE)}
+        if len(partes) != 2 or partes[0] != "analises":
+            return HTTPStatus.NOT_FOUND, {"erro": f"Caminho desconhecido: {url.path}"}
+
+        nome = partes[1]
+        if nome not in ANALISES and nome not in ANALISES_DETALHE:
+            return HTTPStatus.NOT_FOUND, {"erro": f"Análise desconhecida: {nome}"}
+        dados, agregados = self.dados, self.agregados
+        if agregados is None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"erro": "Os dados ainda não foram carregados"}
+        if nome in ANALISES:
+            analise = getattr(agregados, nome)
+        else:
+            analise = functools.partial(ANALISES_DETALHE[nome], dados)
+        # Os parâmetros são verificados antes de correr a análise: uma exceção da análise é um erro do servidor
+        try:
+            parametros = {chave: _converter_parametro(chave, valor) for chave, valor in parse_qsl(url.query)}
+            inspect.signature(analise).bind(**parametros)
+        # Valores inválidos (ValueError) ou parâmetros que a análise não aceita ou que faltam (TypeError)
+        except (TypeError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {"erro": str(e)}
+        if nome in ANALISES:
+            resultado = analise(**parametros)
+        else:
+            with self._trinco_dados:
+                resultado = analise(**parametros)
+        return HTTPStatus.OK, {"analise": nome, "resultado": resultado}
+
+    async def _atender(self, leitor, escritor):
+        """Atende uma ligação (HTTP/1.1, com keep-alive): lê os pedidos e escreve as respostas em JSON."""
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                cabecalhos = {}
+                while True:
+                    cabecalho = await leitor.readline()
+                    if cabecalho in (b"\r\n", b"\n", b""):
+                        break
+                    if len(cabecalho) > _TAMANHO_MAXIMO_LINHA:
+                        raise ValueError("Cabeçalho demasiado longo")
+                    chave, _, valor = cabecalho.decode("latin-1").partition(":")
+                    cabecalhos[chave.strip().lower()] = valor.strip().lower()
+
+                partes = linha.decode("latin-1").split()
+                if len(linha) > _TAMANHO_MAXIMO_LINHA or len(partes) != 3:
+                    estado, corpo = HTTPStatus.BAD_REQUEST, {"erro": "Pedido HTTP inválido"}
+                elif partes[0] != "GET":
+                    estado, corpo = HTTPStatus.METHOD_NOT_ALLOWED, {"erro": "Só são aceites pedidos GET"}
+                else:
+                    try:
+                        # As análises correm numa thread para não bloquear as outras ligações
+                        loop = asyncio.get_running_loop()
+                        estado, corpo = await loop.run_in_executor(None, self.responder, partes[1])
+                    except Exception as e:
+                        # Um erro numa análise não pode parar o servidor
+                        estado, corpo = HTTPStatus.INTERNAL_SERVER_ERROR, {"erro": f"{type(e).__name__}: {e}"}
+
+                fechar = cabecalhos.get("connection") == "close" or (len(partes) == 3 and partes[2] == "HTTP/1.0")
+                dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+                escritor.write((f"HTTP/1.1 {estado.value} {estado.phrase}\r\n"
+                                "Content-Type: application/json; charset=utf-8\r\n"
+                                f"Content-Length: {len(dados)}\r\n"
+                                f"Connection: {'close' if fechar else 'keep-alive'}\r\n\r\n").encode("latin-1") + dados)
+                await escritor.drain()
+                if fechar:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _vigiar_ficheiro(self):
+        """Recarrega os dados quando o CSV muda. Só recarrega quando o ficheiro tiver o mesmo tamanho e data em duas
+        verificações seguidas, para não ler um ficheiro que ainda está a ser escrito."""
+        anterior = self._estado_carregado
+        while True:
+            await asyncio.sleep(self.intervalo_recarga)
+            atual = _estado_ficheiro(self.caminho)
+            if atual is not None and atual != self._estado_carregado and atual == anterior:
+                try:
+                    # O carregamento corre numa thread para que as consultas continuem a ser respondidas
+                    await asyncio.get_running_loop().run_in_executor(None, self.carregar)
+                    self.recargas += 1
+                except Exception as e:
+                    # Se o novo ficheiro não puder ser lido, continua a responder com os dados anteriores
+                    print(f"AVISO: Não foi possível recarregar os dados: {e}")
+            anterior = atual
+
+    async def servir(self, endereco=ENDERECO_PADRAO, porta=PORTA_PADRAO, pronto=None):
+        """Carrega os dados (se ainda não estiverem carregados) e atende pedidos até ser cancelado.
+        Args:
+            endereco, porta ==> Endereço e porta onde o servidor escuta
+            pronto ==> Função opcional chamada com a porta quando o servidor está pronto a receber pedidos"""
+        if self.agregados is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.carregar)
+        servidor = await asyncio.start_server(self._atender, endereco, porta)
+        vigia = asyncio.ensure_future(self._vigiar_ficheiro()) if self.intervalo_recarga else None
+        try:
+            if pronto is not None:
+                pronto(servidor.sockets[0].getsockname()[1])
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            if vigia is not None:
+                vigia.cancel()
+
+
+def executar_servidor(caminho, endereco=ENDERECO_PADRAO, porta=PORTA_PADRAO, sem_duplicados=False,
+                      intervalo_recarga=INTERVALO_RECARGA):
+    """Arranca o servidor de consultas e bloqueia até ser interrompido (Ctrl+C).
+    Raises:
+        FileNotFoundError se o CSV não existir; OSError se não for possível escutar na porta."""
+    servidor = ServidorAnalises(caminho, sem_duplicados, intervalo_recarga)
+    servidor.carregar()
+    try:
+        asyncio.run(servidor.servir(endereco, porta,
+                                    lambda porta_usada: print(f"Servidor pronto em http://{endereco}:{porta_usada}")))
+    except KeyboardInterrupt:
+        pass
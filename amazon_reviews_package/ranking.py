@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Rankings (Top K)"""
+
+"""Este ficheiro reúne a lógica de ranking usada pelas análises (Top 10 de utilizadores, de produtos, ...).
+Em vez de ordenar o dicionário de resultados completo, usa um heap (heapq) que só guarda os K melhores elementos,
+o que custa O(N log K) em vez de O(N log N)."""
+
+import heapq
+
+
+def _chave_ordenacao(item):
+    """Ordena por valor decrescente e, em caso de empate, pela chave (como string) crescente.
+    Assim o resultado não depende da ordem pela qual as reviews foram lidas."""
+    chave, valor = item
+    return -valor, str(chave)
+
+
+def top_k(resultado, k=10, suporte=None, minimo_suporte=None):
+    """Devolve os K elementos com maior valor de um dicionário de resultados.
+    Args:
+        resultado ==> Dicionário {chave: valor numérico} (ex: {user_id: média})
+        k ==> Número de elementos a devolver (None devolve todos, ordenados)
+        suporte ==> Dicionário opcional {chave: número de reviews} usado pelo filtro minimo_suporte
+        minimo_suporte ==> Se for dado, só entram no ranking as chaves com suporte >= minimo_suporte
+        (ex: produtos com pelo menos N reviews)
+    Returns:
+        Lista de tuplos (chave, valor) por ordem decrescente de valor (empates desfeitos pela chave)."""
+    itens = resultado.items()
+    if minimo_suporte is not None:
+        if suporte is None:
+            suporte = resultado
+        itens = [(chave, valor) for chave, valor in itens if suporte.get(chave, 0) >= minimo_suporte]
+    if k is None:
+        return sorted(itens, key=_chave_ordenacao)
+    return heapq.nsmallest(k, itens, key=_chave_ordenacao)
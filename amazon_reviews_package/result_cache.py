@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Cache de Resultados"""
+
+"""Este ficheiro guarda os resultados das funções de análise, para que repetir a mesma opção do menu (com os mesmos
+dados e os mesmos argumentos) devolva o resultado imediatamente em vez de o voltar a calcular.
+
+Cada resultado é identificado pela função, pela versão dos dados e pelos argumentos (ex: top_n, period, period_format).
+A versão dos dados é a impressão digital do CSV de origem (ReviewTable.origem, definida pelo data_loader); uma tabela
+criada ou alterada em memória tem uma versão própria que muda sempre que a tabela muda. Listas e geradores de reviews
+não são guardados, porque podem mudar (ou ser consumidos) sem que seja possível detetá-lo.
+
+Há dois níveis:
+    memória ==> os últimos TAMANHO_MAXIMO resultados usados (LRU: o menos usado recentemente sai primeiro)
+    disco   ==> opcional (configurar_cache_resultados(pasta=...)), um ficheiro pickle por resultado, para que os
+                resultados sobrevivam entre sessões. Só os dados lidos de um CSV são guardados em disco.
+Em memória cada resultado fica serializado (pickle), tal como no disco: cada chamada recebe uma cópia própria, por isso
+alterar um resultado devolvido (ex: retirar elementos de um ranking) não afeta as chamadas seguintes."""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import weakref
+from collections import OrderedDict
+from itertools import count
+
+from review_table import ReviewTable
+
+# Número máximo de resultados guardados em memória
+TAMANHO_MAXIMO = 128
+# Número máximo de resultados guardados em disco (saem primeiro os usados há mais tempo)
+MAXIMO_DISCO = 1024
+PASTA_PADRAO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache_resultados")
+
+_memoria = OrderedDict()
+_tamanho_maximo = TAMANHO_MAXIMO
+_pasta_disco = None
+
+# Versão das tabelas que não vieram de um CSV: {tabela: número único}, libertado quando a tabela deixa de existir
+_identificadores = weakref.WeakKeyDictionary()
+_proximo_identificador = count()
+
+
+def configurar_cache_resultados(tamanho_maximo=TAMANHO_MAXIMO, pasta=None):
+    """Configura a cache de resultados.
+    Args:
+        tamanho_maximo ==> Número máximo de resultados em memória (0 desativa a cache em memória)
+        pasta ==> Pasta do nível em disco (None desativa o nível em disco)"""
+    global _tamanho_maximo, _pasta_disco
+    _tamanho_maximo = tamanho_maximo
+    _pasta_disco = pasta
+    while len(_memoria) > _tamanho_maximo:
+        _memoria.popitem(last=False)
+
+
+def limpar_cache_resultados():
+    """Esquece todos os resultados guardados em memória (os ficheiros em disco não são apagados)."""
+    _memoria.clear()
+
+
+def versao_dados(dados):
+    """Identifica a versão dos dados.
+    Returns:
+        Um tuplo ("csv", impressão digital) para dados lidos de um CSV, ("memoria", identificador, linhas) para outras
+        ReviewTables, ou None se os dados não puderem ser guardados na cache (listas, geradores, ...)."""
+    if not isinstance(dados, ReviewTable):
+        return None
+    if dados.origem is not None:
+        return "csv", dados.origem
+    if dados not in _identificadores:
+        _identificadores[dados] = next(_proximo_identificador)
+    return "memoria", _identificadores[dados], len(dados)
+
+
+def _caminho_disco(chave):
+    """Nome do ficheiro do nível em disco para a chave (SHA-1 da sua representação)."""
+    return os.path.join(_pasta_disco, hashlib.sha1(repr(chave).encode("utf-8")).hexdigest() + ".pickle")
+
+
+def _ler_disco(chave):
+    """Lê o resultado da chave do nível em disco. Devolve (True, resultado) ou (False, None) se não existir."""
+    caminho = _caminho_disco(chave)
+    try:
+        with open(caminho, "rb") as file:
+            chave_guardada, resultado = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return False, None
+    if chave_guardada != chave:
+        return False, None
+    try:
+        # Marca o ficheiro como usado agora (a limpeza apaga os usados há mais tempo)
+        os.utime(caminho)
+    except OSError:
+        pass
+    return True, resultado
+
+
+def _escrever_disco(chave, resultado):
+    """Guarda o resultado no nível em disco. Uma falha a escrever nunca interrompe a análise."""
+    caminho = _caminho_disco(chave)
+    try:
+        os.makedirs(_pasta_disco, exist_ok=True)
+        # Escreve para um ficheiro temporário e só depois o renomeia, para nunca deixar um ficheiro a meio
+        with open(caminho + ".tmp", "wb") as file:
+            pickle.dump((chave, resultado), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(caminho + ".tmp", caminho)
+
+        ficheiros = [os.path.join(_pasta_disco, nome) for nome in os.listdir(_pasta_disco) if nome.endswith(".pickle")]
+        if len(ficheiros) > MAXIMO_DISCO:
+            ficheiros.sort(key=os.path.getmtime)
+            for antigo in ficheiros[:len(ficheiros) - MAXIMO_DISCO]:
+                os.remove(antigo)
+    except (OSError, pickle.PicklingError):
+        pass
+
+
+def memorizado(funcao):
+    """Decorador que guarda os resultados da função na cache de resultados.
+    O primeiro argumento da função é o conjunto de reviews; os restantes argumentos fazem parte da chave (com os valores
+    por omissão aplicados, por isso f(dados, 10) e f(dados, top_n=10) partilham o resultado)."""
+    assinatura = inspect.signature(funcao)
+    nome = f"{funcao.__module__}.{funcao.__qualname__}"
+
+    @functools.wraps(funcao)
+    def envolvida(*args, **kwargs):
+        versao = versao_dados(args[0]) if args else None
+        if versao is None or (_tamanho_maximo <= 0 and _pasta_disco is None):
+            return funcao(*args, **kwargs)
+        argumentos = assinatura.bind(*args, **kwargs)
+        argumentos.apply_defaults()
+        chave = (nome, versao, tuple(argumentos.arguments.items())[1:])
+        try:
+            hash(chave)
+        except TypeError:
+            # Argumentos que não podem ser comparados (ex: listas) não são guardados
+            return funcao(*args, **kwargs)
+
+        if chave in _memoria:
+            _memoria.move_to_end(chave)
+            return pickle.loads(_memoria[chave])
+
+        em_disco = _pasta_disco is not None and versao[0] == "csv"
+        encontrado, resultado = _ler_disco(chave) if em_disco else (False, None)
+        if not encontrado:
+            resultado = funcao(*args, **kwargs)
+            if em_disco:
+                _escrever_disco(chave, resultado)
+
+        if _tamanho_maximo > 0:
+            try:
+                # Guarda uma cópia serializada: o resultado devolvido agora pode ser alterado por quem o recebe
+                _memoria[chave] = pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # Resultados que não podem ser copiados não são guardados em memória
+                return resultado
+            if len(_memoria) > _tamanho_maximo:
+                _memoria.popitem(last=False)
+        return resultado
+    return envolvida
@@ -3,50 +3,84 @@
 
 """Este ficheiro analisa as reviews, calculando as estatísticas das mesmas."""
 
-def contar_distribuicao_scores(dados):
+from instrumentation import instrumentado
+from ranking import top_k
+from result_cache import memorizado
+from review_table import ReviewTable, filtrar_linhas, iterar_campos, iterar_coluna
+from sketches import CountMinSketch, HyperLogLog, SpaceSaving
+from weighted_scoring import scores_ponderados
+
+
+def _aplicar_ranking(resultado, top_n, minimo_reviews, reviews_por_chave):
+    """Função interna que limita o resultado de uma análise aos top_n melhores (ver ranking.top_k).
+    Se top_n e minimo_reviews forem None devolve o resultado completo, tal como antes."""
+    if top_n is None and minimo_reviews is None:
+        return resultado
+    return dict(top_k(resultado, top_n, reviews_por_chave, minimo_reviews))
+
+
+def _medias_por_codigo(dados, campo):
+    """Função interna que calcula a média dos scores por valor do campo numa ReviewTable, usando os códigos da coluna
+    (ver review_table.ColunaCategorica) como posições de listas em vez de dicionários indexados pelas strings.
+    Returns:
+        Tuplo (médias, contagens): dicionários {valor: média} e {valor: número de reviews}, pela ordem em que cada
+        valor aparece pela primeira vez."""
+    codes, valores = dados.codigos(campo)
+    somas = [0] * len(valores)
+    contagens = [0] * len(valores)
+    for code, score in zip(codes, dados.coluna("Score")):
+        somas[code] += score
+        contagens[code] += 1
+    # Só no fim os códigos são convertidos nos valores (as strings já existem, não são criadas de novo)
+    medias = {valores[code]: somas[code] / contagem for code, contagem in enumerate(contagens) if contagem}
+    return medias, {valores[code]: contagem for code, contagem in enumerate(contagens) if contagem}
+
+
+@instrumentado
+@memorizado
+def contar_distribuicao_scores(dados, linhas=None):
     """Esta função conta o número de reviews para cada score de 1 a 5.
     Args:
-        dados ==> lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        linhas ==> Posições opcionais das reviews a considerar (ex: resultado de uma pesquisa no text_index.py)
 
     Returns:
         Dicionário no formato {Score (em int): contagem (em int}
         sendo a key do dicionário o Score o value atribuido a essa key é o número de vezes que esse Score é encontrado nas reviews"""
     # Dicionário que armazena a contagem de cada score
     distribuicao = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    dados = filtrar_linhas(dados, linhas)
     if not dados:
         return distribuicao
-    # Itera sobre cada review
-    for review in dados:
-        try:
-            # Tira a nota ("Score") de cada review
-            score = review.get("Score")
-            score = int(score)
-            # Verifica se o score é um valor válido (entre 1 e 5) e soma ao value do score no dicionário "distribuição"
-            if score in distribuicao:
-                distribuicao[score] += 1
-        # Apanha erros se o Score não for um número (str, etc...)
-        except (ValueError, TypeError):
-            continue
+    # Itera sobre a nota ("Score") de cada review (as reviews cujo Score não é um número são ignoradas)
+    for (score,) in iterar_campos(dados, "Score"):
+        # Verifica se o score é um valor válido (entre 1 e 5) e soma ao value do score no dicionário "distribuição"
+        if score in distribuicao:
+            distribuicao[score] += 1
     return distribuicao
 
-def media_scores_por_utilizador(dados):
+@instrumentado
+@memorizado
+def media_scores_por_utilizador(dados, top_n=None, minimo_reviews=None):
     """Esta função calcula a media de avaliações por utilizador
        Args:
-       dados ==> Lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+       dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+       top_n ==> Se for dado, devolve apenas os top_n utilizadores com maior média (ordenados)
+       minimo_reviews ==> Se for dado, só entram no ranking os utilizadores com pelo menos este número de reviews
 
        Returns:
            Dicionário no formato score_medio_por_user = {userid (em str): media (em float)}
            sendo o userid a key do dicionário que indica o nome do id do utilizador e o valor dessa key a média entre a soma dos scores desse user e as reviews feitas por esse user"""
+    if isinstance(dados, ReviewTable):
+        # Numa ReviewTable a soma é feita por código do UserId, sem dicionários
+        score_medio_por_user, reviews_contadas = _medias_por_codigo(dados, "UserId")
+        return _aplicar_ranking(score_medio_por_user, top_n, minimo_reviews, reviews_contadas)
+
     scores_totais = {}
     reviews_contadas = {}
     score_medio_por_user = {}
 
-    for review in dados:
-        try:
-            score = int(review.get("Score"))
-            user_id = review.get("UserId")
-        except (ValueError, TypeError):
-            continue
+    for user_id, score in iterar_campos(dados, "UserId", "Score"):
         # Se o Id do user ja estiver presente no dicionario scores_totais, soma-se o valor da nova review à antiga e adiciona-se 1 ao número de reviews feitas pelo user
         if user_id in scores_totais:
             scores_totais[user_id] += score
@@ -63,45 +97,145 @@ def media_scores_por_utilizador(dados):
         media = soma_scores / contagem_reviews
         # Armazenamos a média calculada no dicionário final, usando o UserId como chave.
         score_medio_por_user[user_id] = media
-    return score_medio_por_user
+    return _aplicar_ranking(score_medio_por_user, top_n, minimo_reviews, reviews_contadas)
+
+def _reviews_de(dados, campo, valor):
+    """Função interna que devolve as reviews (dicionários) com o valor indicado no campo, pela ordem do ficheiro.
+    Numa ReviewTable usa o índice secundário da coluna (O(k)); numa lista de dicionários percorre as reviews."""
+    if isinstance(dados, ReviewTable):
+        return [dados[linha] for linha in dados.indice(campo).linhas_de(valor)]
+    return [review for review in dados if review.get(campo) == valor]
+
+
+def _estatisticas_de(dados, campo, valor):
+    """Função interna que calcula as estatísticas das reviews com o valor indicado no campo (ver estatisticas_utilizador)."""
+    if isinstance(dados, ReviewTable):
+        # Só lê as colunas necessárias, nas posições dadas pelo índice
+        linhas = dados.indice(campo).linhas_de(valor)
+        scores = dados.coluna("Score")
+        votos = dados.coluna("HelpfulnessNumerator")
+        tempos = dados.coluna("Time")
+        registos = [(scores[linha], votos[linha], tempos[linha]) for linha in linhas]
+    else:
+        registos = list(iterar_campos(_reviews_de(dados, campo, valor), "Score", "HelpfulnessNumerator", "Time",
+                                      padroes={"HelpfulnessNumerator": 0}))
+
+    distribuicao = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
+    for score, _, _ in registos:
+        if score in distribuicao:
+            distribuicao[score] += 1
+    return {
+        "reviews": len(registos),
+        "score_medio": sum(score for score, _, _ in registos) / len(registos) if registos else None,
+        "distribuicao_scores": distribuicao,
+        "votos_uteis": sum(votos_uteis for _, votos_uteis, _ in registos),
+        # Histórico (Time, Score) por ordem cronológica
+        "historico_scores": sorted((tempo, score) for score, _, tempo in registos),
+    }
+
+
+@instrumentado
+def reviews_do_utilizador(dados, user_id):
+    """Esta função devolve todas as reviews de um utilizador
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        user_id ==> O UserId do utilizador
+    Returns:
+        Lista de dicionários (reviews) do utilizador, pela ordem do ficheiro (vazia se o utilizador não existir)"""
+    return _reviews_de(dados, "UserId", user_id)
+
+
+@instrumentado
+@memorizado
+def estatisticas_utilizador(dados, user_id):
+    """Esta função calcula as estatísticas das reviews de um utilizador, sem percorrer as reviews dos outros
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        user_id ==> O UserId do utilizador
+    Returns:
+        Dicionário com "reviews" (número), "score_medio" (None se não houver reviews), "distribuicao_scores"
+        ({Score: contagem}), "votos_uteis" (soma do HelpfulnessNumerator) e "historico_scores" (lista de tuplos
+        (Time, Score) por ordem cronológica)"""
+    return _estatisticas_de(dados, "UserId", user_id)
 
-def avaliacao_maxima (dados):
+
+@instrumentado
+@memorizado
+def avaliacao_maxima (dados, top_n=None, minimo_reviews=None, aproximado=False):
     """Esta função identifica os produtos com maior número de avaliações com score 5
     Args:
-        dados ==> Lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        top_n ==> Se for dado, devolve apenas os top_n produtos com mais avaliações com score 5 (ordenados)
+        minimo_reviews ==> Se for dado, só entram no ranking os produtos com pelo menos este número de reviews (de qualquer score)
+        aproximado ==> Se True, conta as avaliações com score 5 num resumo Space-Saving e o número de reviews (para
+        minimo_reviews) num Count-Min Sketch, ambos de memória fixa (ver sketches.py)
     Returns:
         Dicionário (avl_max) dos produtos com reviews com 5 de score (contando o número de vezes que cada produto teve score = 5)"""
+    if aproximado:
+        resumo = SpaceSaving()
+        sketch_reviews = CountMinSketch() if minimo_reviews is not None else None
+        for product_id, score in iterar_campos(dados, "ProductId", "Score"):
+            if sketch_reviews is not None:
+                sketch_reviews.adicionar(product_id)
+            if score == 5:
+                resumo.adicionar(product_id)
+        avl_max = resumo.itens()
+        reviews_por_produto = None
+        if sketch_reviews is not None:
+            reviews_por_produto = {product_id: sketch_reviews.estimar(product_id) for product_id in avl_max}
+        return _aplicar_ranking(avl_max, top_n, minimo_reviews, reviews_por_produto)
+
     avl_max = {}
-    for review in dados:
-        try:
-            score = int(review.get("Score"))
-            product_id = review.get("ProductId")
-        except (ValueError, TypeError):
-            continue
+    # Número total de reviews de cada produto (usado pelo filtro minimo_reviews)
+    reviews_por_produto = {}
+    for product_id, score in iterar_campos(dados, "ProductId", "Score"):
+        reviews_por_produto[product_id] = reviews_por_produto.get(product_id, 0) + 1
         if score == 5:
             # Se a chave existir, soma 1 à contagem. Se for um produto novo, inicia a contagem em 1
             avl_max[product_id] = avl_max.get(product_id, 0) + 1
-    return avl_max
+    return _aplicar_ranking(avl_max, top_n, minimo_reviews, reviews_por_produto)
+
+
+@instrumentado
+@memorizado
+def contar_produtos_distintos(dados, aproximado=False):
+    """Esta função conta os produtos distintos
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        aproximado ==> Se True, usa um HyperLogLog (16 KB, erro típico de ~0.8%) em vez de guardar todos os ProductId
+    Returns:
+        O número (em int) de ProductId distintos"""
+    if aproximado:
+        sketch = HyperLogLog()
+        for product_id in iterar_coluna(dados, "ProductId"):
+            sketch.adicionar(product_id)
+        return sketch.contar()
+    return len(set(iterar_coluna(dados, "ProductId")))
 
 
-def media_scores_por_produto(dados):
+@instrumentado
+@memorizado
+def media_scores_por_produto(dados, top_n=None, minimo_reviews=None, linhas=None):
     """Esta função calcula a media de scores por produto
         Args:
-            dados ==> Lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+            dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+            top_n ==> Se for dado, devolve apenas os top_n produtos com maior média (ordenados)
+            minimo_reviews ==> Se for dado, só entram no ranking os produtos com pelo menos este número de reviews
+            linhas ==> Posições opcionais das reviews a considerar (ex: resultado de uma pesquisa no text_index.py)
         Returns:
             Dicionário no formato score_media_por_produto = {productid (em str) : score (em float)},
             sendo a key do dicionário o id do produto e o value atribuido a essa key a media de scores atribuida esse produto"""
+    dados = filtrar_linhas(dados, linhas)
+    if isinstance(dados, ReviewTable):
+        # Numa ReviewTable a soma é feita por código do ProductId, sem dicionários
+        score_medio_por_produto, quantidade_scores = _medias_por_codigo(dados, "ProductId")
+        return _aplicar_ranking(score_medio_por_produto, top_n, minimo_reviews, quantidade_scores)
+
     soma_scores = {}
     quantidade_scores = {}
     score_medio_por_produto = {}
 
-    for review in dados:
-        try:
-            product_id = review.get("ProductId")
-            score = int(review.get("Score"))
-        except (ValueError, TypeError):
-            continue
-
+    for product_id, score in iterar_campos(dados, "ProductId", "Score"):
         # Se o Id do Produto já estiver presente no dicionario soma_scores,
         # soma-se o valor da nova review à antiga. Caso o Id do Protudo ser novo no dicionário mantém-se o valor do score obtido
         if product_id in soma_scores:
@@ -121,63 +255,96 @@ def media_scores_por_produto(dados):
         contagem = quantidade_scores[product_id]
         media = soma / contagem
         score_medio_por_produto[product_id] = media
-    # Não limitamos aqui, devolve todos
-    return score_medio_por_produto
+    # Por omissão não limitamos aqui, devolve todos
+    return _aplicar_ranking(score_medio_por_produto, top_n, minimo_reviews, quantidade_scores)
+
+
+@instrumentado
+def reviews_do_produto(dados, product_id):
+    """Esta função devolve todas as reviews de um produto
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        product_id ==> O ProductId do produto
+    Returns:
+        Lista de dicionários (reviews) do produto, pela ordem do ficheiro (vazia se o produto não existir)"""
+    return _reviews_de(dados, "ProductId", product_id)
+
+
+@instrumentado
+@memorizado
+def estatisticas_produto(dados, product_id):
+    """Esta função calcula as estatísticas das reviews de um produto, incluindo o histórico dos seus scores
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+        product_id ==> O ProductId do produto
+    Returns:
+        Dicionário no mesmo formato de estatisticas_utilizador"""
+    return _estatisticas_de(dados, "ProductId", product_id)
 
 
-def calculo_score_medio_ponderado(dados):
+@instrumentado
+@memorizado
+def calculo_score_medio_ponderado(dados, top_n=None, minimo_reviews=None, suavizacao=None, peso_prior=None):
     """Esta funcão calcula o score médio ponderado por utilidade da avaliação.
        Args:
-           dados ==> Lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+           dados ==> ReviewTable ou lista de dicionários (reviews) (criada pela função presente no data_loader.py)
+           top_n ==> Se for dado, devolve apenas os top_n produtos com maior score ponderado (ordenados)
+           minimo_reviews ==> Se for dado, só entram no ranking os produtos com pelo menos este número de reviews
+           suavizacao ==> None (média ponderada simples), "bayes" (média bayesiana) ou "wilson" (limite inferior de
+           Wilson), ver weighted_scoring.py. Os modos suavizados evitam que um produto com uma única review muito
+           votada fique no topo do ranking
+           peso_prior ==> Peso do prior no modo "bayes" (por omissão a média dos votos úteis por produto)
        Returns:
+           Dicionário no formato {productid (em str): score médio ponderado (em float)}. Sem suavização ficam de fora
+           os produtos que não têm nenhum voto útil"""
 
-           """
-
-    # Este dicionário irá conter o somatório da soma ponderada de scores (Score * HelpfullnessNumerator)
-    soma_ponderada_scores = {}
-    # Este dicionário irá conter o somatório dos voto uteis (HelpfullnessNumerator)
-    soma_votos_uteis = {}
-
-    for review in dados:
-        score_str = review.get("Score")
-        product_id = review.get("ProductId")
-        votos_uteis_str = review.get("HelpfulnessNumerator")
-        # Conversão de tipos
-        try:
-            score = float(score_str)
-            votos_uteis = int(votos_uteis_str)
-        # No caso da conversão falhar, ignora a review e avança para a próxima.
-        except (ValueError, TypeError):
-            continue
-        # Ignora a review se o Id do Produto estiver em falta ou for inválido.
-        if not product_id:
-            continue
-
-        score_ponderado = score * votos_uteis
-
-        # Se o Id do produto já estiver presente no dicionário "soma_ponderada_scores"
-        # soma-se o valor do score_ponderado ao value já atribuido à key product_id caso contrário o value da key fica igual ao valor do score_ponderado atual
-        if product_id in soma_ponderada_scores:
-            soma_ponderada_scores[product_id] += score_ponderado
-        else:
-            soma_ponderada_scores[product_id] = score_ponderado
-
-        # Se o Id do produto já estiver presente no dicionário "soma_votos_uteis"
-        # soma-se o valor do votos_uteis ao value já atribuido à key product_id caso contrário o value da key fica igual ao valor de votos_uteis atual
-        if product_id in soma_votos_uteis:
-            soma_votos_uteis[product_id] += votos_uteis
-        else:
-            soma_votos_uteis[product_id] = votos_uteis
-
-    score_medio_ponderado = {}
+    # Somas por produto em listas alinhadas pela posição (código) de cada produto, numa única passagem:
+    # número de reviews, soma ponderada de scores (Score * HelpfullnessNumerator) e soma dos votos úteis
+    if isinstance(dados, ReviewTable):
+        # Numa ReviewTable a posição é o código do ProductId (ver review_table.ColunaCategorica), sem dicionários
+        codes, produtos = dados.codigos("ProductId")
+        reviews = [0] * len(produtos)
+        soma_ponderada_scores = [0] * len(produtos)
+        soma_votos_uteis = [0] * len(produtos)
+        for posicao, score, votos_uteis in zip(codes, dados.coluna("Score"), dados.coluna("HelpfulnessNumerator")):
+            reviews[posicao] += 1
+            soma_ponderada_scores[posicao] += score * votos_uteis
+            soma_votos_uteis[posicao] += votos_uteis
+        if not all(produtos):
+            # Ignora as reviews sem Id do Produto, como nas listas de dicionários: o código do Id vazio sai das listas
+            # (também não pode contar como produto no prior do modo "bayes")
+            validos = [posicao for posicao, product_id in enumerate(produtos) if product_id]
+            produtos = [produtos[posicao] for posicao in validos]
+            reviews = [reviews[posicao] for posicao in validos]
+            soma_ponderada_scores = [soma_ponderada_scores[posicao] for posicao in validos]
+            soma_votos_uteis = [soma_votos_uteis[posicao] for posicao in validos]
+    else:
+        # As somas são acumuladas à medida que as reviews são lidas, para não guardar as reviews em memória
+        produtos = []
+        posicoes = {}
+        reviews = []
+        soma_ponderada_scores = []
+        soma_votos_uteis = []
 
-    for product_id in soma_ponderada_scores:
-        try:
-            media_ponderada = soma_ponderada_scores[product_id] / soma_votos_uteis[product_id]
-        # No caso de a divisão ser feita por zero, ignora o produto e avança para o próximo.
-        except ZeroDivisionError:
-            continue
-        # Atribuição do valor
-        score_medio_ponderado[product_id] = media_ponderada
+        # As reviews cujo Score ou HelpfulnessNumerator não são convertíveis em números são ignoradas
+        # (o Score é convertido com float, por isso valores como "4.0" são aceites).
+        for product_id, score, votos_uteis in iterar_campos(dados, "ProductId", "Score", "HelpfulnessNumerator",
+                                                            conversores={"Score": float}):
+            # Ignora a review se o Id do Produto estiver em falta ou for inválido.
+            if not product_id:
+                continue
+            posicao = posicoes.get(product_id)
+            if posicao is None:
+                posicao = posicoes[product_id] = len(produtos)
+                produtos.append(product_id)
+                reviews.append(0)
+                soma_ponderada_scores.append(0)
+                soma_votos_uteis.append(0)
+            reviews[posicao] += 1
+            soma_ponderada_scores[posicao] += score * votos_uteis
+            soma_votos_uteis[posicao] += votos_uteis
 
-    return score_medio_ponderado
\ No newline at end of file
+    # Sem suavização são ignorados os produtos que não têm votos úteis (divisão por zero)
+    score_medio_ponderado = scores_ponderados(produtos, soma_ponderada_scores, soma_votos_uteis, suavizacao, peso_prior)
+    reviews_por_produto = dict(zip(produtos, reviews)) if minimo_reviews is not None else None
+    return _aplicar_ranking(score_medio_ponderado, top_n, minimo_reviews, reviews_por_produto)
\ No newline at end of file
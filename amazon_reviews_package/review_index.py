@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Índices Secundários"""
+
+"""Este ficheiro define os índices secundários da ReviewTable (por UserId e por ProductId), que permitem obter todas as
+reviews de um utilizador ou de um produto sem percorrer a tabela inteira.
+
+O índice está no formato CSR (compressed sparse row), com dois arrays para toda a tabela:
+    linhas  ==> posições das reviews na tabela, agrupadas por valor (dentro de cada grupo pela ordem do ficheiro)
+    offsets ==> o grupo do valor i ocupa linhas[offsets[i]:offsets[i + 1]]
+Assim a consulta de um valor com k reviews custa O(k), e o índice ocupa 8 bytes por review mais os valores distintos.
+O índice é guardado na cache binária (ver dataset_cache.py) para não ter de ser reconstruído em cada execução."""
+
+from array import array
+from itertools import accumulate
+
+# Colunas para as quais a ReviewTable disponibiliza índices secundários
+COLUNAS_INDEXADAS = ("UserId", "ProductId")
+
+
+class IndiceReviews:
+    """Índice secundário (CSR) de uma coluna categórica da ReviewTable."""
+
+    def __init__(self, valores, offsets, linhas):
+        """
+        Args:
+            valores ==> Lista dos valores distintos da coluna (o valor i corresponde ao grupo i)
+            offsets ==> array("q") com len(valores) + 1 posições, início de cada grupo em linhas
+            linhas ==> array("q") com as posições das reviews na tabela, agrupadas por valor
+        """
+        self.valores = valores
+        self.offsets = offsets
+        self.linhas = linhas
+        self._posicoes = {valor: i for i, valor in enumerate(valores)}
+
+    @classmethod
+    def de_codigos(cls, valores, codes):
+        """Constrói o índice a partir do código de cada review (posição do seu valor em valores), por counting sort.
+        Args:
+            valores ==> Lista dos valores distintos
+            codes ==> Sequência com o código de cada review (ex: o ficheiro .codes da cache)"""
+        contagens = [0] * len(valores)
+        for code in codes:
+            contagens[code] += 1
+        offsets = array("q", accumulate(contagens, initial=0))
+
+        # Cada review é colocada na próxima posição livre do grupo do seu valor
+        proxima = offsets[:-1]
+        linhas = array("q", bytes(8 * len(codes)))
+        for linha, code in enumerate(codes):
+            linhas[proxima[code]] = linha
+            proxima[code] += 1
+        return cls(valores, offsets, linhas)
+
+    @classmethod
+    def construir(cls, coluna):
+        """Constrói o índice de uma coluna (lista de valores, um por review)."""
+        codigos = {}
+        codes = array("i", (codigos.setdefault(valor, len(codigos)) for valor in coluna))
+        return cls.de_codigos(list(codigos), codes)
+
+    def linhas_de(self, valor):
+        """Devolve as posições (array) das reviews com o valor indicado, pela ordem do ficheiro (vazio se não houver)."""
+        i = self._posicoes.get(valor)
+        if i is None:
+            return array("q")
+        return self.linhas[self.offsets[i]:self.offsets[i + 1]]
+
+    def contagem(self, valor):
+        """Número de reviews com o valor indicado, em O(1)."""
+        i = self._posicoes.get(valor)
+        return 0 if i is None else self.offsets[i + 1] - self.offsets[i]
+
+    def __contains__(self, valor):
+        return valor in self._posicoes
+
+    def __len__(self):
+        """Número de valores distintos indexados."""
+        return len(self.valores)
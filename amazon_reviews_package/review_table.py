@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""Tabela de Reviews em Colunas"""
+
+"""Este ficheiro define a estrutura ReviewTable, que guarda as reviews por colunas em vez de uma lista de dicionários.
+Os campos numéricos ficam em arrays compactos (módulo array) e os identificadores repetidos (ProductId, UserId, ProfileName)
+são codificados por dicionário (ColunaCategorica): cada valor distinto existe uma única vez e cada review guarda só o
+código inteiro desse valor."""
+
+import sys
+from array import array
+from functools import partial
+
+from review_index import IndiceReviews
+from word_count import contar_palavras, contar_palavras_coluna
+
+# Campos numéricos e o typecode do array usado para os guardar
+COLUNAS_INTEIRAS = {
+    "Id": "q",
+    "HelpfulnessNumerator": "i",
+    "HelpfulnessDenominator": "i",
+    "Score": "b",
+    "Time": "q",
+    # Coluna calculada (não existe no CSV): número de palavras do Text (ver word_count.py)
+    "WordCount": "i",
+}
+# Campos de texto cujos valores se repetem muito ao longo das reviews (são internados)
+COLUNAS_CATEGORICAS = ("ProductId", "UserId", "ProfileName")
+# Campos de texto livre
+COLUNAS_TEXTO = ("Summary", "Text")
+
+# Colunas calculadas a partir de outras colunas, na primeira vez que são pedidas
+COLUNAS_DERIVADAS = ("WordCount",)
+
+# Ordem das colunas, igual à do ficheiro Reviews.csv
+ORDEM_COLUNAS = ("Id", "ProductId", "UserId", "ProfileName", "HelpfulnessNumerator", "HelpfulnessDenominator",
+                 "Score", "Time", "Summary", "Text")
+# Colunas que o data_loader carrega por omissão (as do CSV e as derivadas)
+TODAS_COLUNAS = ORDEM_COLUNAS + COLUNAS_DERIVADAS
+
+# Número total de reviews ignoradas por terem valores inválidos, desde o início do programa (lido pela instrumentação)
+contagem_ignoradas = 0
+
+
+def registar_ignoradas(n):
+    """Soma n reviews ignoradas à contagem global contagem_ignoradas."""
+    global contagem_ignoradas
+    contagem_ignoradas += n
+
+
+class ColunaCategorica:
+    """Coluna codificada por dicionário: um array de códigos (um por review) e a lista dos valores distintos.
+
+    O valor da review i é valores[codes[i]] e os códigos são atribuídos pela ordem em que cada valor aparece pela
+    primeira vez. A coluna comporta-se como uma lista de strings (len, coluna[i], iteração), por isso o resto do código
+    não precisa de saber que está codificada; as agregações podem usar diretamente os códigos como posições de listas
+    (ver ReviewTable.codigos), sem calcular o hash das strings em cada review."""
+
+    def __init__(self, valores=None, codes=None):
+        """
+        Args:
+            valores ==> Lista opcional dos valores distintos (o código i corresponde a valores[i])
+            codes ==> array("i") opcional com o código de cada review
+        """
+        self.valores = valores if valores is not None else []
+        self.codes = codes if codes is not None else array("i")
+        # {valor: código}, só criado quando a coluna é alterada
+        self._codigos = None
+
+    def codigo(self, valor):
+        """Devolve o código do valor, acrescentando-o aos valores distintos (internado) se for novo."""
+        if self._codigos is None:
+            self._codigos = {valor: code for code, valor in enumerate(self.valores)}
+        code = self._codigos.get(valor)
+        if code is None:
+            code = self._codigos[valor] = len(self.valores)
+            self.valores.append(sys.intern(valor))
+        return code
+
+    def append(self, valor):
+        # Caminho rápido (valor já conhecido) sem a chamada a codigo(), porque é executado para cada review lida
+        code = self._codigos.get(valor) if self._codigos is not None else None
+        self.codes.append(self.codigo(valor) if code is None else code)
+
+    def extend(self, valores):
+        """Acrescenta valores no fim da coluna. Se for outra ColunaCategorica (ex: de outro processo) só os seus
+        valores distintos são traduzidos para os códigos desta coluna."""
+        if isinstance(valores, ColunaCategorica):
+            traducao = [self.codigo(valor) for valor in valores.valores]
+            self.codes.extend(map(traducao.__getitem__, valores.codes))
+        else:
+            self.codes.extend(map(self.codigo, valores))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self.valores[code] for code in self.codes[indice]]
+        return self.valores[self.codes[indice]]
+
+    def __iter__(self):
+        return map(self.valores.__getitem__, self.codes)
+
+    def __getstate__(self):
+        # O dicionário {valor: código} não é enviado para outros processos: é reconstruído se for preciso
+        return self.valores, self.codes
+
+    def __setstate__(self, estado):
+        self.valores, self.codes = estado
+        self._codigos = None
+
+
+def _coluna_vazia(nome):
+    """Cria a estrutura vazia adequada à coluna indicada (array para campos numéricos, ColunaCategorica para os
+    identificadores, lista para texto)."""
+    if nome in COLUNAS_INTEIRAS:
+        return array(COLUNAS_INTEIRAS[nome])
+    if nome in COLUNAS_CATEGORICAS:
+        return ColunaCategorica()
+    return []
+
+
+def _selecionar_coluna(coluna, linhas):
+    """Devolve uma coluna do mesmo tipo só com os valores nas posições indicadas."""
+    if isinstance(coluna, ColunaCategorica):
+        # Os valores distintos são partilhados; só os códigos são filtrados
+        return ColunaCategorica(coluna.valores, array("i", map(coluna.codes.__getitem__, linhas)))
+    if isinstance(coluna, array):
+        return array(coluna.typecode, map(coluna.__getitem__, linhas))
+    return list(map(coluna.__getitem__, linhas))
+
+
+def _selecionar_pendente(pendente, linhas):
+    """Lê uma coluna pendente e filtra-a (usada por ReviewTable.selecionar)."""
+    return _selecionar_coluna(pendente(), linhas)
+
+
+class ReviewTable:
+    """Conjunto de reviews guardado por colunas.
+
+    Cada coluna é um array (campos numéricos) ou uma lista (campos de texto) e todas têm o mesmo comprimento.
+    A tabela comporta-se como uma sequência de reviews: len(tabela), tabela[i] e "for review in tabela" devolvem
+    dicionários com as mesmas chaves que o data_loader sempre produziu.
+
+    Uma coluna pode também estar pendente: só é lida (ex: da cache binária) na primeira vez que é pedida, por isso uma
+    análise que só usa o Score e o Time nunca chega a ler os textos das reviews.
+
+    Para as colunas categóricas a tabela mantém também índices secundários (ver review_index.py), construídos ou lidos
+    da cache na primeira consulta, que dão as reviews de um utilizador ou produto sem percorrer a tabela."""
+
+    def __init__(self, colunas=None, pendentes=None, indices_pendentes=None):
+        """
+        Args:
+            colunas ==> Dicionário opcional {nome da coluna: array/lista}. Se não for dado cria uma tabela vazia com
+            todas as colunas do Reviews.csv.
+            pendentes ==> Dicionário opcional {nome da coluna: função sem argumentos que devolve a coluna}, para as
+            colunas que só devem ser lidas quando forem usadas. Uma tabela com colunas pendentes não deve ser alterada
+            (adicionar/estender).
+            indices_pendentes ==> Dicionário opcional {nome da coluna: função sem argumentos que devolve o
+            IndiceReviews da coluna, ou None se não o conseguir obter}, usado pela cache binária
+        """
+        if colunas is None:
+            colunas = {nome: _coluna_vazia(nome) for nome in ORDEM_COLUNAS}
+        self._colunas = colunas
+        self._pendentes = dict(pendentes or {})
+        self._indices = {}
+        self._indices_pendentes = dict(indices_pendentes or {})
+        # Número de linhas do CSV que não entraram na tabela por terem valores inválidos
+        self.linhas_ignoradas = 0
+        # Impressão digital do ficheiro de origem, usada como versão dos dados pela cache de resultados
+        # (ver result_cache.py). Passa a None quando a tabela é alterada
+        self.origem = None
+
+    @classmethod
+    def com_colunas(cls, nomes):
+        """Cria uma tabela vazia só com as colunas indicadas."""
+        return cls({nome: _coluna_vazia(nome) for nome in nomes})
+
+    @property
+    def nomes_colunas(self):
+        """Tuplo com os nomes das colunas presentes na tabela (incluindo as pendentes)."""
+        return tuple(self._colunas) + tuple(self._pendentes)
+
+    def coluna(self, nome):
+        """Devolve a coluna (array ou lista) com o nome indicado.
+        As colunas pendentes são lidas e as colunas derivadas (WordCount) são calculadas na primeira vez que são
+        pedidas, ficando depois guardadas na tabela.
+        Raises:
+            KeyError se a coluna não existir na tabela."""
+        if nome in self._pendentes:
+            self._colunas[nome] = self._pendentes.pop(nome)()
+        elif nome == "WordCount" and nome not in self._colunas and "Text" in self.nomes_colunas:
+            self._colunas[nome] = contar_palavras_coluna(self.coluna("Text"))
+        return self._colunas[nome]
+
+    def indice(self, nome):
+        """Devolve o índice secundário (IndiceReviews) da coluna indicada, lido da cache ou construído na primeira vez
+        que é pedido e guardado na tabela até esta ser alterada.
+        Raises:
+            KeyError se a coluna não existir na tabela."""
+        if nome not in self._indices:
+            pendente = self._indices_pendentes.pop(nome, None)
+            indice = pendente() if pendente is not None else None
+            if indice is None:
+                coluna = self.coluna(nome)
+                indice = IndiceReviews.de_codigos(coluna.valores, coluna.codes) if isinstance(coluna, ColunaCategorica) \
+                    else IndiceReviews.construir(coluna)
+            self._indices[nome] = indice
+        return self._indices[nome]
+
+    def codigos(self, nome):
+        """Devolve a coluna categórica indicada codificada: um tuplo (codes, valores), em que codes tem o código de cada
+        review e valores[code] é o valor correspondente.
+        Raises:
+            KeyError se a coluna não existir na tabela."""
+        coluna = self.coluna(nome)
+        if not isinstance(coluna, ColunaCategorica):
+            # Ex: tabela criada a partir de listas de strings
+            coluna = ColunaCategorica()
+            coluna.extend(self.coluna(nome))
+        return coluna.codes, coluna.valores
+
+    def _todas_colunas(self):
+        """Lê as colunas pendentes e devolve o dicionário com todas as colunas."""
+        for nome in list(self._pendentes):
+            self.coluna(nome)
+        return self._colunas
+
+    def projetar(self, nomes):
+        """Devolve uma nova tabela só com as colunas indicadas. As colunas são partilhadas (não são copiadas) e as
+        pendentes continuam pendentes.
+        Raises:
+            KeyError se alguma das colunas não existir na tabela."""
+        colunas = {}
+        pendentes = {}
+        for nome in nomes:
+            if nome in self._pendentes:
+                pendentes[nome] = self._pendentes[nome]
+            else:
+                colunas[nome] = self.coluna(nome)
+        tabela = ReviewTable(colunas, pendentes,
+                             {nome: f for nome, f in self._indices_pendentes.items() if nome in nomes})
+        tabela._indices = {nome: indice for nome, indice in self._indices.items() if nome in nomes}
+        tabela.linhas_ignoradas = self.linhas_ignoradas
+        tabela.origem = self.origem
+        return tabela
+
+    def selecionar(self, linhas):
+        """Devolve uma nova tabela só com as reviews nas posições indicadas (ex: as encontradas por uma pesquisa no
+        índice de texto, ver text_index.py), pela ordem dada. As colunas pendentes continuam pendentes: só são lidas e
+        filtradas quando forem usadas.
+        Args:
+            linhas ==> Sequência de posições de reviews desta tabela
+        Raises:
+            IndexError se alguma posição estiver fora dos limites da tabela."""
+        linhas = array("q", linhas)
+        if linhas and not 0 <= min(linhas) <= max(linhas) < len(self):
+            raise IndexError("posição da review fora dos limites da tabela")
+        colunas = {nome: _selecionar_coluna(coluna, linhas) for nome, coluna in self._colunas.items()}
+        pendentes = {nome: partial(_selecionar_pendente, pendente, linhas) for nome, pendente in self._pendentes.items()}
+        tabela = ReviewTable(colunas, pendentes)
+        tabela.linhas_ignoradas = self.linhas_ignoradas
+        return tabela
+
+    def adicionar(self, review):
+        """Acrescenta uma review (dicionário lido pelo csv.DictReader) à tabela, convertendo os campos numéricos.
+        Raises:
+            KeyError se faltar um campo; ValueError se um campo numérico não for um inteiro."""
+        # Converte primeiro todos os campos, para que uma review inválida não deixe colunas com comprimentos diferentes
+        valores = converter_review(review, self._colunas)
+        self.origem = None
+        if self._indices:
+            self._indices.clear()
+        for nome, valor in valores.items():
+            self._colunas[nome].append(valor)
+
+    def estender(self, outra):
+        """Acrescenta no fim desta tabela todas as reviews de outra tabela com as mesmas colunas."""
+        self.linhas_ignoradas += outra.linhas_ignoradas
+        self.origem = None
+        self._indices.clear()
+        if not len(self):
+            # Uma tabela vazia passa a ter também as colunas derivadas que a outra já calculou
+            for nome in outra.nomes_colunas:
+                self._colunas.setdefault(nome, _coluna_vazia(nome))
+        for nome, coluna in self._colunas.items():
+            # Numa ColunaCategorica os valores de outra tabela (ex: de outro processo) são traduzidos para os códigos
+            # desta tabela e internados
+            coluna.extend(outra.coluna(nome))
+
+    def __len__(self):
+        for coluna in self._colunas.values():
+            return len(coluna)
+        for nome in self._pendentes:
+            return len(self.coluna(nome))
+        return 0
+
+    def __getitem__(self, indice):
+        """Devolve a review na posição indicada como dicionário."""
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("índice da review fora dos limites da tabela")
+        return {nome: coluna[indice] for nome, coluna in self._todas_colunas().items()}
+
+    def __iter__(self):
+        colunas = self._todas_colunas()
+        nomes = tuple(colunas)
+        for valores in zip(*colunas.values()):
+            yield dict(zip(nomes, valores))
+
+
+def converter_review(review, nomes=ORDEM_COLUNAS):
+    """Converte uma review lida pelo csv.DictReader (só com strings) para os tipos usados na ReviewTable.
+    Args:
+        review ==> Dicionário {campo: string}
+        nomes ==> Campos a converter (por omissão todos os campos do Reviews.csv)
+    Returns:
+        Um novo dicionário com os campos numéricos em int e os categóricos internados.
+    Raises:
+        KeyError se faltar um campo; ValueError se um campo numérico não for um inteiro."""
+    valores = {}
+    for nome in nomes:
+        if nome == "WordCount":
+            valores[nome] = contar_palavras(review["Text"])
+        elif nome in COLUNAS_INTEIRAS:
+            valores[nome] = int(review[nome])
+        elif nome in COLUNAS_CATEGORICAS:
+            valores[nome] = sys.intern(review[nome])
+        else:
+            valores[nome] = review[nome]
+    return valores
+
+
+def filtrar_linhas(dados, linhas):
+    """Restringe as reviews às posições indicadas, para que uma análise só considere essas reviews.
+    Args:
+        dados ==> ReviewTable ou lista de dicionários (reviews)
+        linhas ==> Posições das reviews a manter (ex: resultado de IndiceTexto.procurar), ou None para manter todas
+    Returns:
+        Uma ReviewTable (ver ReviewTable.selecionar) ou lista só com essas reviews, ou os próprios dados se linhas for
+        None."""
+    if linhas is None:
+        return dados
+    if isinstance(dados, ReviewTable):
+        return dados.selecionar(linhas)
+    return [dados[linha] for linha in linhas]
+
+
+def iterar_campos(dados, *campos, padroes=None, conversores=None):
+    """Percorre as reviews devolvendo, para cada uma, um tuplo com os valores dos campos pedidos.
+
+    Com uma ReviewTable os valores vêm diretamente das colunas (já convertidos). Com uma lista de dicionários os campos
+    numéricos são convertidos para int e as reviews cujo valor não é convertível são ignoradas.
+    Os dados podem também ser qualquer iterável (ex: um gerador) de dicionários ou de lotes ReviewTable, como os
+    devolvidos por data_loader.iterar_reviews: são consumidos uma única vez, sem os guardar em memória.
+
+    Args:
+        dados ==> ReviewTable, lista de dicionários (reviews) ou iterável de reviews/lotes
+        campos ==> Nomes dos campos pretendidos (ex: "UserId", "Score")
+        padroes ==> Dicionário opcional {campo: valor} usado quando a review não tem esse campo
+        conversores ==> Dicionário opcional {campo: função} que substitui o int na conversão desse campo numa lista de
+        dicionários (ex: {"Score": float} aceita "4.0"); as reviews em que a função falha são ignoradas
+    Returns:
+        Um iterador de tuplos (valor_campo_1, valor_campo_2, ...)"""
+    if isinstance(dados, ReviewTable):
+        return zip(*(dados.coluna(campo) for campo in campos))
+    return _iterar_registos(dados, campos, padroes or {}, conversores or {})
+
+
+def iterar_coluna(dados, campo):
+    """Como iterar_campos, mas para um único campo: devolve os valores em vez de tuplos de um elemento.
+    Com uma ReviewTable devolve a própria coluna, o que permite usá-la diretamente em Counter, sum, etc."""
+    if isinstance(dados, ReviewTable):
+        return dados.coluna(campo)
+    return (valor for (valor,) in _iterar_registos(dados, (campo,), {}, {}))
+
+
+def _iterar_registos(reviews, campos, padroes, conversores):
+    """Versão de iterar_campos para listas (ou outros iteráveis) de dicionários e de lotes ReviewTable."""
+    for review in reviews:
+        if isinstance(review, ReviewTable):
+            # Lote de reviews: os valores vêm diretamente das colunas do lote
+            yield from zip(*(review.coluna(campo) for campo in campos))
+            continue
+        try:
+            valores = []
+            for campo in campos:
+                valor = review.get(campo, padroes.get(campo))
+                if campo == "WordCount" and valor is None:
+                    valor = contar_palavras(review.get("Text", ""))
+                elif campo in conversores:
+                    valor = conversores[campo](valor)
+                elif campo in COLUNAS_INTEIRAS:
+                    valor = int(valor)
+                valores.append(valor)
+        # Apanha reviews que não são dicionários ou com valores numéricos inválidos
+        except (AttributeError, ValueError, TypeError):
+            registar_ignoradas(1)
+            continue
+        yield tuple(valores)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Sketches Probabilísticos"""
+
+"""Este ficheiro define estruturas de memória fixa para o modo aproximado das análises (aproximado=True), para
+conjuntos de reviews tão grandes que não é possível guardar um contador por utilizador ou por produto.
+
+    SpaceSaving    ==> top-K dos elementos mais frequentes (heavy hitters) com no máximo `capacidade` contadores.
+                       Cada contagem devolvida sobrestima a real em no máximo N / capacidade (N = soma dos pesos), e
+                       qualquer elemento com contagem real > N / capacidade está garantidamente no resumo.
+    CountMinSketch ==> contagem aproximada de qualquer elemento numa matriz profundidade x largura. Nunca subestima;
+                       sobrestima em no máximo e * N / largura com probabilidade 1 - e^(-profundidade).
+    HyperLogLog    ==> número aproximado de elementos distintos com 2^precisao registos de um byte. Erro relativo
+                       típico de 1.04 / sqrt(2^precisao) (~0.8% com a precisão 14, em 16 KB).
+
+Todas as estruturas podem ser juntadas (juntar), tal como os Agregados, e usam um hash estável (BLAKE2b), igual em
+todos os processos e execuções."""
+
+import hashlib
+import heapq
+import math
+from array import array
+
+# Parâmetros por omissão do modo aproximado
+CAPACIDADE_PADRAO = 10000
+LARGURA_PADRAO = 1 << 16
+PROFUNDIDADE_PADRAO = 4
+PRECISAO_PADRAO = 14
+
+
+def _hash64(chave):
+    """Hash de 64 bits da chave, estável entre processos (ao contrário do hash() das strings)."""
+    return int.from_bytes(hashlib.blake2b(str(chave).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SpaceSaving:
+    """Resumo Space-Saving (Metwally et al.) para os K elementos mais frequentes de um fluxo."""
+
+    def __init__(self, capacidade=CAPACIDADE_PADRAO):
+        self.capacidade = capacidade
+        # {chave: [contagem, erro máximo]}
+        self.contadores = {}
+        # Heap (contagem, chave) para encontrar o menor contador; as entradas desatualizadas são ignoradas
+        self._heap = []
+        self.total = 0
+
+    def adicionar(self, chave, peso=1):
+        """Soma peso à contagem da chave."""
+        self.total += peso
+        contador = self.contadores.get(chave)
+        if contador is None:
+            if len(self.contadores) < self.capacidade:
+                contador = self.contadores[chave] = [0, 0]
+            else:
+                # Substitui o elemento com a menor contagem, herdando-a como erro máximo
+                minimo = self._remover_minimo()
+                contador = self.contadores[chave] = [minimo, minimo]
+        contador[0] += peso
+        heapq.heappush(self._heap, (contador[0], chave))
+        if len(self._heap) > 4 * self.capacidade:
+            self._heap = [(valores[0], c) for c, valores in self.contadores.items()]
+            heapq.heapify(self._heap)
+
+    def _remover_minimo(self):
+        """Remove o elemento com a menor contagem, devolvendo essa contagem."""
+        while True:
+            contagem, chave = heapq.heappop(self._heap)
+            contador = self.contadores.get(chave)
+            if contador is not None and contador[0] == contagem:
+                del self.contadores[chave]
+                return contagem
+
+    def estimar(self, chave):
+        """Contagem estimada da chave (0 se não estiver no resumo; nesse caso a real é no máximo o menor contador)."""
+        contador = self.contadores.get(chave)
+        return 0 if contador is None else contador[0]
+
+    def itens(self):
+        """Dicionário {chave: contagem estimada} dos elementos do resumo."""
+        return {chave: contador[0] for chave, contador in self.contadores.items()}
+
+    def juntar(self, outro):
+        """Soma ao resumo os contadores de outro resumo (ex: de outra partição das reviews)."""
+        self.total += outro.total
+        for chave, (contagem, erro) in outro.contadores.items():
+            atual = self.contadores.get(chave)
+            if atual is None:
+                self.contadores[chave] = [contagem, erro]
+            else:
+                atual[0] += contagem
+                atual[1] += erro
+        # Mantém só os `capacidade` maiores contadores
+        if len(self.contadores) > self.capacidade:
+            maiores = heapq.nlargest(self.capacidade, self.contadores.items(), key=lambda item: item[1][0])
+            self.contadores = dict(maiores)
+        self._heap = [(valores[0], c) for c, valores in self.contadores.items()]
+        heapq.heapify(self._heap)
+
+
+class CountMinSketch:
+    """Count-Min Sketch (Cormode e Muthukrishnan): contagens aproximadas em memória fixa."""
+
+    def __init__(self, largura=LARGURA_PADRAO, profundidade=PROFUNDIDADE_PADRAO):
+        self.largura = largura
+        self.profundidade = profundidade
+        self.tabela = array("q", bytes(8 * largura * profundidade))
+        self.total = 0
+
+    def _posicoes(self, chave):
+        # Duplo hashing (Kirsch-Mitzenmacher): as `profundidade` funções de hash saem de um único hash de 64 bits
+        h = _hash64(chave)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [linha * self.largura + (h1 + linha * h2) % self.largura for linha in range(self.profundidade)]
+
+    def adicionar(self, chave, peso=1):
+        """Soma peso à contagem da chave."""
+        self.total += peso
+        tabela = self.tabela
+        for posicao in self._posicoes(chave):
+            tabela[posicao] += peso
+
+    def estimar(self, chave):
+        """Contagem estimada da chave (nunca inferior à real)."""
+        tabela = self.tabela
+        return min(tabela[posicao] for posicao in self._posicoes(chave))
+
+    def juntar(self, outro):
+        """Soma ao sketch as contagens de outro sketch com as mesmas dimensões."""
+        if (outro.largura, outro.profundidade) != (self.largura, self.profundidade):
+            raise ValueError("Só é possível juntar sketches Count-Min com as mesmas dimensões")
+        self.tabela = array("q", map(sum, zip(self.tabela, outro.tabela)))
+        self.total += outro.total
+
+
+class HyperLogLog:
+    """HyperLogLog (Flajolet et al.): número aproximado de elementos distintos em 2^precisao bytes."""
+
+    def __init__(self, precisao=PRECISAO_PADRAO):
+        self.precisao = precisao
+        self.registos = bytearray(1 << precisao)
+
+    def adicionar(self, chave):
+        """Regista a chave (repetições não alteram a estimativa)."""
+        h = _hash64(chave)
+        bits = 64 - self.precisao
+        indice = h >> bits
+        # Posição do primeiro bit a 1 nos restantes bits do hash
+        posto = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if posto > self.registos[indice]:
+            self.registos[indice] = posto
+
+    def contar(self):
+        """Número estimado de elementos distintos."""
+        m = len(self.registos)
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimativa = alfa * m * m / sum(2.0 ** -registo for registo in self.registos)
+        vazios = self.registos.count(0)
+        if estimativa <= 2.5 * m and vazios:
+            # Poucos elementos: a contagem linear (pelos registos vazios) é mais precisa
+            estimativa = m * math.log(m / vazios)
+        return round(estimativa)
+
+    def juntar(self, outro):
+        """Junta os elementos de outro HyperLogLog com a mesma precisão."""
+        if outro.precisao != self.precisao:
+            raise ValueError("Só é possível juntar HyperLogLogs com a mesma precisão")
+        self.registos = bytearray(map(max, self.registos, outro.registos))
@@ -1,6 +1,22 @@
 # -*- coding: utf-8 -*-
 """Processo Temporal"""
 import datetime
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import lru_cache
+from itertools import accumulate
+
+from instrumentation import instrumentado
+from result_cache import memorizado
+from review_table import ReviewTable, filtrar_linhas, iterar_campos, iterar_coluna
+
+# Granularidades aceites nas séries temporais e o formato das chaves de cada uma
+# (as semanas são semanas ISO, de segunda a domingo, com a chave 'YYYY-Www')
+PERIOD_FORMATS = {'year': "%Y", 'month': "%Y-%m", 'week': "%G-W%V", 'day': "%Y-%m-%d"}
+# Janelas (em dias) das médias móveis mais usadas
+ROLLING_WINDOWS = (7, 30, 90)
 
 # --- Funções Auxiliares de Data ---
 
@@ -43,76 +59,328 @@ def convert_unix_timestamp_to_date_readable(timestamp: str) -> str:
         return ""
 
 
+@lru_cache(maxsize=1 << 16)
+def _period_of(timestamp: int, format_str: str) -> str:
+    """
+    Versão memorizada de _convert_timestamp_to_date_string. Cada timestamp distinto
+    só é convertido (datetime + strftime) uma vez por formato, mesmo entre chamadas.
+    """
+    return _convert_timestamp_to_date_string(timestamp, format_str)
+
+
+def _to_timestamp_bound(value, is_end: bool = False):
+    """
+    Função interna que converte um limite de intervalo (start/end) num timestamp Unix.
+
+    Args:
+        value: None (sem limite), um timestamp Unix (int), um datetime.date/datetime.datetime
+               ou uma string 'YYYY', 'YYYY-MM' ou 'YYYY-MM-DD' (hora local, como as datas do resultado).
+        is_end: Se True, uma data ou string representa o fim (inclusive) desse ano/mês/dia.
+
+    Returns:
+        O timestamp Unix (int) ou None.
+
+    Raises:
+        ValueError se a string não estiver num dos formatos aceites.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, datetime.date):
+        first = datetime.datetime(value.year, value.month, value.day)
+        following = first + datetime.timedelta(days=1)
+    elif isinstance(value, str):
+        if len(value) == 4:
+            first = datetime.datetime.strptime(value, "%Y")
+            following = first.replace(year=first.year + 1)
+        elif len(value) == 7:
+            first = datetime.datetime.strptime(value, "%Y-%m")
+            following = first.replace(year=first.year + first.month // 12, month=first.month % 12 + 1)
+        else:
+            first = datetime.datetime.strptime(value, "%Y-%m-%d")
+            following = first + datetime.timedelta(days=1)
+    else:
+        return int(value)
+    # O fim é inclusive: o último segundo antes do período seguinte
+    return int(following.timestamp()) - 1 if is_end else int(first.timestamp())
+
+
+class TimeIndex:
+    """
+    Índice temporal: os timestamps distintos ordenados e somas acumuladas (prefix sums)
+    do número de avaliações e dos scores.
+
+    O número de avaliações (ou a soma dos scores) entre dois instantes é a diferença
+    de duas somas acumuladas, encontradas por pesquisa binária (bisect): O(log N).
+    Para agrupar por período, cada formato guarda as posições onde o período muda,
+    por isso um intervalo com k períodos é respondido em O(log N + k), sem formatar
+    nenhuma data.
+
+    Para as séries diárias, semanais e as janelas móveis o índice guarda também as
+    somas acumuladas por dia (uma posição por dia do calendário, entre o primeiro e o
+    último dia com avaliações), construídas uma única vez: cada série com k períodos
+    custa O(k), sem voltar a percorrer as avaliações nem os timestamps.
+    """
+
+    def __init__(self, counts_by_timestamp: dict, scores_by_timestamp: dict = None):
+        """
+        Args:
+            counts_by_timestamp: Dicionário {timestamp: número de avaliações}.
+            scores_by_timestamp: Dicionário opcional {timestamp: soma dos scores}.
+        """
+        self.timestamps = array("q", sorted(counts_by_timestamp))
+        self.cumulative_counts = array("q", accumulate(
+            (counts_by_timestamp[t] for t in self.timestamps), initial=0))
+        self.cumulative_scores = array("q", accumulate(
+            ((scores_by_timestamp or {}).get(t, 0) for t in self.timestamps), initial=0))
+        # {formato: (posições onde o período muda, período que começa em cada posição)}
+        self._runs = {}
+        # (ordinal do primeiro dia, somas acumuladas das avaliações por dia, somas acumuladas dos scores por dia)
+        self._days = None
+
+    @classmethod
+    def build(cls, reviews, with_scores: bool = True):
+        """
+        Constrói o índice numa única passagem pelas avaliações.
+
+        Args:
+            reviews: ReviewTable, lista de dicionários ou iterável de avaliações/lotes.
+            with_scores: Se False só conta as avaliações com 'Time' válido (como
+                         count_reviews_by_year sempre fez); se True só entram as que
+                         têm também um 'Score' válido.
+        """
+        if not with_scores:
+            return cls(Counter(iterar_coluna(reviews, 'Time')))
+        # Há no máximo 5 pares (timestamp, score) distintos por timestamp
+        counts_by_timestamp = {}
+        scores_by_timestamp = {}
+        for (unix_timestamp, review_score), count in Counter(iterar_campos(reviews, 'Time', 'Score')).items():
+            counts_by_timestamp[unix_timestamp] = counts_by_timestamp.get(unix_timestamp, 0) + count
+            scores_by_timestamp[unix_timestamp] = scores_by_timestamp.get(unix_timestamp, 0) + review_score * count
+        return cls(counts_by_timestamp, scores_by_timestamp)
+
+    def positions(self, start=None, end=None):
+        """Intervalo [i, j) de posições dos timestamps com start <= timestamp <= end (timestamps Unix ou None)."""
+        i = 0 if start is None else bisect_left(self.timestamps, start)
+        j = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+        return i, max(i, j)
+
+    def count(self, start=None, end=None) -> int:
+        """Número de avaliações entre start e end (inclusive), em O(log N)."""
+        i, j = self.positions(start, end)
+        return self.cumulative_counts[j] - self.cumulative_counts[i]
+
+    def score_sum(self, start=None, end=None) -> int:
+        """Soma dos scores das avaliações entre start e end (inclusive), em O(log N)."""
+        i, j = self.positions(start, end)
+        return self.cumulative_scores[j] - self.cumulative_scores[i]
+
+    def _period_runs(self, format_str: str):
+        """Posições onde o período (no formato dado) muda ao longo dos timestamps ordenados."""
+        if format_str not in self._runs:
+            starts, periods = [], []
+            for position, unix_timestamp in enumerate(self.timestamps):
+                period = _period_of(unix_timestamp, format_str)
+                if not periods or period != periods[-1]:
+                    starts.append(position)
+                    periods.append(period)
+            self._runs[format_str] = (starts, periods)
+        return self._runs[format_str]
+
+    def by_period(self, format_str: str, start=None, end=None) -> dict:
+        """
+        Agrupa as avaliações entre start e end por período.
+
+        Returns:
+            Um dicionário {periodo: [número de avaliações, soma dos scores]}, por ordem cronológica.
+        """
+        i, j = self.positions(start, end)
+        starts, periods = self._period_runs(format_str)
+        totals = {}
+        run = max(0, bisect_right(starts, i) - 1)
+        while run < len(starts) and starts[run] < j:
+            first = max(starts[run], i)
+            last = min(starts[run + 1], j) if run + 1 < len(starts) else j
+            period = periods[run]
+            run += 1
+            # Timestamps que não podem ser convertidos numa data são ignorados
+            if not period:
+                continue
+            # Um formato sem o ano (ex: '%m') pode repetir o mesmo período mais à frente
+            totals.setdefault(period, [0, 0])
+            totals[period][0] += self.cumulative_counts[last] - self.cumulative_counts[first]
+            totals[period][1] += self.cumulative_scores[last] - self.cumulative_scores[first]
+        return totals
+
+    def _daily(self):
+        """
+        Somas acumuladas por dia do calendário (hora local, como as datas do resultado):
+        as avaliações do dia com ordinal d estão entre as posições d - primeiro e
+        d - primeiro + 1 das somas. Os dias sem avaliações repetem a soma anterior.
+        """
+        if self._days is None:
+            starts, periods = self._period_runs("%Y-%m-%d")
+            runs = [(datetime.date.fromisoformat(period).toordinal(), first, last)
+                    for period, first, last in zip(periods, starts, starts[1:] + [len(self.timestamps)]) if period]
+            if not runs:
+                self._days = (0, array("q", [0]), array("q", [0]))
+                return self._days
+            first_day = runs[0][0]
+            day_counts = array("q", bytes(8 * (runs[-1][0] - first_day + 1)))
+            day_scores = array("q", day_counts)
+            for day, first, last in runs:
+                day_counts[day - first_day] += self.cumulative_counts[last] - self.cumulative_counts[first]
+                day_scores[day - first_day] += self.cumulative_scores[last] - self.cumulative_scores[first]
+            self._days = (first_day, array("q", accumulate(day_counts, initial=0)),
+                          array("q", accumulate(day_scores, initial=0)))
+        return self._days
+
+    def _day_range(self, start=None, end=None):
+        """
+        Intervalo [i, j) de dias (posições nas somas diárias) entre start e end
+        (timestamps Unix ou None). Os limites são arredondados ao dia em que caem.
+        """
+        first_day, day_counts, _ = self._daily()
+        i = 0 if start is None else datetime.date.fromtimestamp(start).toordinal() - first_day
+        j = len(day_counts) - 1 if end is None else datetime.date.fromtimestamp(end).toordinal() - first_day + 1
+        i = min(max(i, 0), len(day_counts) - 1)
+        return i, max(i, min(j, len(day_counts) - 1))
+
+    def by_granularity(self, period: str, start=None, end=None) -> dict:
+        """
+        Agrupa as avaliações entre start e end por ano, mês, semana ou dia
+        (ver PERIOD_FORMATS), em O(número de períodos).
+
+        Returns:
+            Um dicionário {periodo: [número de avaliações, soma dos scores]}, por ordem
+            cronológica, só com os períodos que têm avaliações.
+
+        Raises:
+            ValueError se a granularidade não for 'year', 'month', 'week' ou 'day'.
+        """
+        if period not in PERIOD_FORMATS:
+            raise ValueError(f"Granularidade desconhecida: {period} (use {', '.join(PERIOD_FORMATS)})")
+        if period in ('year', 'month'):
+            return self.by_period(PERIOD_FORMATS[period], start, end)
+
+        first_day, day_counts, day_scores = self._daily()
+        i, j = self._day_range(start, end)
+        # As semanas começam à segunda-feira (a primeira pode começar antes de start)
+        step = 7 if period == 'week' else 1
+        bucket = i - (first_day + i - 1) % 7 if period == 'week' else i
+        totals = {}
+        while bucket < j:
+            first, last = max(bucket, i), min(bucket + step, j)
+            count = day_counts[last] - day_counts[first]
+            if count:
+                key = datetime.date.fromordinal(first_day + bucket).strftime(PERIOD_FORMATS[period])
+                totals[key] = [count, day_scores[last] - day_scores[first]]
+            bucket += step
+        return totals
+
+    def rolling(self, window: int, start=None, end=None) -> dict:
+        """
+        Janela móvel de window dias: para cada dia entre start e end, as avaliações desse
+        dia e dos window - 1 dias anteriores (mesmo que sejam anteriores a start), em
+        O(número de dias).
+
+        Returns:
+            Um dicionário {'YYYY-MM-DD': [número de avaliações, soma dos scores]} com
+            todos os dias do intervalo, por ordem cronológica.
+
+        Raises:
+            ValueError se window não for um inteiro positivo.
+        """
+        if not isinstance(window, int) or window < 1:
+            raise ValueError(f"A janela tem de ser um número inteiro de dias positivo (recebido {window})")
+        first_day, day_counts, day_scores = self._daily()
+        i, j = self._day_range(start, end)
+        totals = {}
+        for day in range(i, j):
+            first = max(0, day + 1 - window)
+            key = datetime.date.fromordinal(first_day + day).isoformat()
+            totals[key] = [day_counts[day + 1] - day_counts[first], day_scores[day + 1] - day_scores[first]]
+        return totals
+
+
+# Índices já construídos para cada ReviewTable (libertados quando a tabela deixa de existir): os índices com scores
+# e os só de contagens, para as tabelas carregadas sem a coluna Score (ex: carregar_dados(colunas=["Time"]))
+_time_indexes = weakref.WeakKeyDictionary()
+_count_indexes = weakref.WeakKeyDictionary()
+
+
+def _time_index(reviews, with_scores: bool = True) -> TimeIndex:
+    """
+    Função interna que devolve o índice temporal das avaliações. Numa ReviewTable o índice
+    é construído uma única vez (enquanto a tabela não mudar de tamanho), por isso as
+    consultas seguintes, com quaisquer limites, já não percorrem as avaliações.
+    Um índice com scores também serve as consultas que só precisam de contagens.
+    """
+    if not isinstance(reviews, ReviewTable):
+        return TimeIndex.build(reviews, with_scores)
+    caches = (_time_indexes,) if with_scores else (_time_indexes, _count_indexes)
+    for cache in caches:
+        index = cache.get(reviews)
+        # Numa ReviewTable todas as avaliações têm Time (e Score) válidos e a tabela só cresce
+        # (ver ReviewTable.adicionar/estender), por isso um índice desatualizado tem menos avaliações
+        if index is not None and index.count() == len(reviews):
+            return index
+    index = TimeIndex.build(reviews, with_scores)
+    caches[-1][reviews] = index
+    return index
+
+
 # --- Funções de Análise Temporal ---
 
-def count_reviews_by_year(reviews: list) -> dict:
+@instrumentado
+@memorizado
+def count_reviews_by_year(reviews: list, start=None, end=None) -> dict:
     """
     REQUISITO OBRIGATÓRIO: Contar quantas avaliações foram feitas por ano.
 
     Args:
-        reviews: Uma lista de dicionários, onde cada dicionário é uma avaliação
-                 (e deve conter a chave 'Time').
+        reviews: Uma ReviewTable ou lista de dicionários, onde cada dicionário é uma
+                 avaliação (e deve conter a chave 'Time').
+        start: Início opcional do intervalo (inclusive): timestamp Unix, data ou
+               string 'YYYY', 'YYYY-MM' ou 'YYYY-MM-DD'.
+        end: Fim opcional do intervalo (inclusive), nos mesmos formatos.
 
     Returns:
         Um dicionário onde as chaves são os anos (string YYYY) e os valores são
-        o número total de avaliações nesse ano.
+        o número total de avaliações nesse ano, por ordem cronológica.
         Exemplo: {'2010': 1500, '2011': 4500}
     """
-    reviews_per_year = {}
     yearformat = "%Y"
 
-    for review in reviews:
-        timestamp_str = review.get('Time')
-
-        if timestamp_str:
-            try:
-                # CORREÇÃO: Robustez na conversão para inteiro
-                unix_timestamp = int(timestamp_str)
-                year = _convert_timestamp_to_date_string(unix_timestamp, yearformat)
-
-                if year:
-                    if year in reviews_per_year:
-                        reviews_per_year[year] += 1
-                    else:
-                        reviews_per_year[year] = 1
-            except (ValueError, TypeError):
-                continue
+    # O índice temporal já tem o Time como inteiro e ignora as reviews com timestamps inválidos
+    index = _time_index(reviews, with_scores=False)
+    totals = index.by_period(yearformat, _to_timestamp_bound(start), _to_timestamp_bound(end, is_end=True))
 
-    return reviews_per_year
+    return {year: values[0] for year, values in totals.items()}
 
 
-def identify_busiest_period(reviews: list, period_format: str = "%Y-%m") -> dict:
+@instrumentado
+@memorizado
+def identify_busiest_period(reviews: list, period_format: str = "%Y-%m", start=None, end=None) -> dict:
     """
     REQUISITO OBRIGATÓRIO: Identificar o mês e o ano com maior número de avaliações.
 
     Esta função é genérica e pode ser usada para encontrar o ano/mês mais movimentado.
 
     Args:
-        reviews: Uma lista de dicionários com a chave 'Time'.
+        reviews: Uma ReviewTable ou lista de dicionários com a chave 'Time'.
         period_format: O formato para o período ('%Y-%m' para Mês/Ano, '%Y' para Ano).
+        start: Início opcional do intervalo (inclusive), como em count_reviews_by_year.
+        end: Fim opcional do intervalo (inclusive).
 
     Returns:
         Um dicionário com o período mais ocupado e a sua contagem:
         {'periodo': 'YYYY-MM', 'contagem': N}
     """
-    reviews_per_period = {}
-
-    for review in reviews:
-        timestamp_str = review.get('Time')
-
-        if timestamp_str:
-            try:
-                # CORREÇÃO: Robustez na conversão para inteiro
-                unix_timestamp = int(timestamp_str)
-                period = _convert_timestamp_to_date_string(unix_timestamp, period_format)
-
-                if period:
-                    if period in reviews_per_period:
-                        reviews_per_period[period] += 1
-                    else:
-                        reviews_per_period[period] = 1
-            except (ValueError, TypeError):
-                continue
+    index = _time_index(reviews, with_scores=False)
+    reviews_per_period = index.by_period(period_format, _to_timestamp_bound(start),
+                                         _to_timestamp_bound(end, is_end=True))
 
     if not reviews_per_period:
         return {'periodo': None, 'contagem': 0}
@@ -120,65 +388,119 @@ def identify_busiest_period(reviews: list, period_format: str = "%Y-%m") -> dict
     max_count = 0
     busiest_period = None
 
-    for period, count in reviews_per_period.items():
-        if count > max_count:
-            max_count = count
+    # Em caso de empate fica o período mais antigo
+    for period, values in reviews_per_period.items():
+        if values[0] > max_count:
+            max_count = values[0]
             busiest_period = period
 
     return {'periodo': busiest_period, 'contagem': max_count}
 
 
-def calculate_average_score_over_time(reviews: list, period: str = 'month') -> dict:
+@instrumentado
+@memorizado
+def calculate_average_score_over_time(reviews: list, period: str = 'month', start=None, end=None, linhas=None) -> dict:
     """
     REQUISITO OBRIGATÓRIO: Analisar a variação do score médio ao longo do tempo
     (ex.: score médio por mês ou ano).
 
     Args:
-        reviews: Uma lista de dicionários com as chaves 'Time' e 'Score'.
-        period: O período de agregação ('year' para ano, 'month' para mês/ano).
+        reviews: Uma ReviewTable ou lista de dicionários com as chaves 'Time' e 'Score'.
+        period: O período de agregação ('year', 'month', 'week' ou 'day', ver PERIOD_FORMATS).
+        start: Início opcional do intervalo (inclusive), como em count_reviews_by_year.
+        end: Fim opcional do intervalo (inclusive).
+        linhas: Posições opcionais das reviews a considerar (ex: as encontradas por uma
+            pesquisa no índice de texto, ver text_index.py).
 
     Returns:
-        Um dicionário onde as chaves são os períodos (YYYY ou YYYY-MM) e os valores
-        são o score médio nesse período.
+        Um dicionário onde as chaves são os períodos (YYYY, YYYY-MM, YYYY-Www ou YYYY-MM-DD)
+        e os valores são o score médio nesse período, por ordem cronológica.
         Exemplo: {'2010-04': 4.2, '2010-05': 4.5}
+
+    Raises:
+        ValueError se o período não for um dos aceites.
     """
-    scores_by_period = {}
+    # Contagens e somas dos scores por período, a partir das somas acumuladas do índice
+    index = _time_index(filtrar_linhas(reviews, linhas))
+    totals = index.by_granularity(period, _to_timestamp_bound(start), _to_timestamp_bound(end, is_end=True))
 
-    if period == 'year':
-        format_str = "%Y"
-    elif period == 'month':
-        format_str = "%Y-%m"
-    else:
-        format_str = "%Y-%m"
+    average_scores = {}
+    for key, (count, score_sum) in totals.items():
+        if count > 0:
+            average_scores[key] = score_sum / count
 
-    for review in reviews:
-        timestamp_str = review.get('Time')
-        score_str = review.get('Score')
+    return average_scores
 
-        if timestamp_str and score_str is not None:
-            try:
-                # CORREÇÃO: Robustez na conversão para inteiro para Time e Score
-                unix_timestamp = int(timestamp_str)
-                review_score = int(score_str)
 
-                key = _convert_timestamp_to_date_string(unix_timestamp, format_str)
+@instrumentado
+@memorizado
+def count_reviews_over_time(reviews: list, period: str = 'day', start=None, end=None) -> dict:
+    """
+    Conta as avaliações por período (volume de avaliações ao longo do tempo).
 
-                if key:
-                    if key not in scores_by_period:
-                        scores_by_period[key] = [0, 0]
+    Args:
+        reviews: Uma ReviewTable ou lista de dicionários com a chave 'Time'.
+        period: O período de agregação ('year', 'month', 'week' ou 'day').
+        start: Início opcional do intervalo (inclusive), como em count_reviews_by_year.
+        end: Fim opcional do intervalo (inclusive).
 
-                    scores_by_period[key][0] += review_score
-                    scores_by_period[key][1] += 1
+    Returns:
+        Um dicionário {periodo: número de avaliações}, por ordem cronológica, só com os
+        períodos que têm avaliações.
+        Exemplo: {'2010-W05': 120, '2010-W06': 98}
 
-            except (ValueError, TypeError):
-                continue
+    Raises:
+        ValueError se o período não for um dos aceites.
+    """
+    index = _time_index(reviews, with_scores=False)
+    totals = index.by_granularity(period, _to_timestamp_bound(start), _to_timestamp_bound(end, is_end=True))
+    return {key: values[0] for key, values in totals.items()}
 
-    average_scores = {}
-    for key, data in scores_by_period.items():
-        total_score = data[0]
-        count = data[1]
 
-        if count > 0:
-            average_scores[key] = total_score / count
+@instrumentado
+@memorizado
+def rolling_average_score(reviews: list, window: int = 30, start=None, end=None) -> dict:
+    """
+    Média móvel do score: para cada dia, o score médio das avaliações dos últimos
+    window dias (ex: 7, 30 ou 90, ver ROLLING_WINDOWS).
+
+    Args:
+        reviews: Uma ReviewTable ou lista de dicionários com as chaves 'Time' e 'Score'.
+        window: Tamanho da janela, em dias (inclui o próprio dia).
+        start: Primeiro dia opcional da série (inclusive), como em count_reviews_by_year.
+        end: Último dia opcional da série (inclusive).
+
+    Returns:
+        Um dicionário {'YYYY-MM-DD': score médio da janela que acaba nesse dia}, por ordem
+        cronológica, só com os dias cuja janela tem avaliações.
 
-    return average_scores
\ No newline at end of file
+    Raises:
+        ValueError se a janela não for um número inteiro de dias positivo.
+    """
+    index = _time_index(reviews)
+    totals = index.rolling(window, _to_timestamp_bound(start), _to_timestamp_bound(end, is_end=True))
+    return {day: score_sum / count for day, (count, score_sum) in totals.items() if count > 0}
+
+
+@instrumentado
+@memorizado
+def rolling_review_volume(reviews: list, window: int = 30, start=None, end=None) -> dict:
+    """
+    Volume móvel: para cada dia, o número de avaliações dos últimos window dias.
+
+    Args:
+        reviews: Uma ReviewTable ou lista de dicionários com a chave 'Time'.
+        window: Tamanho da janela, em dias (inclui o próprio dia).
+        start: Primeiro dia opcional da série (inclusive), como em count_reviews_by_year.
+        end: Último dia opcional da série (inclusive).
+
+    Returns:
+        Um dicionário {'YYYY-MM-DD': número de avaliações da janela que acaba nesse dia}
+        com todos os dias do intervalo, por ordem cronológica.
+
+    Raises:
+        ValueError se a janela não for um número inteiro de dias positivo.
+    """
+    index = _time_index(reviews, with_scores=False)
+    totals = index.rolling(window, _to_timestamp_bound(start), _to_timestamp_bound(end, is_end=True))
+    return {day: values[0] for day, values in totals.items()}
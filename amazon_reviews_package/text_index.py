@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Índice de Texto (Pesquisa por Palavras)"""
+
+"""Este ficheiro define um índice invertido sobre o Summary e o Text das reviews: para cada palavra, a lista ordenada
+das posições das reviews que a contêm (posting list). Assim, encontrar "todas as reviews que falam de gluten" custa o
+tamanho da lista dessa palavra em vez de percorrer centenas de MB de texto.
+
+As posting lists são comprimidas: cada posição é guardada como a diferença (delta) para a posição anterior, escrita
+em varint (7 bits por byte, o bit mais alto indica que o número continua). Como as posições são crescentes as
+diferenças são pequenas e a maioria ocupa 1 ou 2 bytes, em vez dos 8 de um array("q").
+
+O índice é guardado na pasta da cache binária do CSV (ver dataset_cache.py):
+    texto.postings ==> todas as posting lists comprimidas, concatenadas
+    texto.offsets  ==> a posting list da palavra i ocupa postings[offsets[i]:offsets[i + 1]]
+    texto.json     ==> palavras, número de reviews e impressão digital do CSV (escrito por último)
+
+As pesquisas aceitam palavras e os operadores AND, OR, NOT e parênteses (AND é implícito entre palavras):
+    gluten
+    gluten free                  (o mesmo que gluten AND free)
+    (coffee OR tea) AND NOT decaf
+O resultado são as posições das reviews, que podem ser passadas às análises como filtro (argumento linhas de
+contar_distribuicao_scores, media_scores_por_produto e calculate_average_score_over_time)."""
+
+import json
+import os
+import re
+from array import array
+
+from data_loader import carregar_dados
+from dataset_cache import cache_valida, pasta_cache
+from review_table import iterar_campos
+
+# Campos indexados
+CAMPOS_INDEXADOS = ("Summary", "Text")
+# Incrementar sempre que o formato dos ficheiros do índice (ou a divisão em palavras) mudar
+VERSAO_INDICE = 1
+
+# As tags HTML (ex: <br />) são removidas antes de dividir o texto em palavras
+_TAGS = re.compile(r"<[^>]*>")
+_PALAVRAS = re.compile(r"\w+")
+_OPERADORES = ("AND", "OR", "NOT", "(", ")")
+_SIMBOLOS_CONSULTA = re.compile(r"\(|\)|[^\s()]+")
+
+
+def tokenizar(texto):
+    """Divide o texto em palavras (em minúsculas, sem tags HTML nem pontuação)."""
+    return _PALAVRAS.findall(_TAGS.sub(" ", texto).lower())
+
+
+def _codificar_varint(numero, destino):
+    """Acrescenta o número (>= 0) ao bytearray destino em varint."""
+    while numero >= 0x80:
+        destino.append((numero & 0x7F) | 0x80)
+        numero >>= 7
+    destino.append(numero)
+
+
+def descodificar_postings(dados):
+    """Descodifica uma posting list comprimida (deltas em varint).
+    Returns:
+        array("q") com as posições das reviews, por ordem crescente."""
+    linhas = array("q")
+    linha = numero = deslocamento = 0
+    for byte in dados:
+        numero |= (byte & 0x7F) << deslocamento
+        if byte & 0x80:
+            deslocamento += 7
+        else:
+            linha += numero
+            linhas.append(linha)
+            numero = deslocamento = 0
+    return linhas
+
+
+class IndiceTexto:
+    """Índice invertido (palavra ==> posições das reviews) com as posting lists comprimidas."""
+
+    def __init__(self, termos, offsets, postings, linhas):
+        """
+        Args:
+            termos ==> Lista das palavras indexadas (a palavra i corresponde à posting list i)
+            offsets ==> array("q") com len(termos) + 1 posições, início de cada posting list em postings
+            postings ==> bytes com todas as posting lists comprimidas
+            linhas ==> Número de reviews indexadas
+        """
+        self.termos = termos
+        self.offsets = offsets
+        self.postings = postings
+        self.linhas = linhas
+        self._posicoes = {termo: i for i, termo in enumerate(termos)}
+
+    @classmethod
+    def construir(cls, dados, campos=CAMPOS_INDEXADOS):
+        """Constrói o índice numa única passagem pelas reviews.
+        As posting lists são comprimidas à medida que são construídas, por isso a memória usada é a do índice final.
+        Args:
+            dados ==> ReviewTable ou lista de dicionários (reviews) com os campos indicados
+            campos ==> Campos de texto a indexar"""
+        # {palavra: [bytearray com a posting list comprimida, última posição acrescentada]}
+        listas = {}
+        linhas = 0
+        for linha, textos in enumerate(iterar_campos(dados, *campos, padroes={campo: "" for campo in campos})):
+            linhas = linha + 1
+            # Cada review entra uma única vez na lista de cada palavra, mesmo que a repita
+            for termo in set(tokenizar(" ".join(textos))):
+                lista = listas.get(termo)
+                if lista is None:
+                    lista = listas[termo] = [bytearray(), 0]
+                _codificar_varint(linha - lista[1], lista[0])
+                lista[1] = linha
+
+        termos = sorted(listas)
+        offsets = array("q", [0])
+        postings = bytearray()
+        for termo in termos:
+            postings += listas[termo][0]
+            offsets.append(len(postings))
+        return cls(termos, offsets, bytes(postings), linhas)
+
+    def guardar(self, pasta, meta=None):
+        """Guarda o índice na pasta indicada (normalmente a pasta da cache do CSV).
+        Args:
+            pasta ==> Pasta de destino
+            meta ==> meta.json da cache do CSV, para associar o índice a essa versão do ficheiro
+        Raises:
+            OSError se não for possível escrever na pasta."""
+        os.makedirs(pasta, exist_ok=True)
+        # O texto.json só é escrito no fim: enquanto não existir, o índice é considerado inválido
+        try:
+            os.remove(os.path.join(pasta, "texto.json"))
+        except FileNotFoundError:
+            pass
+        with open(os.path.join(pasta, "texto.postings"), "wb") as file:
+            file.write(self.postings)
+        with open(os.path.join(pasta, "texto.offsets"), "wb") as file:
+            self.offsets.tofile(file)
+        with open(os.path.join(pasta, "texto.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "versao": VERSAO_INDICE,
+                "impressao_digital": (meta or {}).get("impressao_digital"),
+                "linhas": self.linhas,
+                "termos": self.termos,
+            }, file, ensure_ascii=False)
+
+    @classmethod
+    def carregar(cls, pasta, meta=None):
+        """Lê o índice guardado por guardar.
+        Args:
+            pasta ==> Pasta onde o índice foi guardado
+            meta ==> meta.json atual da cache do CSV: o índice só é aceite se corresponder à mesma versão do ficheiro
+        Returns:
+            O IndiceTexto, ou None se não existir, estiver incompleto ou desatualizado."""
+        try:
+            with open(os.path.join(pasta, "texto.json"), "r", encoding="utf-8") as file:
+                descricao = json.load(file)
+            with open(os.path.join(pasta, "texto.postings"), "rb") as file:
+                postings = file.read()
+            caminho_offsets = os.path.join(pasta, "texto.offsets")
+            offsets = array("q")
+            with open(caminho_offsets, "rb") as file:
+                offsets.fromfile(file, os.path.getsize(caminho_offsets) // offsets.itemsize)
+        except (OSError, ValueError, EOFError):
+            return None
+
+        if descricao.get("versao") != VERSAO_INDICE:
+            return None
+        if meta is not None and (descricao["impressao_digital"] != meta["impressao_digital"]
+                                 or descricao["linhas"] != meta["linhas"]):
+            return None
+        if len(offsets) != len(descricao["termos"]) + 1 or offsets[-1] != len(postings):
+            return None
+        return cls(descricao["termos"], offsets, postings, descricao["linhas"])
+
+    def linhas_de(self, termo):
+        """Devolve as posições (array, por ordem crescente) das reviews que contêm a palavra (vazio se não houver)."""
+        i = self._posicoes.get(termo.lower())
+        if i is None:
+            return array("q")
+        return descodificar_postings(self.postings[self.offsets[i]:self.offsets[i + 1]])
+
+    def procurar(self, consulta):
+        """Pesquisa as reviews que satisfazem a consulta (palavras com AND, OR, NOT e parênteses, ver a descrição
+        do ficheiro). Uma palavra da consulta com pontuação (ex: gluten-free) exige todas as suas partes.
+        Args:
+            consulta ==> Texto da consulta
+        Returns:
+            array("q") com as posições das reviews encontradas, por ordem crescente.
+        Raises:
+            ValueError se a consulta estiver vazia ou mal formada (ex: parênteses por fechar)."""
+        simbolos = _SIMBOLOS_CONSULTA.findall(consulta)
+        if not simbolos:
+            raise ValueError("A consulta está vazia")
+        resultado, posicao = self._expressao_or(simbolos, 0)
+        if posicao != len(simbolos):
+            raise ValueError(f"Consulta mal formada perto de '{simbolos[posicao]}'")
+        return array("q", sorted(resultado))
+
+    # --- Interpretação das consultas (descida recursiva: OR < AND < NOT < palavra/parênteses) ---
+    # Cada método recebe a lista de símbolos e a posição atual e devolve (conjunto de posições, posição seguinte)
+
+    def _expressao_or(self, simbolos, posicao):
+        resultado, posicao = self._expressao_and(simbolos, posicao)
+        while posicao < len(simbolos) and simbolos[posicao] == "OR":
+            outro, posicao = self._expressao_and(simbolos, posicao + 1)
+            resultado |= outro
+        return resultado, posicao
+
+    def _expressao_and(self, simbolos, posicao):
+        resultado, posicao = self._expressao_not(simbolos, posicao)
+        while posicao < len(simbolos) and simbolos[posicao] not in ("OR", ")"):
+            if simbolos[posicao] == "AND":
+                posicao += 1
+            outro, posicao = self._expressao_not(simbolos, posicao)
+            resultado &= outro
+        return resultado, posicao
+
+    def _expressao_not(self, simbolos, posicao):
+        if posicao < len(simbolos) and simbolos[posicao] == "NOT":
+            resultado, posicao = self._expressao_not(simbolos, posicao + 1)
+            return set(range(self.linhas)) - resultado, posicao
+        return self._termo(simbolos, posicao)
+
+    def _termo(self, simbolos, posicao):
+        if posicao >= len(simbolos):
+            raise ValueError("A consulta termina antes do fim de uma expressão")
+        simbolo = simbolos[posicao]
+        if simbolo == "(":
+            resultado, posicao = self._expressao_or(simbolos, posicao + 1)
+            if posicao >= len(simbolos) or simbolos[posicao] != ")":
+                raise ValueError("Parênteses por fechar na consulta")
+            return resultado, posicao + 1
+        if simbolo in _OPERADORES:
+            raise ValueError(f"Consulta mal formada perto de '{simbolo}'")
+
+        termos = tokenizar(simbolo)
+        if not termos:
+            raise ValueError(f"'{simbolo}' não tem nenhuma palavra pesquisável")
+        resultado = set(self.linhas_de(termos[0]))
+        for termo in termos[1:]:
+            resultado &= set(self.linhas_de(termo))
+        return resultado, posicao + 1
+
+    def __contains__(self, termo):
+        return termo.lower() in self._posicoes
+
+    def __len__(self):
+        """Número de palavras distintas indexadas."""
+        return len(self.termos)
+
+
+def indice_texto(caminho_csv):
+    """Devolve o índice de texto do CSV indicado, lido da pasta da cache ou, na primeira vez (ou se o CSV mudou),
+    construído a partir do Summary e do Text e guardado para as execuções seguintes.
+    As posições do índice correspondem às da tabela devolvida por data_loader.carregar_dados para o mesmo CSV.
+    Raises:
+        FileNotFoundError se o CSV não existir."""
+    meta = cache_valida(caminho_csv)
+    pasta = pasta_cache(caminho_csv)
+    indice = IndiceTexto.carregar(pasta, meta) if meta is not None else None
+    if indice is not None:
+        return indice
+
+    # Só os textos são lidos (da cache binária, que o carregar_dados cria se ainda não existir)
+    dados = carregar_dados(caminho_csv, colunas=CAMPOS_INDEXADOS)
+    if dados is None:
+        raise FileNotFoundError(f"Ficheiro não encontrado: {caminho_csv}")
+    indice = IndiceTexto.construir(dados)
+    meta = cache_valida(caminho_csv)
+    if meta is not None:
+        try:
+            indice.guardar(pasta, meta)
+        except OSError:
+            # Sem o índice em disco a próxima execução só tem de o voltar a construir
+            pass
+    return indice
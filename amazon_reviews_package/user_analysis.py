@@ -15,78 +15,143 @@ por avaliação. Todo o processamento é realizado utilizando apenas
 estruturas de dados básicas da linguagem Python.
 """
 
+from collections.abc import Iterable, Mapping
+
+from instrumentation import instrumentado
+from ranking import top_k
+from result_cache import memorizado
+from review_table import iterar_campos, iterar_coluna
+from sketches import CountMinSketch, HyperLogLog, SpaceSaving
 
 
 def validate_reviews(reviews):
     """
-    Valida se reviews é uma lista.
+    Valida se reviews é uma coleção de avaliações: uma lista, uma ReviewTable
+    ou qualquer iterável (ex: gerador de reviews ou de lotes), mas não uma
+    string nem uma única review (dicionário).
     """
     # CORREÇÃO: Lançar a exceção diretamente para ser capturada e propagada
-    if type(reviews) != list:
-        raise TypeError("reviews deve ser uma lista")
+    if not isinstance(reviews, Iterable) or isinstance(reviews, (str, bytes, Mapping)):
+        raise TypeError("reviews deve ser uma lista ou outro iterável de reviews")
 
 
-def users_with_most_reviews(reviews, top_n=10):
+@instrumentado
+@memorizado
+def users_with_most_reviews(reviews, top_n=10, min_reviews=None, approximate=False):
     """
     Devolve os utilizadores com maior número de avaliações.
+    Os empates são desfeitos pelo UserId e, se min_reviews
+    for dado, só entram utilizadores com pelo menos esse
+    número de avaliações.
+    Com approximate=True usa um resumo Space-Saving de memória
+    fixa em vez de um contador por utilizador (ver sketches.py).
     """
     try:
         validate_reviews(reviews)
     except TypeError:
         return []
 
-    counter = {}
+    if approximate:
+        summary = SpaceSaving()
+        for (user_id,) in iterar_campos(reviews, "UserId"):
+            if user_id:
+                summary.adicionar(user_id)
+        counter = summary.itens()
+        return top_k(counter, top_n, counter, min_reviews)
 
-    for review in reviews:
-        try:
-            # CORREÇÃO: Usamos .get() e tratamos AttributeError se 'review' não for um dict
-            user_id = review.get("UserId")
-        except AttributeError:
-            continue
+    counter = {}
 
+    # iterar_campos ignora os elementos que não são reviews (dicionários)
+    for (user_id,) in iterar_campos(reviews, "UserId"):
         if user_id:
             try:
                 counter[user_id] += 1
             except KeyError:
                 counter[user_id] = 1
 
-    return sorted(counter.items(), key=lambda x: x[1], reverse=True)[:top_n]
+    return top_k(counter, top_n, counter, min_reviews)
 
 
-def most_helpful_users(reviews, top_n=10):
+@instrumentado
+@memorizado
+def most_helpful_users(reviews, top_n=10, min_reviews=None, approximate=False):
     """
     Identifica os utilizadores mais úteis com base
-    no total de votos úteis.
+    no total de votos úteis. Se min_reviews for dado,
+    só entram utilizadores com pelo menos esse número
+    de avaliações.
+    Com approximate=True os votos são somados num resumo
+    Space-Saving e o número de avaliações (para min_reviews)
+    num Count-Min Sketch, ambos de memória fixa.
     """
     try:
         validate_reviews(reviews)
     except TypeError:
         return []
 
-    helpfulness = {}
+    if approximate:
+        summary = SpaceSaving()
+        review_sketch = CountMinSketch() if min_reviews is not None else None
+        for user_id, votes in iterar_campos(reviews, "UserId", "HelpfulnessNumerator",
+                                            padroes={"HelpfulnessNumerator": 0}):
+            if user_id:
+                if votes:
+                    summary.adicionar(user_id, votes)
+                if review_sketch is not None:
+                    review_sketch.adicionar(user_id)
+        helpfulness = summary.itens()
+        review_counts = None
+        if review_sketch is not None:
+            review_counts = {user_id: review_sketch.estimar(user_id) for user_id in helpfulness}
+        return top_k(helpfulness, top_n, review_counts, min_reviews)
 
-    for review in reviews:
-        try:
-            # CORREÇÃO: Usamos .get() e Robustez na conversão de votos
-            user_id = review.get("UserId")
-            # Assume 0 se não encontrar a chave ou valor
-            votes = int(review.get("HelpfulnessNumerator", 0))
-        except (TypeError, ValueError):
-            continue
+    helpfulness = {}
+    review_counts = {}
 
+    # Assume 0 votos se a review não tiver a chave HelpfulnessNumerator
+    for user_id, votes in iterar_campos(reviews, "UserId", "HelpfulnessNumerator",
+                                        padroes={"HelpfulnessNumerator": 0}):
         if user_id:
             try:
                 helpfulness[user_id] += votes
+                review_counts[user_id] += 1
             except KeyError:
                 helpfulness[user_id] = votes
+                review_counts[user_id] = 1
+
+    return top_k(helpfulness, top_n, review_counts, min_reviews)
+
 
-    return sorted(helpfulness.items(), key=lambda x: x[1], reverse=True)[:top_n]
+@instrumentado
+@memorizado
+def count_distinct_users(reviews, approximate=False):
+    """
+    Conta os utilizadores distintos. Com approximate=True usa
+    um HyperLogLog (16 KB, erro típico de ~0.8%) em vez de
+    guardar todos os UserId.
+    """
+    try:
+        validate_reviews(reviews)
+    except TypeError:
+        return 0
+
+    if approximate:
+        sketch = HyperLogLog()
+        for user_id in iterar_coluna(reviews, "UserId"):
+            if user_id:
+                sketch.adicionar(user_id)
+        return sketch.contar()
+    return len({user_id for user_id in iterar_coluna(reviews, "UserId") if user_id})
 
 
-def average_words_per_user(reviews):
+@instrumentado
+@memorizado
+def average_words_per_user(reviews, top_n=None, min_reviews=None):
     """
     Calcula a média de palavras por avaliação
-    de cada utilizador.
+    de cada utilizador. Se top_n for dado, devolve só
+    os top_n utilizadores com maior média (ordenados);
+    min_reviews exclui utilizadores com menos avaliações.
     """
     try:
         validate_reviews(reviews)
@@ -95,23 +160,13 @@ def average_words_per_user(reviews):
 
     stats = {}
 
-    for review in reviews:
-        try:
-            # CORREÇÃO: Usamos .get() para evitar KeyError e atribuir valor padrão
-            user_id = review.get("UserId")
-            text = review.get("Text", "")
-        except AttributeError:
+    # O número de palavras de cada texto vem da coluna WordCount, calculada
+    # uma única vez no carregamento (ver word_count.py)
+    for user_id, word_count in iterar_campos(reviews, "UserId", "WordCount"):
+        # Ignora textos vazios ou que não são strings (têm 0 palavras)
+        if not word_count:
             continue
 
-        # Trata casos em que 'text' pode não ser uma string ou está vazio
-        try:
-            if not isinstance(text, str) or not text.strip():
-                continue
-        except AttributeError:
-            continue
-
-        word_count = len(text.split())
-
         try:
             stats[user_id][0] += word_count
             stats[user_id][1] += 1
@@ -126,4 +181,7 @@ def average_words_per_user(reviews):
         except ZeroDivisionError:
             averages[user_id] = 0
 
-    return averages
\ No newline at end of file
+    if top_n is None and min_reviews is None:
+        return averages
+    review_counts = {user_id: counts[1] for user_id, counts in stats.items()}
+    return dict(top_k(averages, top_n, review_counts, min_reviews))
\ No newline at end of file
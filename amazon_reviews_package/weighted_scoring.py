@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Score Ponderado por Utilidade"""
+
+"""Este ficheiro calcula o score médio ponderado por utilidade (peso de cada review = HelpfulnessNumerator) a partir
+de somas por produto já acumuladas, com três modos:
+
+    None     ==> média ponderada simples: soma(Score * votos) / soma(votos). Os produtos sem nenhum voto útil não
+                 têm média e ficam de fora (comportamento original de calculo_score_medio_ponderado).
+    "bayes"  ==> média bayesiana: (soma(Score * votos) + C * m) / (soma(votos) + m), em que C é a média ponderada de
+                 todos os produtos e m o peso do prior (por omissão a média dos votos por produto). Um produto com
+                 poucos votos fica perto de C, por isso uma única review muito votada já não domina o ranking.
+    "wilson" ==> limite inferior do intervalo de Wilson (95%) da média ponderada, convertida para a escala 0-1 e
+                 depois de volta para 1-5, com soma(votos) como número de observações. Penaliza as médias baseadas
+                 em poucos votos.
+Nos modos suavizados todos os produtos têm valor (os que não têm votos ficam com C no "bayes" e 1 no "wilson")."""
+
+import math
+
+SUAVIZACOES = ("bayes", "wilson")
+# Quantil da normal para o intervalo de confiança de 95% do modo "wilson"
+_Z_WILSON = 1.96
+
+
+def _limite_wilson(media, votos):
+    """Limite inferior de Wilson de uma média de scores (1 a 5) observada em `votos` observações."""
+    if votos <= 0:
+        return 1.0
+    p = (media - 1) / 4
+    z2 = _Z_WILSON * _Z_WILSON
+    centro = p + z2 / (2 * votos)
+    margem = _Z_WILSON * math.sqrt(max(0.0, p * (1 - p)) / votos + z2 / (4 * votos * votos))
+    return 1 + 4 * max(0.0, (centro - margem) / (1 + z2 / votos))
+
+
+def scores_ponderados(chaves, somas_ponderadas, votos, suavizacao=None, peso_prior=None):
+    """Calcula o score ponderado de cada chave a partir das somas acumuladas (listas alinhadas pela posição).
+    Args:
+        chaves ==> Lista das chaves (ex: ProductId); as chaves vazias são ignoradas
+        somas_ponderadas ==> Soma de Score * HelpfulnessNumerator de cada chave
+        votos ==> Soma de HelpfulnessNumerator de cada chave
+        suavizacao ==> None, "bayes" ou "wilson" (ver a descrição do ficheiro)
+        peso_prior ==> Peso m do prior no modo "bayes" (por omissão a média dos votos por chave)
+    Returns:
+        Dicionário {chave: score}, pela ordem das chaves.
+    Raises:
+        ValueError se a suavização não for conhecida."""
+    if suavizacao is None:
+        return {chave: soma / n_votos for chave, soma, n_votos in zip(chaves, somas_ponderadas, votos)
+                if chave and n_votos}
+    if suavizacao not in SUAVIZACOES:
+        raise ValueError(f"Suavização desconhecida: {suavizacao} (use None, 'bayes' ou 'wilson')")
+
+    if suavizacao == "wilson":
+        return {chave: _limite_wilson(soma / n_votos if n_votos else 1, n_votos)
+                for chave, soma, n_votos in zip(chaves, somas_ponderadas, votos) if chave}
+
+    total_votos = sum(votos)
+    media_global = sum(somas_ponderadas) / total_votos if total_votos else 0.0
+    if peso_prior is None:
+        peso_prior = total_votos / len(votos) if votos else 0
+    if peso_prior <= 0:
+        # Sem votos em lado nenhum não há informação para além do prior
+        return {chave: soma / n_votos if n_votos else media_global
+                for chave, soma, n_votos in zip(chaves, somas_ponderadas, votos) if chave}
+    return {chave: (soma + media_global * peso_prior) / (n_votos + peso_prior)
+            for chave, soma, n_votos in zip(chaves, somas_ponderadas, votos) if chave}
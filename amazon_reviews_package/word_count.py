@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Contagem de Palavras"""
+
+"""Este ficheiro conta as palavras dos textos das reviews sem criar listas de palavras (como faria len(text.split())).
+
+Cada caráter de espaço em branco é convertido no byte " " e qualquer outro caráter no byte "x" (bytes.translate);
+o número de palavras é então o número de ocorrências de " x" (início de uma palavra), contado com bytes.count.
+Para uma coluna inteira os textos são juntos num único bloco de bytes e contados por intervalos, sem copiar cada texto.
+O resultado é sempre igual a len(text.split())."""
+
+from array import array
+from itertools import accumulate, repeat
+
+# Carateres ASCII que o str.split() considera espaço em branco
+_ESPACOS = " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+# Tabela de tradução: espaço em branco ==> " ", qualquer outro byte ==> "x"
+_TABELA = bytes(ord(" ") if chr(i) in _ESPACOS else ord("x") for i in range(256))
+
+
+def contar_palavras(texto):
+    """Conta as palavras de um texto (igual a len(texto.split()), mas sem criar a lista de palavras).
+    Args:
+        texto ==> O texto da review
+    Returns:
+        O número de palavras (0 se o texto não for uma string)."""
+    if not isinstance(texto, str):
+        return 0
+    if not texto.isascii():
+        # Fora do ASCII há outros espaços em branco (ex: espaço não separável), por isso usa o split()
+        return len(texto.split())
+    # O espaço inicial garante que a primeira palavra também é precedida de " "
+    return (" " + texto).encode("ascii").translate(_TABELA).count(b" x")
+
+
+def contar_palavras_coluna(textos):
+    """Conta as palavras de todos os textos de uma coluna de uma só vez.
+    Args:
+        textos ==> Lista de strings (ex: a coluna Text de uma ReviewTable)
+    Returns:
+        Um array de inteiros com o número de palavras de cada texto."""
+    # Junta os textos separados por um espaço; cada texto i ocupa o intervalo [limites[i], limites[i + 1]) do bloco,
+    # começando pelo espaço que o precede
+    bloco = (" " + " ".join(textos)).encode("ascii", "replace").translate(_TABELA)
+    limites = list(accumulate(map(len, textos), lambda fim, tamanho: fim + tamanho + 1, initial=0))
+    contagens = array("i", map(bloco.count, repeat(b" x"), limites, limites[1:]))
+
+    # No "replace" cada caráter não ASCII passa a "?" (não é espaço), por isso as posições continuam certas, mas os
+    # textos com espaços não ASCII têm de ser contados um a um
+    for i, texto in enumerate(textos):
+        if not texto.isascii():
+            contagens[i] = len(texto.split())
+    return contagens
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks"""
+
+"""Este ficheiro mede o desempenho do carregamento e de cada função de análise sobre ficheiros sintéticos
+(gerados por gerar_dados.py) de várias dimensões, sem precisar do Reviews.csv original.
+
+Para cada escala e cada operação é registado o tempo, o débito (reviews por segundo) e o pico de memória residente
+(RSS) do processo. Cada medição corre num processo novo, para que o pico de memória de uma operação não contamine
+as outras. Uma medição cujo processo termine sem resultado (ex: MemoryError) fica registada como falhada e as restantes
+continuam. Os registos das funções instrumentadas (ver instrumentation.py) são escritos em benchmark_log.txt, na pasta
+dos ficheiros sintéticos, e não no log do projeto.
+
+Utilização:
+    python benchmarks/benchmark.py                                  (escalas 10k e 100k)
+    python benchmarks/benchmark.py --escalas 10000 100000 1000000 10000000 --saida resultados.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAIZ, "amazon_reviews_package"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import review_analysis
+import temporal_analysis
+import user_analysis
+from aggregation_engine import agregar
+from data_loader import carregar_dados
+from gerar_dados import gerar_csv
+from instrumentation import configurar_log
+
+try:
+    import resource
+except ImportError:
+    # O módulo resource não existe no Windows: o pico de memória não é medido
+    resource = None
+
+ESCALAS_PADRAO = [10000, 100000]
+# Segundos entre verificações de que o processo de uma medição ainda está vivo
+_INTERVALO_ESPERA = 1.0
+
+
+def _carregar_completo(caminho):
+    """Carrega os dados da cache e lê já todas as colunas: as colunas da cache só são lidas do disco quando são usadas
+    (ver dataset_cache.carregar_cache), e essa leitura seria medida na primeira análise em vez do carregamento."""
+    dados = carregar_dados(caminho)
+    for nome in dados.nomes_colunas:
+        dados.coluna(nome)
+    return dados
+
+
+# Operações medidas: nome ==> função que recebe (caminho do CSV, dados carregados)
+OPERACOES = {
+    "carregar_dados (CSV, 1 processo)": lambda caminho, dados: carregar_dados(caminho, usar_cache=False, processos=1),
+    "carregar_dados (CSV, paralelo)": lambda caminho, dados: carregar_dados(caminho, usar_cache=False,
+                                                                             processos=os.cpu_count()),
+    "carregar_dados (cache)": lambda caminho, dados: _carregar_completo(caminho),
+    "agregar": lambda caminho, dados: agregar(dados),
+    "contar_distribuicao_scores": lambda caminho, dados: review_analysis.contar_distribuicao_scores(dados),
+    "media_scores_por_utilizador": lambda caminho, dados: review_analysis.media_scores_por_utilizador(dados),
+    "avaliacao_maxima": lambda caminho, dados: review_analysis.avaliacao_maxima(dados),
+    "media_scores_por_produto": lambda caminho, dados: review_analysis.media_scores_por_produto(dados),
+    "calculo_score_medio_ponderado": lambda caminho, dados: review_analysis.calculo_score_medio_ponderado(dados),
+    "count_reviews_by_year": lambda caminho, dados: temporal_analysis.count_reviews_by_year(dados),
+    "identify_busiest_period": lambda caminho, dados: temporal_analysis.identify_busiest_period(dados),
+    "calculate_average_score_over_time": lambda caminho, dados: temporal_analysis.calculate_average_score_over_time(dados),
+    "users_with_most_reviews": lambda caminho, dados: user_analysis.users_with_most_reviews(dados),
+    "most_helpful_users": lambda caminho, dados: user_analysis.most_helpful_users(dados),
+    "average_words_per_user": lambda caminho, dados: user_analysis.average_words_per_user(dados),
+}
+
+
+def _pico_rss_mb():
+    """Pico de memória residente do processo atual, em MB (None se não for possível medir)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # No Linux o valor vem em KB e no macOS em bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _medir(nome, caminho, n_linhas, fila, ficheiro_log):
+    """Executa uma operação num processo novo e envia o resultado da medição pela fila."""
+    configurar_log(ficheiro_log)
+    # As operações de carregamento medem a própria leitura; as outras partem dos dados já carregados (da cache)
+    dados = None if nome.startswith("carregar_dados") else _carregar_completo(caminho)
+    rss_antes = _pico_rss_mb()
+    inicio = time.perf_counter()
+    OPERACOES[nome](caminho, dados)
+    duracao = time.perf_counter() - inicio
+    fila.put({
+        "operacao": nome,
+        "linhas": n_linhas,
+        "segundos": duracao,
+        "reviews_por_segundo": n_linhas / duracao if duracao > 0 else None,
+        "pico_rss_mb": _pico_rss_mb(),
+        "rss_antes_mb": rss_antes,
+    })
+
+
+def _esperar_resultado(processo, fila):
+    """Espera pelo resultado enviado pelo processo de uma medição.
+    Returns:
+        O dicionário da medição, ou None se o processo terminar sem o enviar."""
+    while True:
+        try:
+            return fila.get(timeout=_INTERVALO_ESPERA)
+        except queue.Empty:
+            if not processo.is_alive():
+                # O resultado pode ter sido enviado mesmo antes de o processo terminar
+                try:
+                    return fila.get(timeout=_INTERVALO_ESPERA)
+                except queue.Empty:
+                    return None
+
+
+def executar(escalas, pasta, operacoes=None):
+    """Gera (ou reaproveita) um CSV sintético por escala e mede cada operação.
+    Args:
+        escalas ==> Lista com o número de reviews de cada ficheiro
+        pasta ==> Pasta onde os ficheiros sintéticos são guardados (e reaproveitados entre execuções)
+        operacoes ==> Nomes das operações a medir (por omissão todas as de OPERACOES)
+    Returns:
+        Lista de dicionários, um por medição (com "erro" em vez dos tempos se a medição falhar)."""
+    # As funções instrumentadas registam cada chamada: os registos dos benchmarks ficam fora do log do projeto
+    ficheiro_log = os.path.join(pasta, "benchmark_log.txt")
+    configurar_log(ficheiro_log)
+    contexto = multiprocessing.get_context("spawn")
+    resultados = []
+    for n_linhas in escalas:
+        caminho = os.path.join(pasta, f"reviews_{n_linhas}.csv")
+        if not os.path.exists(caminho):
+            print(f"A gerar {caminho} ...")
+            gerar_csv(n_linhas, caminho)
+        # Garante que a cache binária existe antes de medir "carregar_dados (cache)"
+        carregar_dados(caminho)
+
+        for nome in operacoes or OPERACOES:
+            fila = contexto.Queue()
+            processo = contexto.Process(target=_medir, args=(nome, caminho, n_linhas, fila, ficheiro_log))
+            processo.start()
+            resultado = _esperar_resultado(processo, fila)
+            processo.join()
+            if resultado is None:
+                # O processo terminou sem enviar o resultado (ex: MemoryError nas escalas maiores): passa à seguinte
+                resultados.append({"operacao": nome, "linhas": n_linhas,
+                                   "erro": f"o processo terminou com o código {processo.exitcode}"})
+                print(f"{n_linhas:>10} | {nome:<36} | FALHOU (código de saída {processo.exitcode})")
+                continue
+            resultados.append(resultado)
+            pico = resultado["pico_rss_mb"]
+            print(f"{n_linhas:>10} | {nome:<36} | {resultado['segundos']:>9.3f} s | "
+                  f"{resultado['reviews_por_segundo'] or 0:>12,.0f} reviews/s | "
+                  f"{'n/d' if pico is None else f'{pico:,.0f} MB':>10}")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o desempenho do carregamento e das análises.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=ESCALAS_PADRAO,
+                        help="número de reviews de cada ficheiro sintético (ex: 10000 100000 1000000 10000000)")
+    parser.add_argument("--pasta", default=os.path.join(tempfile.gettempdir(), "amazon_reviews_benchmark"),
+                        help="pasta onde guardar os ficheiros sintéticos")
+    parser.add_argument("--operacoes", nargs="+", choices=list(OPERACOES), help="operações a medir (todas por omissão)")
+    parser.add_argument("--saida", help="ficheiro JSON onde guardar os resultados")
+    args = parser.parse_args()
+
+    os.makedirs(args.pasta, exist_ok=True)
+    resultados = executar(args.escalas, args.pasta, args.operacoes)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as file:
+            json.dump(resultados, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
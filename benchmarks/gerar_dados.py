@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Gerador de Dados Sintéticos"""
+
+"""Este ficheiro gera ficheiros CSV com o mesmo formato do Reviews.csv (Amazon Fine Food Reviews), para que seja
+possível medir o desempenho do projeto sem o ficheiro original e em escalas diferentes.
+
+As distribuições tentam imitar as do conjunto de dados real:
+    - UserId e ProductId seguem uma distribuição de Zipf (poucos utilizadores/produtos com muitas reviews);
+    - o Score é enviesado para as 5 estrelas (histograma aproximado do conjunto real);
+    - o Time é um timestamp à meia-noite (UTC) entre 2000 e 2012, com mais reviews nos anos mais recentes;
+    - o Text tem um número de palavras variável (log-normal, ~80 palavras em média) e por vezes aspas, vírgulas e
+      quebras de linha, para exercitar o parser de CSV.
+
+Utilização:
+    python benchmarks/gerar_dados.py 100000 reviews_100k.csv
+"""
+
+import argparse
+import csv
+import datetime
+import random
+from itertools import accumulate
+
+COLUNAS = ["Id", "ProductId", "UserId", "ProfileName", "HelpfulnessNumerator", "HelpfulnessDenominator",
+           "Score", "Time", "Summary", "Text"]
+
+# Histograma aproximado dos scores no conjunto de dados real (1 a 5 estrelas)
+PESOS_SCORE = [9.2, 5.2, 7.5, 14.2, 63.9]
+# Número de reviews por ano cresce de forma aproximadamente exponencial
+ANOS = list(range(2000, 2013))
+PESOS_ANO = [1.45 ** i for i in range(len(ANOS))]
+
+PALAVRAS = ("good great taste flavor coffee tea dog food product love like price amazon buy best little "
+            "sweet chocolate order box bag really just would one also much well store better bought "
+            "delicious healthy snack organic free gluten sugar salt water cup mix treats cat favorite "
+            "recommend brand quality fresh package time make use try found eat hot strong").split()
+
+# Número de linhas geradas de cada vez (random.choices por lote é muito mais rápido do que linha a linha)
+_TAMANHO_LOTE = 10000
+
+
+def _pesos_zipf(n, expoente):
+    """Pesos acumulados de uma distribuição de Zipf com n elementos (o elemento k tem peso 1 / k^expoente)."""
+    return list(accumulate(1 / (k ** expoente) for k in range(1, n + 1)))
+
+
+def _texto(gerador):
+    """Gera o texto de uma review, com um número de palavras log-normal."""
+    n_palavras = max(1, int(gerador.lognormvariate(4.1, 0.7)))
+    palavras = gerador.choices(PALAVRAS, k=n_palavras)
+    if gerador.random() < 0.1:
+        palavras.insert(gerador.randrange(len(palavras)), '"really",')
+    if gerador.random() < 0.05:
+        palavras.insert(gerador.randrange(len(palavras)), "\n")
+    return " ".join(palavras)
+
+
+def gerar_csv(n_linhas, caminho, semente=0):
+    """Escreve um CSV sintético com n_linhas reviews.
+    Args:
+        n_linhas ==> Número de reviews a gerar
+        caminho ==> Caminho do ficheiro CSV a criar
+        semente ==> Semente do gerador aleatório (a mesma semente gera sempre o mesmo ficheiro)"""
+    gerador = random.Random(semente)
+    # Proporções de utilizadores e produtos distintos semelhantes às do conjunto real (~256k users, ~74k produtos
+    # para ~568k reviews)
+    n_utilizadores = max(1, n_linhas * 45 // 100)
+    n_produtos = max(1, n_linhas * 13 // 100)
+    utilizadores = range(n_utilizadores)
+    produtos = range(n_produtos)
+    pesos_utilizadores = _pesos_zipf(n_utilizadores, 1.1)
+    pesos_produtos = _pesos_zipf(n_produtos, 0.9)
+    inicio_ano = {ano: int(datetime.datetime(ano, 1, 1, tzinfo=datetime.timezone.utc).timestamp()) for ano in ANOS}
+
+    with open(caminho, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUNAS)
+        review_id = 0
+        while review_id < n_linhas:
+            lote = min(_TAMANHO_LOTE, n_linhas - review_id)
+            lote_utilizadores = gerador.choices(utilizadores, cum_weights=pesos_utilizadores, k=lote)
+            lote_produtos = gerador.choices(produtos, cum_weights=pesos_produtos, k=lote)
+            lote_scores = gerador.choices(range(1, 6), weights=PESOS_SCORE, k=lote)
+            lote_anos = gerador.choices(ANOS, weights=PESOS_ANO, k=lote)
+
+            for utilizador, produto, score, ano in zip(lote_utilizadores, lote_produtos, lote_scores, lote_anos):
+                review_id += 1
+                denominador = int(gerador.expovariate(0.5))
+                numerador = gerador.randint(0, denominador)
+                timestamp = inicio_ano[ano] + gerador.randrange(365) * 86400
+                writer.writerow([
+                    review_id,
+                    f"B{produto:09d}",
+                    f"A{utilizador:013d}",
+                    f"Utilizador {utilizador}",
+                    numerador,
+                    denominador,
+                    score,
+                    timestamp,
+                    " ".join(gerador.choices(PALAVRAS, k=gerador.randint(1, 6))),
+                    _texto(gerador),
+                ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um Reviews.csv sintético.")
+    parser.add_argument("linhas", type=int, help="número de reviews a gerar")
+    parser.add_argument("caminho", help="ficheiro CSV a criar")
+    parser.add_argument("--semente", type=int, default=0, help="semente do gerador aleatório")
+    args = parser.parse_args()
+    gerar_csv(args.linhas, args.caminho, args.semente)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,105 @@
 # -*- coding: utf-8 -*-
-from data_loader import carregar_dados
-from review_analysis import contar_distribuicao_scores, media_scores_por_utilizador, media_scores_por_produto, \
-    calculo_score_medio_ponderado, avaliacao_maxima
-from temporal_analysis import _convert_timestamp_to_date_string, convert_unix_timestamp_to_date_readable, \
-    count_reviews_by_year, identify_busiest_period, calculate_average_score_over_time
-from user_analysis import users_with_most_reviews, most_helpful_users, average_words_per_user
+import argparse
+
+from batch_report import ANALISES, FORMATOS, gerar_relatorio
+from data_loader import CAMINHO_PADRAO, carregar_dados
+from deduplication import carregar_sem_duplicados, linhas_sem_duplicados, posicoes_na_vista
+from aggregation_engine import COLUNAS_NECESSARIAS, agregar, agregar_paralelo
+from instrumentation import ativar_perfil, perfil
+from query_server import PORTA_PADRAO, executar_servidor
+from result_cache import PASTA_PADRAO, configurar_cache_resultados
+from review_analysis import contar_distribuicao_scores, media_scores_por_produto
+from temporal_analysis import ROLLING_WINDOWS, calculate_average_score_over_time, \
+    convert_unix_timestamp_to_date_readable
+from text_index import indice_texto
+
+
+def _limite_tempo(texto):
+    """Limite de --inicio/--fim: um timestamp Unix (só dígitos) ou uma data 'YYYY', 'YYYY-MM' ou 'YYYY-MM-DD'."""
+    return int(texto) if texto.isdigit() and len(texto) > 4 else texto
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Análise das reviews de produtos alimentares da Amazon.")
+    parser.add_argument("--csv", default=CAMINHO_PADRAO,
+                        help="caminho do ficheiro Reviews.csv (pode estar comprimido em gzip, bz2, xz ou zstd)")
+    parser.add_argument("--perfil", action="store_true",
+                        help="guarda relatórios do cProfile e do tracemalloc de cada ação em logs/perfis")
+    parser.add_argument("--processos", type=int, default=1,
+                        help="número de processos da agregação inicial (map-reduce sobre partições das reviews)")
+    parser.add_argument("--cache-disco", nargs="?", const=PASTA_PADRAO, metavar="PASTA",
+                        help="guarda os resultados das análises em disco, para as sessões seguintes "
+                             "(por omissão na pasta cache_resultados)")
+    parser.add_argument("--sem-duplicados", action="store_true",
+                        help="ignora as reviews duplicadas (exatas e quase iguais do mesmo utilizador)")
+    relatorio = parser.add_argument_group("modo relatório (sem menu, ex: para o cron)")
+    relatorio.add_argument("--relatorio", metavar="PASTA",
+                           help="executa as análises sem menu e escreve os resultados nesta pasta")
+    relatorio.add_argument("--analises", nargs="+", choices=list(ANALISES), help="análises a executar (todas por omissão)")
+    relatorio.add_argument("--formatos", nargs="+", choices=FORMATOS, default=list(FORMATOS),
+                           help="formatos dos ficheiros de resultados")
+    relatorio.add_argument("--top-n", type=int, help="limita os rankings aos N melhores")
+    relatorio.add_argument("--inicio", type=_limite_tempo, help="início (inclusive) das análises temporais")
+    relatorio.add_argument("--fim", type=_limite_tempo, help="fim (inclusive) das análises temporais")
+    relatorio.add_argument("--trabalhadores", type=int, default=1,
+                           help="número de processos que agregam os dados em paralelo")
+    servidor = parser.add_argument_group("modo servidor (dados residentes, consultas por HTTP/JSON em localhost)")
+    servidor.add_argument("--servidor", nargs="?", type=int, const=PORTA_PADRAO, metavar="PORTA",
+                          help=f"mantém os dados carregados e responde às análises em http://127.0.0.1:PORTA "
+                               f"(por omissão {PORTA_PADRAO})")
+    args = parser.parse_args()
+    if args.perfil:
+        ativar_perfil()
+    if args.cache_disco:
+        configurar_cache_resultados(pasta=args.cache_disco)
+
+    if args.servidor is not None:
+        try:
+            executar_servidor(args.csv, porta=args.servidor, sem_duplicados=args.sem_duplicados)
+        except Exception as e:
+            print(f"ERRO CRÍTICO: Falha ao iniciar o servidor. {e}")
+            return 1
+        return 0
+
+    if args.relatorio:
+        try:
+            with perfil("relatorio"):
+                escritos = gerar_relatorio(args.csv, args.relatorio, args.analises,
+                                           {"top_n": args.top_n, "start": args.inicio, "end": args.fim},
+                                           args.formatos, args.trabalhadores, args.sem_duplicados)
+        except Exception as e:
+            print(f"ERRO CRÍTICO: Falha ao gerar o relatório. {e}")
+            # Código de saída diferente de zero, para que o cron/pipeline detete a falha
+            return 1
+        print(f"Relatório escrito em {len(escritos)} ficheiro(s) na pasta {args.relatorio}")
+        return 0
+
     try:
-        dados = carregar_dados()
+        with perfil("carregar e agregar dados"):
+            # Só as colunas usadas pelas análises: os textos das reviews nunca são lidos
+            if args.sem_duplicados:
+                dados = carregar_sem_duplicados(args.csv, colunas=COLUNAS_NECESSARIAS)
+            else:
+                dados = carregar_dados(args.csv, colunas=COLUNAS_NECESSARIAS)
+            # Calcula numa única passagem os acumuladores de todas as opções do menu. A agregação paralela lê as
+            # partições diretamente da cache binária, por isso não se aplica à vista sem duplicados
+            if args.processos > 1 and not args.sem_duplicados:
+                agregados = agregar_paralelo(args.csv, args.processos)
+            else:
+                agregados = agregar(dados)
         print("Dados carregados com sucesso.")
     except Exception as e:
         print(f"ERRO CRÍTICO: Falha ao carregar dados. O programa será encerrado. {e}")
-        return
+        return 1
+    # Índice de texto da opção 4 (pesquisa)
+    indice = None
 
     while True:
         print("\n--- MENU ---")
         print("1 - Análise de Avaliações  ")
         print("2 - Processamento Temporal ")
         print("3 - Análise de Utilizadores ")
+        print("4 - Pesquisa nas Reviews ")
         print("0 - Sair")
 
         option_principal = input("Escolha uma opção: ")
@@ -32,39 +112,44 @@ def main():
                 print("3 - Produtos com maior número de avaliações com score 5 (Top 10)")
                 print("4 - Score médio por produto (Top 10)")
                 print("5 - Score médio ponderado por utilidade de avaliação (Top 10)")
+                print("6 - Score médio ponderado por utilidade de avaliação, com suavização bayesiana (Top 10)")
                 print("0 - Voltar ao Menu Principal")
 
                 option_sub = input("Escolha uma opção do sub-menu: ")
 
-                if option_sub == "1":
-                    result = contar_distribuicao_scores(dados)
-                    print("\nContagem do número por score (1 a 5 estrelas):", result)
+                # Mede a ação escolhida (e guarda o perfil, com --perfil) no log do projeto
+                with perfil(f"menu {option_principal}.{option_sub}"):
+                    if option_sub == "1":
+                        result = agregados.contar_distribuicao_scores()
+                        print("\nContagem do número por score (1 a 5 estrelas):", result)
 
-                elif option_sub == "2":
-                    result = media_scores_por_utilizador(dados)
-                    top_10 = dict(sorted(result.items(), key=lambda x: x[1], reverse=True)[:10])
-                    print("\nMédia de avaliações por utilizador (Top 10):", top_10)
+                    elif option_sub == "2":
+                        top_10 = agregados.media_scores_por_utilizador(top_n=10)
+                        print("\nMédia de avaliações por utilizador (Top 10):", top_10)
 
-                elif option_sub == "3":
-                    result = avaliacao_maxima(dados)
-                    top_10 = dict(sorted(result.items(), key=lambda x: x[1], reverse=True)[:10])
-                    print("\nProdutos com maior número de avaliações com score 5 (Top 10):", top_10)
+                    elif option_sub == "3":
+                        top_10 = agregados.avaliacao_maxima(top_n=10)
+                        print("\nProdutos com maior número de avaliações com score 5 (Top 10):", top_10)
 
-                elif option_sub == "4":
-                    result = media_scores_por_produto(dados)
-                    top_10 = dict(sorted(result.items(), key=lambda x: x[1], reverse=True)[:10])
-                    print("\nScore médio por produto (Top 10):", top_10)
+                    elif option_sub == "4":
+                        top_10 = agregados.media_scores_por_produto(top_n=10)
+                        print("\nScore médio por produto (Top 10):", top_10)
 
-                elif option_sub == "5":
-                    result = calculo_score_medio_ponderado(dados)
-                    top_10 = dict(sorted(result.items(), key=lambda x: x[1], reverse=True)[:10])
-                    print("\nScore médio ponderado por utilidade de avaliação (Top 10):", top_10)
+                    elif option_sub == "5":
+                        top_10 = agregados.calculo_score_medio_ponderado(top_n=10)
+                        print("\nScore médio ponderado por utilidade de avaliação (Top 10):", top_10)
 
-                elif option_sub == "0":
-                    break
+                    elif option_sub == "6":
+                        # Os produtos com poucos votos úteis ficam perto da média global (ver weighted_scoring.py)
+                        top_10 = agregados.calculo_score_medio_ponderado(top_n=10, suavizacao="bayes")
+                        print("\nScore médio ponderado por utilidade de avaliação, com suavização bayesiana (Top 10):",
+                              top_10)
 
-                else:
-                    print("Opção inválida no sub-menu. Tente novamente.")
+                    elif option_sub == "0":
+                        break
+
+                    else:
+                        print("Opção inválida no sub-menu. Tente novamente.")
 
         elif option_principal == "2":
             while True:
@@ -73,32 +158,47 @@ def main():
                 print("2 - Mês e o ano com maior número de avaliações")
                 print("3 - Número de avaliações feitas por ano (Completo)")
                 print("4 - Variação do score médio ao longo do tempo (Amostra)")
+                print("5 - Número de avaliações por semana (Amostra)")
+                print("6 - Médias móveis do score a 7, 30 e 90 dias (últimos 5 dias)")
                 print("0 - Voltar ao Menu Principal")
 
                 option_sub = input("Escolha uma opção do sub-menu: ")
 
-                if option_sub == "1":
-                    timestamp_to_convert = dados[0].get('Time') if dados and dados[0].get('Time') else ""
-                    result = convert_unix_timestamp_to_date_readable(timestamp_to_convert)
-                    print("\nConversão do primeiro registro para data legível:", result)
+                # Mede a ação escolhida (e guarda o perfil, com --perfil) no log do projeto
+                with perfil(f"menu {option_principal}.{option_sub}"):
+                    if option_sub == "1":
+                        timestamp_to_convert = dados[0].get('Time') if dados and dados[0].get('Time') else ""
+                        result = convert_unix_timestamp_to_date_readable(timestamp_to_convert)
+                        print("\nConversão do primeiro registro para data legível:", result)
+
+                    elif option_sub == "2":
+                        result = agregados.identify_busiest_period()
+                        print("\nMês e o ano com maior número de avaliações:", result)
+
+                    elif option_sub == "3":
+                        result = agregados.count_reviews_by_year()
+                        print("\nNúmero de avaliações feitas por ano:", result)
 
-                elif option_sub == "2":
-                    result = identify_busiest_period(dados)
-                    print("\nMês e o ano com maior número de avaliações:", result)
+                    elif option_sub == "4":
+                        result = agregados.calculate_average_score_over_time()
+                        sample_5 = dict(list(result.items())[:5])
+                        print("\nVariação do score médio ao longo do tempo (Amostra de 5 períodos):", sample_5)
 
-                elif option_sub == "3":
-                    result = count_reviews_by_year(dados)
-                    print("\nNúmero de avaliações feitas por ano:", result)
+                    elif option_sub == "5":
+                        result = agregados.count_reviews_over_time(period="week")
+                        sample_5 = dict(list(result.items())[-5:])
+                        print("\nNúmero de avaliações por semana (últimas 5 semanas):", sample_5)
 
-                elif option_sub == "4":
-                    result = calculate_average_score_over_time(dados)
-                    sample_5 = dict(list(result.items())[:5])
-                    print("\nVariação do score médio ao longo do tempo (Amostra de 5 períodos):", sample_5)
+                    elif option_sub == "6":
+                        for window in ROLLING_WINDOWS:
+                            result = agregados.rolling_average_score(window=window)
+                            sample_5 = dict(list(result.items())[-5:])
+                            print(f"\nMédia móvel do score a {window} dias (últimos 5 dias):", sample_5)
 
-                elif option_sub == "0":
-                    break
-                else:
-                    print("Opção inválida no sub-menu. Tente novamente.")
+                    elif option_sub == "0":
+                        break
+                    else:
+                        print("Opção inválida no sub-menu. Tente novamente.")
 
         elif option_principal == "3":
             while True:
@@ -110,21 +210,49 @@ def main():
 
                 option_sub = input("Escolha uma opção do sub-menu: ")
 
-                if option_sub == "1":
-                    result = users_with_most_reviews(dados)
-                    print("\nOs utilizadores com maior número de avaliações:", result)
-                elif option_sub == "2":
-                    result = most_helpful_users(dados)
-                    print("\nOs utilizadores mais úteis são:", result)
-                elif option_sub == "3":
-                    result = average_words_per_user(dados)
-                    top_10 = dict(sorted(result.items(), key=lambda x: x[1], reverse=True)[:10])
-                    print("\nA Média de palavras por avaliação de cada utilizador (Top 10):", top_10)
-
-                elif option_sub == "0":
-                    break
-                else:
-                    print("Opção inválida no sub-menu. Tente novamente.")
+                # Mede a ação escolhida (e guarda o perfil, com --perfil) no log do projeto
+                with perfil(f"menu {option_principal}.{option_sub}"):
+                    if option_sub == "1":
+                        result = agregados.users_with_most_reviews()
+                        print("\nOs utilizadores com maior número de avaliações:", result)
+                    elif option_sub == "2":
+                        result = agregados.most_helpful_users()
+                        print("\nOs utilizadores mais úteis são:", result)
+                    elif option_sub == "3":
+                        top_10 = agregados.average_words_per_user(top_n=10)
+                        print("\nA Média de palavras por avaliação de cada utilizador (Top 10):", top_10)
+
+                    elif option_sub == "0":
+                        break
+                    else:
+                        print("Opção inválida no sub-menu. Tente novamente.")
+
+        elif option_principal == "4":
+            print("\nPesquisa no Summary e no Text (ex: gluten, (coffee OR tea) AND NOT decaf)")
+            consulta = input("Consulta (vazia para voltar): ").strip()
+            if not consulta:
+                continue
+            with perfil(f"menu {option_principal}"):
+                try:
+                    if indice is None:
+                        # Construído (ou lido da cache) só na primeira pesquisa
+                        indice = indice_texto(args.csv)
+                    linhas = indice.procurar(consulta)
+                    if args.sem_duplicados:
+                        # As posições do índice são as do CSV: passam a ser as da vista sem duplicados
+                        linhas = posicoes_na_vista(linhas_sem_duplicados(args.csv), linhas)
+                except ValueError as e:
+                    print(f"Consulta inválida: {e}")
+                    continue
+                except FileNotFoundError as e:
+                    # O CSV deixou de existir depois de carregado: não é possível construir o índice
+                    print(f"ERRO: {e}")
+                    continue
+                print(f"\nReviews encontradas: {len(linhas)}")
+                if linhas:
+                    print("Contagem do número por score:", contar_distribuicao_scores(dados, linhas=linhas))
+                    print("Score médio por produto (Top 10):", media_scores_por_produto(dados, top_n=10, linhas=linhas))
+                    print("Score médio por ano:", calculate_average_score_over_time(dados, period="year", linhas=linhas))
 
         elif option_principal == "0":
             print("\nEncerrando o programa.")
@@ -134,4 +262,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
\ No newline at end of file